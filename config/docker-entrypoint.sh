@@ -10,7 +10,12 @@ case "$1" in
     web)
         echo starting server...
         alembic upgrade head
-        exec uvicorn main:app --host 0.0.0.0 --port 8000 --loop=asyncio --workers=1
+        if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+            # файлы метрик прошлого запуска: pid'ы новых воркеров могут совпасть со старыми
+            mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+            rm -rf "${PROMETHEUS_MULTIPROC_DIR:?}"/*
+        fi
+        exec uvicorn main:app --host 0.0.0.0 --port 8000 --loop=asyncio --workers=${WEB_CONCURRENCY:-1}
     ;;
     web_dev)
         echo starting server...
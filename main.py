@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import click
@@ -30,7 +31,114 @@ def live_reload(port=None):
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
 
 
+@click.command()
+@click.option("--chat-id", type=int, default=None)
+def prewarm(chat_id=None):
+    """Upload every pack without document id once and save its file id"""
+    from src.context import app_context
+    from src.bot.catalog import catalog_watcher
+    from src.bot.documents import prewarmer
+
+    async def run():
+        try:
+            await catalog_watcher.reload()
+            uploaded = await prewarmer.run(app_context.bot, chat_id)
+            if uploaded is None:
+                click.echo("Prewarm is already running")
+            else:
+                click.echo(f"Uploaded packs: {', '.join(uploaded) or '-'}")
+        finally:
+            await app_context.close()
+
+    asyncio.run(run())
+
+
+@click.command()
+@click.option("--port", default=4318)
+def trace_collector(port=None):
+    """Local stand-in for an OTLP/HTTP collector: print received spans as trees"""
+    from aiohttp import web
+
+    async def traces(request: web.Request) -> web.Response:
+        payload = await request.json()
+        spans = [
+            span
+            for resource in payload.get("resourceSpans", [])
+            for scope in resource.get("scopeSpans", [])
+            for span in scope.get("spans", [])
+        ]
+        children: dict[str | None, list[dict]] = {}
+        ids = {span["spanId"] for span in spans}
+        for span in sorted(spans, key=lambda s: int(s["startTimeUnixNano"])):
+            parent = span.get("parentSpanId")
+            children.setdefault(parent if parent in ids else None, []).append(span)
+
+        def show(span: dict, depth: int):
+            duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+            error = " ERROR " + span["status"].get("message", "") if span["status"].get("code") == 2 else ""
+            click.echo(f"{'  ' * depth}{span['name']} {duration:.1f}ms{error}")
+            for child in children.get(span["spanId"], []):
+                show(child, depth + 1)
+
+        for root in children.get(None, []):
+            click.echo(f"trace {root['traceId']}")
+            show(root, 1)
+        return web.json_response({})
+
+    web_app = web.Application()
+    web_app.router.add_post("/v1/traces", traces)
+    web.run_app(web_app, port=port)
+
+
+@click.command()
+@click.option("--users", default=100, help="Number of synthetic users, each runs the full purchase funnel")
+@click.option("--concurrency", default=20, help="Users (or recorded updates) processed at the same time")
+@click.option("--bot-api-latency", default=0.0, help="Seconds the stub Bot API waits before each answer")
+@click.option("--updates-file", type=click.Path(exists=True), default=None,
+              help="JSON lines file with recorded updates to replay instead of the synthetic funnel")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON")
+def loadtest(users, concurrency, bot_api_latency, updates_file, as_json):
+    """Replay updates against the app in-process with a stubbed Bot API and print throughput and latencies"""
+    import json
+
+    from src.utils.loadtest import LoadTest, LoadTestIsolationError, format_report
+
+    recorded = None
+    if updates_file:
+        with open(updates_file) as f:
+            recorded = [json.loads(line) for line in f if line.strip()]
+
+    try:
+        report = asyncio.run(LoadTest(users, concurrency, bot_api_latency).run(recorded))
+    except LoadTestIsolationError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(report, indent=2) if as_json else format_report(report))
+
+
+@click.command()
+@click.option("--batch", default=500)
+def fsm_migrate(batch):
+    """Move FSM keys of the old RedisStorage layout (fsm:*:state / fsm:*:data, no TTL) into the compact hashes"""
+    from src.bot.utils.storage import CompactRedisStorage
+    from src.context import app_context
+    from src.settings import settings
+
+    async def run():
+        try:
+            storage = CompactRedisStorage(app_context.redis, ttl=settings.fsm_ttl)
+            migrated = await storage.migrate_legacy(batch)
+        finally:
+            await app_context.close()
+        click.echo(f"Migrated FSM keys: {migrated}")
+
+    asyncio.run(run())
+
+
 cli.add_command(live_reload, name="livereload")
+cli.add_command(prewarm, name="prewarm")
+cli.add_command(trace_collector, name="trace-collector")
+cli.add_command(loadtest, name="loadtest")
+cli.add_command(fsm_migrate, name="fsm-migrate")
 
 
 if __name__ == "__main__":
@@ -8,8 +8,10 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 
 from alembic import context
 from src.settings import settings
-from src.models.payments import PaymentsModel
+from src.models.payments import PaymentsModel, PaymentEventsModel
 from src.models.users import Users
+from src.models.catalog import CategoryModel, MusicPackModel
+from src.models.sales_stats import SalesDailyModel, SalesByPackModel
 from src.database import Base
 
 # this is the Alembic Config object, which provides
@@ -33,6 +35,12 @@ target_metadata = Base.metadata
 # ... etc.
 config.set_main_option("sqlalchemy.url", settings.db_url)
 
+
+def include_object(object_, name, type_, reflected, compare_to):
+    # материализованные представления описаны моделями только для запросов, создаются вручную в миграциях
+    return not (type_ == "table" and object_.info.get("is_view"))
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -49,6 +57,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -60,6 +69,7 @@ def do_run_migrations(connection: Connection) -> None:
     context.configure(
         connection=connection,
         target_metadata=target_metadata,
+        include_object=include_object,
         compare_type=True,
         compare_server_default=True,
     )
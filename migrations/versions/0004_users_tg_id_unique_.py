@@ -0,0 +1,33 @@
+"""empty message
+
+Revision ID: 0004_users_tg_id_unique
+Revises: 0003_remove_constr
+Create Date: 2026-10-17 12:10:41.512307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_users_tg_id_unique'
+down_revision: Union[str, None] = '0003_remove_constr'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # дубликаты могли появиться из-за гонки в check_and_create, оставляем самую раннюю запись
+    op.execute(
+        sa.text(
+            "DELETE FROM users u USING users d "
+            "WHERE u.tg_id = d.tg_id AND u.id > d.id"
+        )
+    )
+    op.create_index(op.f('ix_users_tg_id'), 'users', ['tg_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_tg_id'), table_name='users')
@@ -0,0 +1,30 @@
+"""empty message
+
+Revision ID: 0005_payments_latest_index
+Revises: 0004_users_tg_id_unique
+Create Date: 2026-10-17 12:48:03.904116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_payments_latest_index'
+down_revision: Union[str, None] = '0004_users_tg_id_unique'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_payments_user_id_status_created_at', 'payments',
+                    ['user_id', 'status', sa.text('created_at DESC')], unique=False)
+    # user_id - префикс нового индекса, отдельный индекс больше не нужен
+    op.drop_index('ix_payments_user_id', table_name='payments')
+
+
+def downgrade() -> None:
+    op.create_index('ix_payments_user_id', 'payments', ['user_id'], unique=False)
+    op.drop_index('ix_payments_user_id_status_created_at', table_name='payments')
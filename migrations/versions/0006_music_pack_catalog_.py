@@ -0,0 +1,79 @@
+"""empty message
+
+Revision ID: 0006_music_pack_catalog
+Revises: 0005_payments_latest_index
+Create Date: 2026-10-17 13:21:37.640281
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_music_pack_catalog'
+down_revision: Union[str, None] = '0005_payments_latest_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    categories = op.create_table('categories',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('position', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    music_packs = op.create_table('music_packs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('human_name', sa.String(length=100), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('cost', sa.Integer(), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), server_default='', nullable=False),
+    sa.Column('track_count', sa.Integer(), nullable=False),
+    sa.Column('document_id', sa.String(length=255), nullable=True),
+    sa.Column('is_active', sa.Boolean(), server_default='true', nullable=False),
+    sa.Column('position', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_music_packs_category_id'), 'music_packs', ['category_id'], unique=False)
+
+    # паки, которые до этого были зашиты в src/models/music_pack.py
+    op.bulk_insert(categories, [
+        {'id': 1, 'name': 'Drum&Base', 'position': 0},
+        {'id': 2, 'name': 'House', 'position': 1},
+    ])
+    op.bulk_insert(music_packs, [
+        {'id': 1, 'category_id': 1, 'human_name': 'Drum&Base 50', 'name': 'drum&base_50', 'cost': 500000,
+         'file_name': 'ДНБ 50.zip', 'description': 'Drum&base pack, в котором собраны треки из всех поджанров',
+         'track_count': 50, 'position': 0,
+         'document_id': 'BQACAgIAAxkBAAIBFWkoSbh0orWOnZSRB2bqloIvlfeJAAI8iwACY5YgSSFK68Bp8AcrNgQ'},
+        {'id': 2, 'category_id': 1, 'human_name': 'Drum&Base 30', 'name': 'drum&base_30', 'cost': 300000,
+         'file_name': 'ДНБ 30.zip', 'description': 'Drum&base pack, в котором собраны треки из всех поджанров',
+         'track_count': 30, 'position': 1,
+         'document_id': 'BQACAgIAAxkBAAIBFGkoSbiCpkMJe30v7VJSxnXuHD9RAAI7iwACY5YgSRlv3OjWodhLNgQ'},
+        {'id': 3, 'category_id': 2, 'human_name': 'House 30', 'name': 'house_30', 'cost': 300000,
+         'file_name': 'Хаус 30.zip', 'description': '', 'track_count': 30, 'position': 0,
+         'document_id': 'BQACAgIAAxkBAAIBGmkoa4p5_MhvGRuAye9O9lqIePBRAAI_iwACY5YgSfyRoVFkKcDdNgQ'},
+        {'id': 4, 'category_id': 2, 'human_name': 'House 50', 'name': 'house_50', 'cost': 500000,
+         'file_name': 'Хаус 50.zip', 'description': '', 'track_count': 50, 'position': 1,
+         'document_id': 'BQACAgIAAxkBAAIBG2koa4rtjLqKd8cZ0Mksmehe-sCTAAJCiwACY5YgSfOIsUsXyYEvNgQ'},
+    ])
+    op.execute("SELECT setval('categories_id_seq', (SELECT max(id) FROM categories))")
+    op.execute("SELECT setval('music_packs_id_seq', (SELECT max(id) FROM music_packs))")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_music_packs_category_id'), table_name='music_packs')
+    op.drop_table('music_packs')
+    op.drop_table('categories')
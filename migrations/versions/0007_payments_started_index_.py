@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: 0007_payments_started_index
+Revises: 0006_music_pack_catalog
+Create Date: 2026-10-17 16:20:41.518337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_payments_started_index'
+down_revision: Union[str, None] = '0006_music_pack_catalog'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # частичный индекс для чистки неоплаченных счетов, в нём только строки со статусом started
+    op.create_index('ix_payments_started_created_at', 'payments', ['created_at'], unique=False,
+                    postgresql_where=sa.text("status = 'started'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payments_started_created_at', table_name='payments')
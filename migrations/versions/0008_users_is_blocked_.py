@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: 0008_users_is_blocked
+Revises: 0007_payments_started_index
+Create Date: 2026-10-17 17:05:12.774920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_users_is_blocked'
+down_revision: Union[str, None] = '0007_payments_started_index'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('is_blocked', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'is_blocked')
@@ -0,0 +1,44 @@
+"""empty message
+
+Revision ID: 0009_payment_events
+Revises: 0008_users_is_blocked
+Create Date: 2026-10-17 18:02:37.301154
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_payment_events'
+down_revision: Union[str, None] = '0008_users_is_blocked'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('payments', sa.Column('telegram_payment_charge_id', sa.String(length=128), nullable=True))
+    op.create_index(op.f('ix_payments_telegram_payment_charge_id'), 'payments', ['telegram_payment_charge_id'],
+                    unique=True)
+    op.create_table(
+        'payment_events',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('payment_id', sa.Integer(), nullable=False),
+        sa.Column('event', sa.String(length=20), nullable=False),
+        sa.Column('from_status', sa.String(length=10), nullable=True),
+        sa.Column('to_status', sa.String(length=10), nullable=False),
+        sa.Column('external_id', sa.String(length=128), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=False), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_payment_events_payment_id'), 'payment_events', ['payment_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_payment_events_payment_id'), table_name='payment_events')
+    op.drop_table('payment_events')
+    op.drop_index(op.f('ix_payments_telegram_payment_charge_id'), table_name='payments')
+    op.drop_column('payments', 'telegram_payment_charge_id')
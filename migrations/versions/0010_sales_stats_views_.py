@@ -0,0 +1,50 @@
+"""empty message
+
+Revision ID: 0010_sales_stats_views
+Revises: 0009_payment_events
+Create Date: 2026-10-17 18:41:09.106532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010_sales_stats_views'
+down_revision: Union[str, None] = '0009_payment_events'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# выручка считается по текущей цене пака (music_packs.cost)
+FUNNEL_COLUMNS = """
+    count(*) AS started,
+    count(*) FILTER (WHERE p.status IN ('tr_created', 'paid', 'tr_complet')) AS checkout,
+    count(*) FILTER (WHERE p.status IN ('paid', 'tr_complet')) AS paid,
+    count(*) FILTER (WHERE p.status = 'tr_complet') AS delivered,
+    count(*) FILTER (WHERE p.status = 'expired') AS expired,
+    coalesce(sum(mp.cost) FILTER (WHERE p.status IN ('paid', 'tr_complet')), 0) AS revenue
+"""
+
+
+def upgrade() -> None:
+    op.execute(f"""
+        CREATE MATERIALIZED VIEW sales_daily AS
+        SELECT p.created_at::date AS day, {FUNNEL_COLUMNS}
+        FROM payments p LEFT JOIN music_packs mp ON mp.name = p.pack_name
+        GROUP BY p.created_at::date
+    """)
+    op.execute(f"""
+        CREATE MATERIALIZED VIEW sales_by_pack AS
+        SELECT p.pack_name, {FUNNEL_COLUMNS}
+        FROM payments p LEFT JOIN music_packs mp ON mp.name = p.pack_name
+        GROUP BY p.pack_name
+    """)
+    # уникальные индексы нужны для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ix_sales_daily_day', 'sales_daily', ['day'], unique=True)
+    op.create_index('ix_sales_by_pack_pack_name', 'sales_by_pack', ['pack_name'], unique=True)
+
+
+def downgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW sales_by_pack")
+    op.execute("DROP MATERIALIZED VIEW sales_daily")
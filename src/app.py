@@ -1,7 +1,9 @@
 import logging
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from typing import Annotated
+
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.openapi.docs import (
@@ -10,11 +12,11 @@ from fastapi.openapi.docs import (
     get_swagger_ui_oauth2_redirect_html,
 )
 
-from src.bot_main import bot_startup, bot_shutdown, webhook_router, dp as bot_dp
-from src.bot.payment_result import payment_result_router
-from src.bot.purchase_pack import purchase_router
-from src.bot.admin_states import admin_router
+from src.bot_main import bot_startup, bot_shutdown, webhook_router
+from src.schemas.sales_stats import SalesReportSchema
+from src.services.sales_stats import SalesStatsService
 from src.settings import settings
+from src.utils.metrics import mark_worker_dead, render_metrics
 
 
 VERSION = "0.1"
@@ -28,6 +30,7 @@ async def lifespan(app: FastAPI):
     await bot_startup()
     yield
     await bot_shutdown()
+    mark_worker_dead()
 
 
 app_cfg = {}
@@ -35,11 +38,6 @@ if not settings.debug:
     app_cfg["openapi_url"] = None
 app = FastAPI(title="Telegram bot service", version=VERSION, lifespan=lifespan, **app_cfg)
 
-bot_dp.include_router(payment_result_router)
-bot_dp.include_router(purchase_router)
-bot_dp.include_router(admin_router)
-
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -106,3 +104,18 @@ app.include_router(webhook_router)
 @app.get("/liveness", include_in_schema=False)
 async def liveness() -> str:
     return "OK"
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/stats/sales", include_in_schema=False)
+async def sales_stats(
+    days: Annotated[int, Query(ge=1, le=366)] = 7, authorization: Annotated[str | None, Header()] = None
+) -> SalesReportSchema:
+    if not settings.sales_stats_token or authorization != f"Bearer {settings.sales_stats_token}":
+        raise HTTPException(status_code=404)
+    return await SalesStatsService().report(days)
@@ -1,9 +1,15 @@
 
-from aiogram import F, types, Router
+from aiogram import Bot, F, types, Router
+from aiogram.filters import Command, CommandObject
+from src.bot.broadcast import BroadcastError, broadcaster
+from src.bot.documents import prewarmer
+from src.bot.sales_stats import format_report
+from src.services.exceptions import SqlError
+from src.services.sales_stats import SalesStatsService
 from src.settings import settings
-from logging import Logger
+import logging
 
-logger = Logger(__name__)
+logger = logging.getLogger(__name__)
 
 admin_router = Router(name="admin")
 
@@ -14,3 +20,61 @@ async def only_forwarded_message_handler(message: types.Message):
         await message.answer("Here is document id:")
         mes = f"{message.document.file_name} - {message.document.file_id}"
         await message.answer(mes)
+
+
+@admin_router.message(Command("prewarm"), F.from_user.id.in_(settings.admins_ids))
+async def prewarm_handler(message: types.Message, bot: Bot):
+    if await prewarmer.start(bot, message.chat.id):
+        await message.answer("Загружаю архивы паков без document id, напишу, когда закончу")
+    else:
+        await message.answer("Архивы уже загружаются")
+
+
+@admin_router.message(Command("broadcast"), F.from_user.id.in_(settings.admins_ids))
+async def broadcast_handler(message: types.Message, command: CommandObject, bot: Bot):
+    # текст - всё после команды (с разметкой) или сообщение, на которое ответили командой
+    if command.args:
+        text = message.html_text.split(maxsplit=1)[1]
+    elif message.reply_to_message and message.reply_to_message.text:
+        text = message.reply_to_message.html_text
+    else:
+        await message.answer("Напиши текст после /broadcast или ответь командой на сообщение с текстом")
+        return
+    try:
+        broadcast_id = await broadcaster.start(bot, text, message.chat.id)
+    except BroadcastError as e:
+        await message.answer(str(e))
+        return
+    logger.info(f"Broadcast {broadcast_id} started by {message.from_user.id}")
+
+
+@admin_router.message(Command("broadcast_stop"), F.from_user.id.in_(settings.admins_ids))
+async def broadcast_stop_handler(message: types.Message):
+    broadcast_id = await broadcaster.cancel()
+    if broadcast_id is None:
+        await message.answer("Активной рассылки нет")
+    else:
+        await message.answer(f"Рассылка {broadcast_id} остановится после текущей пачки")
+
+
+@admin_router.message(Command("broadcast_status"), F.from_user.id.in_(settings.admins_ids))
+async def broadcast_status_handler(message: types.Message):
+    state = await broadcaster.status()
+    if not state:
+        await message.answer("Рассылок ещё не было")
+        return
+    await message.answer(f"Рассылка {state['id']}: {state.get('status')}, "
+                         f"доставлено {state.get('sent')}, заблокировали бота {state.get('blocked')}, "
+                         f"ошибок {state.get('failed')}, всего {state.get('total')}")
+
+
+@admin_router.message(Command("report"), F.from_user.id.in_(settings.admins_ids))
+async def report_handler(message: types.Message, command: CommandObject):
+    days = int(command.args) if command.args and command.args.isdigit() and int(command.args) > 0 else 7
+    try:
+        report = await SalesStatsService().report(days)
+    except SqlError as e:
+        logger.error(f"Can not build sales report: {e}")
+        await message.answer("Не получилось собрать отчёт")
+        return
+    await message.answer(format_report(report, days))
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from redis.exceptions import LockError, RedisError
+
+from src.models.users import Users
+from src.redis_client import get_redis
+from src.services.base import CountMode
+from src.services.users import UsersService
+from src.settings import settings
+from src.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_SEQ_KEY = "broadcast:seq"
+BROADCAST_ACTIVE_KEY = "broadcast:active"
+BROADCAST_LOCK_KEY = "broadcast:lock"
+BROADCAST_LOCK_TTL = 60
+MAX_SEND_ATTEMPTS = 3
+
+# удаляет ключ, только если в нём всё ещё значение этой рассылки
+DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class BroadcastError(Exception):
+    pass
+
+
+def _state_key(broadcast_id: int) -> str:
+    return f"broadcast:{broadcast_id}"
+
+
+class Broadcaster:
+    """
+    Рассылка сообщения всем незаблокированным пользователям.
+
+    Получатели читаются из users keyset-пачками по id, отправка идёт через общий token bucket
+    (Bot API допускает около 30 сообщений в секунду), 429 останавливает bucket на retry_after.
+    После каждой пачки прогресс (последний id и счётчики) сохраняется в redis, поэтому после рестарта
+    рассылка продолжается со следующей пачки; пачка, прерванная посередине, отправляется заново.
+    Рассылку ведёт один воркер - тот, кто держит лок в redis.
+    """
+
+    def __init__(self, rate: float, batch_size: int, concurrency: int, progress_interval: float):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self.bucket = TokenBucket(rate)
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, text: str, admin_chat_id: int) -> int:
+        redis = get_redis()
+        if await redis.get(BROADCAST_ACTIVE_KEY):
+            raise BroadcastError("Рассылка уже идёт")
+        total = (await UsersService().get_list(filter_={"is_blocked": False}, range_=[1])).total or 0
+        broadcast_id = await redis.incr(BROADCAST_SEQ_KEY)
+        # активной рассылкой становится только одна из одновременно запущенных
+        if not await redis.set(BROADCAST_ACTIVE_KEY, broadcast_id, nx=True):
+            raise BroadcastError("Рассылка уже идёт")
+        try:
+            progress = await bot.send_message(admin_chat_id, f"Рассылка {broadcast_id}: 0 из {total}")
+            await redis.hset(_state_key(broadcast_id), mapping={
+                "status": "running",
+                "text": text,
+                "total": total,
+                "last_user_id": 0,
+                "sent": 0,
+                "failed": 0,
+                "blocked": 0,
+                "admin_chat_id": admin_chat_id,
+                "progress_message_id": progress.message_id,
+                "started_at": int(time.time()),
+            })
+        except Exception:
+            await redis.eval(DELETE_IF_EQUAL_SCRIPT, 1, BROADCAST_ACTIVE_KEY, broadcast_id)
+            raise
+        self._spawn(bot, broadcast_id)
+        return broadcast_id
+
+    async def resume(self, bot: Bot):
+        """Продолжает незаконченную рассылку после рестарта."""
+        try:
+            broadcast_id = await get_redis().get(BROADCAST_ACTIVE_KEY)
+        except RedisError as e:
+            logger.warning(f"Can not check active broadcast: {e}")
+            return
+        if broadcast_id and not self.is_running:
+            logger.info(f"Resume broadcast {int(broadcast_id)}")
+            self._spawn(bot, int(broadcast_id))
+
+    async def cancel(self) -> int | None:
+        broadcast_id = await get_redis().get(BROADCAST_ACTIVE_KEY)
+        if not broadcast_id:
+            return None
+        # воркер, который ведёт рассылку, увидит статус перед следующей пачкой
+        await get_redis().hset(_state_key(int(broadcast_id)), "status", "cancelled")
+        return int(broadcast_id)
+
+    async def status(self) -> dict[str, str] | None:
+        redis = get_redis()
+        broadcast_id = await redis.get(BROADCAST_ACTIVE_KEY) or await redis.get(BROADCAST_SEQ_KEY)
+        if not broadcast_id:
+            return None
+        state = await redis.hgetall(_state_key(int(broadcast_id)))
+        return {k.decode(): v.decode() for k, v in state.items()} | {"id": broadcast_id.decode()}
+
+    async def stop(self):
+        """Останавливает отправку при выключении, прогресс остаётся в redis."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _spawn(self, bot: Bot, broadcast_id: int):
+        self._bot = bot
+        # пустой контекст: задача не должна унаследовать сессию БД и буфер FSM апдейта, из которого запущена
+        self._task = asyncio.create_task(self._run(broadcast_id), name=f"broadcast-{broadcast_id}",
+                                         context=contextvars.Context())
+
+    async def _run(self, broadcast_id: int):
+        redis = get_redis()
+        key = _state_key(broadcast_id)
+        lock = redis.lock(BROADCAST_LOCK_KEY, timeout=BROADCAST_LOCK_TTL, blocking=False)
+        if not await lock.acquire():
+            logger.info(f"Broadcast {broadcast_id} is handled by another worker")
+            return
+        try:
+            state = {k.decode(): v.decode() for k, v in (await redis.hgetall(key)).items()}
+            text = state["text"]
+            last_user_id = int(state["last_user_id"])
+            last_progress = 0.0
+            while True:
+                # если лок истёк и его взял другой воркер, reacquire упадёт и рассылка здесь остановится
+                await lock.reacquire()
+                if await redis.hget(key, "status") != b"running":
+                    break
+                page = await UsersService().get_list(filter_={"is_blocked": False}, range_=[self.batch_size],
+                                                     sort=["id"], after_id=last_user_id, count_mode=CountMode.none)
+                if page.data:
+                    await self._send_batch(key, text, page.data)
+                    last_user_id = page.data[-1].id
+                    await redis.hset(key, "last_user_id", last_user_id)
+                if not page.has_more:
+                    await redis.hset(key, "status", "done")
+                    break
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    await self._show_progress(key)
+            await self._show_progress(key)
+            await redis.eval(DELETE_IF_EQUAL_SCRIPT, 1, BROADCAST_ACTIVE_KEY, broadcast_id)
+            logger.info(f"Broadcast {broadcast_id} finished")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Broadcast {broadcast_id} failed, it will be resumed after restart")
+        finally:
+            try:
+                await lock.release()
+            except (LockError, RedisError) as e:
+                logger.warning(f"Can not release broadcast lock: {e}")
+
+    async def _send_batch(self, key: str, text: str, users: list[Users]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(user: Users) -> str:
+            async with semaphore:
+                return await self._send(user.chat_id, text)
+
+        results = await asyncio.gather(*(send(user) for user in users))
+        blocked = [user.tg_id for user, result in zip(users, results) if result == "blocked"]
+        if blocked:
+            await UsersService().set_blocked(blocked)
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "sent", results.count("sent"))
+            pipe.hincrby(key, "failed", results.count("failed"))
+            pipe.hincrby(key, "blocked", len(blocked))
+            await pipe.execute()
+
+    async def _send(self, chat_id: int, text: str) -> str:
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await self._bot.send_message(chat_id, text, parse_mode="HTML")
+                return "sent"
+            except TelegramRetryAfter as e:
+                logger.warning(f"Broadcast flood limit, pause {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"
+            except TelegramBadRequest as e:
+                logger.warning(f"Can not send broadcast to {chat_id}: {e}")
+                return "failed"
+            except (TelegramServerError, TelegramNetworkError) as e:
+                logger.warning(f"Broadcast to {chat_id} failed, retry: {e}")
+                await asyncio.sleep(2 ** attempt)
+        return "failed"
+
+    async def _show_progress(self, key: str):
+        state = {k.decode(): v.decode() for k, v in (await get_redis().hgetall(key)).items()}
+        done = int(state["sent"]) + int(state["failed"]) + int(state["blocked"])
+        status = {"running": "идёт", "done": "завершена", "cancelled": "остановлена"}.get(state["status"], "")
+        text = (f"Рассылка {key.split(':')[1]} {status}: {done} из {state['total']}\n"
+                f"Доставлено: {state['sent']}, заблокировали бота: {state['blocked']}, ошибок: {state['failed']}")
+        try:
+            await self._bot.edit_message_text(text=text, chat_id=int(state["admin_chat_id"]),
+                                              message_id=int(state["progress_message_id"]))
+        except (TelegramBadRequest, TelegramRetryAfter) as e:
+            logger.debug(f"Can not update broadcast progress: {e}")
+
+
+broadcaster = Broadcaster(
+    rate=settings.broadcast_rate,
+    batch_size=settings.broadcast_batch_size,
+    concurrency=settings.broadcast_concurrency,
+    progress_interval=settings.broadcast_progress_interval,
+)
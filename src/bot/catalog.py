@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, LabeledPrice
+from redis.exceptions import RedisError
+
+from src.models.music_pack import Categories_dict, MusicPack
+from src.redis_client import get_redis
+from src.services.catalog import CATALOG_CHANNEL, CatalogService, get_catalog_version
+from src.services.exceptions import SqlError
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CREATE_NEW_PACK_DATA = "create_new_pack"
+
+
+@dataclass(frozen=True)
+class CategoryView:
+    name: str
+    packs: Mapping[str, MusicPack]
+    text: str
+    keyboard: InlineKeyboardMarkup
+
+
+@dataclass(frozen=True)
+class PackView:
+    pack: MusicPack
+    category: str
+    text: str
+    keyboard: InlineKeyboardMarkup
+    price: LabeledPrice
+
+
+class Catalog:
+    """
+    Каталог паков с индексами по имени пака, id и категории.
+
+    Клавиатуры и тексты для хендлеров строятся один раз при создании каталога.
+    Каталог не меняется после создания: при изменении паков строится новый и подменяется целиком через
+    reload_catalog.
+    """
+
+    def __init__(self, categories: Mapping[str, Mapping[str, MusicPack]]):
+        by_name: dict[str, PackView] = {}
+        by_id: dict[int, PackView] = {}
+        by_category: dict[str, CategoryView] = {}
+        for category_name, packs in categories.items():
+            for pack in packs.values():
+                view = self._build_pack_view(pack, category_name)
+                by_name[pack.name] = view
+                by_id[pack.id] = view
+            by_category[category_name] = self._build_category_view(category_name, packs)
+
+        self._by_name = MappingProxyType(by_name)
+        self._by_id = MappingProxyType(by_id)
+        self._by_category = MappingProxyType(by_category)
+        self.start_keyboard = self._build_start_keyboard(by_category.keys())
+
+    @property
+    def categories(self) -> Mapping[str, CategoryView]:
+        return self._by_category
+
+    @property
+    def packs(self) -> Mapping[str, PackView]:
+        return self._by_name
+
+    def category(self, name: str) -> CategoryView | None:
+        return self._by_category.get(name)
+
+    def pack(self, name: str | None) -> PackView | None:
+        return self._by_name.get(name)
+
+    def pack_by_id(self, id_: int) -> PackView | None:
+        return self._by_id.get(id_)
+
+    @staticmethod
+    def _build_start_keyboard(category_names) -> InlineKeyboardMarkup:
+        inline_kb_list = [
+            [InlineKeyboardButton(text=name, callback_data=f"pack_category_{name}")]
+            for name in category_names
+        ]
+        inline_kb_list.append([InlineKeyboardButton(text="Хочу заказать пак в другом жанре!",
+                                                    callback_data=CREATE_NEW_PACK_DATA)])
+        return InlineKeyboardMarkup(inline_keyboard=inline_kb_list)
+
+    @staticmethod
+    def _build_category_view(category_name: str, packs: Mapping[str, MusicPack]) -> CategoryView:
+        inline_kb_list = [
+            [InlineKeyboardButton(text=pack.human_name, callback_data=f"pack_name_{pack.name}")]
+            for pack in packs.values()
+        ]
+        inline_kb_list.append([InlineKeyboardButton(text="Хочу заказать другой пак!",
+                                                    callback_data=CREATE_NEW_PACK_DATA)])
+        text = f"Вот доступные паки в категории {category_name}. Во всех наших паках уникальные наборы треков.\
+    \n\nА если тут нет нужного тебе пака, то ты всегда можешь заказать создание нового"
+        return CategoryView(
+            name=category_name,
+            packs=MappingProxyType(dict(packs)),
+            text=text,
+            keyboard=InlineKeyboardMarkup(inline_keyboard=inline_kb_list),
+        )
+
+    @staticmethod
+    def _build_pack_view(pack: MusicPack, category_name: str) -> PackView:
+        text = f"{pack.human_name} - отличный выбор!\
+        \nЗдесь собраны самые свежие треки в отличном качестве🎧\
+        \n\nКоличество треков в паке: {pack.track_count}\
+        \nCтоимость: {pack.cost/100} RUB"
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="Беру этот pack", callback_data=f"buy_pack_{pack.name}")]
+        ])
+        price = LabeledPrice(label=f"Оплата за музыкальный пак {pack.human_name}", amount=pack.cost)
+        return PackView(pack=pack, category=category_name, text=text, keyboard=keyboard, price=price)
+
+
+# паки из кода используются, пока каталог не загружен из БД
+_catalog = Catalog(Categories_dict)
+
+
+def get_catalog() -> Catalog:
+    return _catalog
+
+
+def reload_catalog(categories: Mapping[str, Mapping[str, MusicPack]]) -> Catalog:
+    """Строит новый каталог и подменяет текущий одной операцией."""
+    global _catalog
+    _catalog = Catalog(categories)
+    return _catalog
+
+
+class CatalogWatcher:
+    """
+    Загружает каталог из БД при старте и перезагружает его, когда меняется версия каталога в redis.
+
+    О смене версии сообщает pub/sub канал, а на случай пропущенных сообщений версия дополнительно
+    сверяется раз в poll_interval секунд. Пока версия не меняется, обработчики не делают запросов в БД.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self.version: int | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        try:
+            await self.reload()
+        except Exception:
+            logger.exception("Can not load catalog, keep current catalog")
+        self._task = asyncio.create_task(self._run(), name="catalog-watcher")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def reload(self):
+        try:
+            version = await get_catalog_version()
+        except RedisError as e:
+            logger.warning(f"Can not get catalog version: {e}")
+            version = None
+        try:
+            categories = await CatalogService().load()
+        except SqlError as e:
+            logger.error(f"Can not load catalog from DB: {e}")
+            return
+        if not categories:
+            logger.warning("Catalog in DB is empty, keep current catalog")
+            self.version = version
+            return
+        reload_catalog(categories)
+        self.version = version
+        logger.info(f"Catalog reloaded, version {version}")
+
+    async def _run(self):
+        while True:
+            try:
+                async with get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(CATALOG_CHANNEL)
+                    while True:
+                        # сообщение только будит цикл раньше, актуальность проверяется по версии
+                        await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_interval)
+                        if await get_catalog_version() != self.version:
+                            await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Catalog watcher failed, restart")
+                await asyncio.sleep(self.poll_interval)
+
+
+catalog_watcher = CatalogWatcher(poll_interval=settings.catalog_poll_interval)
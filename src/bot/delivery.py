@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from pydantic import BaseModel, ValidationError
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError, RedisError
+
+from src.bot.catalog import get_catalog
+from src.bot.documents import send_pack_document
+from src.database import savepoint
+from src.redis_client import get_redis
+from src.schemas.payments import PAYABLE_STATUSES, PaymentEvent, PaymentStatus
+from src.services.exceptions import NotFoundError, SqlError, StatusConflictError
+from src.services.payments import PaymentService
+from src.settings import settings
+from src.utils.tg_messages import send_tg_message
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "delivery:queue"
+PROCESSING_KEY = "delivery:processing"
+DELAYED_KEY = "delivery:delayed"
+DEAD_KEY = "delivery:dead"
+JOB_STATUS_KEY = "delivery:job:{}"
+JOB_LOCK_KEY = "delivery:lock:{}"
+JOB_STATUS_TTL = 60 * 60 * 24 * 7  # 7 days
+# блокировка продлевается, пока идёт отправка, TTL нужен только чтобы освободить задачу упавшего процесса
+JOB_LOCK_TTL = 60
+
+
+class DeliveryError(Exception):
+    pass
+
+
+class DeliveryJob(BaseModel):
+    transaction_id: str
+    user_id: int
+    chat_id: int
+    username: str | None = None
+    pack_name: str
+    payment_id: int | None = None
+    attempts: int = 0
+    document_sent: bool = False
+
+
+class DeliveryQueue:
+    """
+    Очередь доставки архивов после оплаты, хранящаяся в redis.
+
+    Задача попадает в очередь один раз на transaction_id, воркеры забирают её в список processing,
+    при ошибке задача откладывается с экспоненциальной задержкой, после max_attempts попыток
+    уходит в dead-letter список и в error_chat_id. Если обработка упала (например, на redis), задача
+    убирается из processing и откладывается, нечитаемая задача - уходит в dead-letter. Задачи, которые
+    остались в processing после остановки процесса, возвращаются в очередь при следующем старте.
+    """
+
+    def __init__(self, concurrency: int, max_attempts: int, retry_delay: float):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._bot: Bot | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        try:
+            await self._recover()
+        except RedisError as e:
+            logger.error(f"Can not recover delivery jobs: {e}")
+        self._tasks = [asyncio.create_task(self._worker(), name=f"delivery-{i}") for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._scheduler(), name="delivery-scheduler"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, job: DeliveryJob) -> bool:
+        """Ставит задачу в очередь. Повторная задача с тем же transaction_id игнорируется."""
+        created = await get_redis().set(JOB_STATUS_KEY.format(job.transaction_id), "queued", nx=True, ex=JOB_STATUS_TTL)
+        if not created:
+            logger.info(f"Delivery job {job.transaction_id} already exists")
+            return False
+        await get_redis().lpush(QUEUE_KEY, job.model_dump_json())
+        return True
+
+    async def deliver(self, job: DeliveryJob):
+        pack_view = get_catalog().pack(job.pack_name)
+        if pack_view is None:
+            raise DeliveryError(f"Pack {job.pack_name} not found")
+        pack = pack_view.pack
+
+        if not job.document_sent:
+            if job.attempts == 0:
+                await self._bot.send_message(job.chat_id, f"Спасибо за оплату пака {pack.human_name}, сейчас пришлю архив")
+            await send_pack_document(self._bot, job.chat_id, pack, protect_content=True)
+            job.document_sent = True
+
+        await send_tg_message(f"Пользователь @{job.username} успешно купил пак {pack.human_name}")
+        if job.payment_id is None:
+            logger.warning(f"Delivery job {job.transaction_id} has no payment id, status is not changed")
+            return
+        try:
+            # если отметить оплату в successful_payment не получилось, платёж ещё в одном из статусов до оплаты;
+            # при доставке прямо из хендлера ошибка не должна откатить его транзакцию
+            async with savepoint():
+                await PaymentService().transition(job.payment_id, [PaymentStatus.paid, *PAYABLE_STATUSES],
+                                                  PaymentStatus.transaction_completed, PaymentEvent.delivered)
+        except StatusConflictError as e:
+            logger.info(f"Payment {job.payment_id} is already {e.status}")
+        except (NotFoundError, SqlError) as e:
+            # пак уже отправлен, повтор задачи отправил бы его ещё раз
+            logger.error(f"Can not mark payment {job.payment_id} as delivered: {e}")
+            await send_tg_message(f"Не получилось отметить доставку платежа {job.payment_id}: {e}")
+
+    async def _worker(self):
+        while True:
+            raw = None
+            try:
+                raw = await get_redis().blmove(QUEUE_KEY, PROCESSING_KEY, timeout=1, src="RIGHT", dest="LEFT")
+                if raw is None:
+                    continue
+                await self._process(raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Delivery worker failed")
+                if raw is not None:
+                    await self._release(raw)
+                await asyncio.sleep(1)
+
+    async def _process(self, raw: bytes):
+        job = DeliveryJob.model_validate_json(raw)
+        lock = get_redis().lock(JOB_LOCK_KEY.format(job.transaction_id), timeout=JOB_LOCK_TTL)
+        if not await lock.acquire(blocking=False):
+            logger.warning(f"Delivery job {job.transaction_id} is processed by another worker")
+            await get_redis().lrem(PROCESSING_KEY, 1, raw)
+            return
+        keeper = asyncio.create_task(self._keep_lock(lock, job.transaction_id))
+        try:
+            if await get_redis().get(JOB_STATUS_KEY.format(job.transaction_id)) == b"done":
+                logger.info(f"Delivery job {job.transaction_id} already done")
+            else:
+                try:
+                    await self.deliver(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self._retry(job, e)
+                else:
+                    await get_redis().set(JOB_STATUS_KEY.format(job.transaction_id), "done", ex=JOB_STATUS_TTL)
+                    logger.info(f"Delivery job {job.transaction_id} done")
+            await get_redis().lrem(PROCESSING_KEY, 1, raw)
+        finally:
+            keeper.cancel()
+            try:
+                await lock.release()
+            except LockError:
+                logger.warning(f"Delivery lock of job {job.transaction_id} expired before release")
+
+    @staticmethod
+    async def _keep_lock(lock: Lock, transaction_id: str):
+        """Продлевает блокировку задачи, пока она обрабатывается: загрузка большого архива может идти дольше TTL."""
+        while True:
+            await asyncio.sleep(JOB_LOCK_TTL / 3)
+            try:
+                await lock.reacquire()
+            except (LockError, RedisError) as e:
+                logger.warning(f"Can not extend delivery lock of job {transaction_id}: {e}")
+
+    async def _release(self, raw: bytes):
+        """Убирает из processing задачу, обработка которой упала: откладывает её, а нечитаемую - в dead-letter."""
+        try:
+            DeliveryJob.model_validate_json(raw)
+            broken = False
+        except ValidationError as e:
+            logger.error(f"Delivery job is broken, moved to dead-letter: {e}")
+            broken = True
+        try:
+            async with get_redis().pipeline(transaction=True) as pipe:
+                if broken:
+                    pipe.lpush(DEAD_KEY, raw)
+                else:
+                    pipe.zadd(DELAYED_KEY, {raw: time.time() + self.retry_delay})
+                pipe.lrem(PROCESSING_KEY, 1, raw)
+                await pipe.execute()
+        except RedisError as e:
+            # задача останется в processing и вернётся в очередь при следующем старте
+            logger.error(f"Can not release delivery job: {e}")
+
+    async def _retry(self, job: DeliveryJob, error: Exception):
+        job.attempts += 1
+        if job.attempts >= self.max_attempts or isinstance(error, (DeliveryError, TelegramForbiddenError)):
+            logger.error(f"Delivery job {job.transaction_id} failed: {error}")
+            await get_redis().lpush(DEAD_KEY, job.model_dump_json())
+            await get_redis().set(JOB_STATUS_KEY.format(job.transaction_id), "dead", ex=JOB_STATUS_TTL)
+            await send_tg_message(f"Не получилось отправить пак {job.pack_name} пользователю @{job.username} "
+                                  f"(transaction {job.transaction_id}): {error}", chat_id=settings.error_chat_id)
+            return
+        delay = self.retry_delay * 2 ** (job.attempts - 1)
+        if isinstance(error, TelegramRetryAfter):
+            delay = max(delay, error.retry_after)
+        logger.warning(f"Delivery job {job.transaction_id} failed, retry in {delay}s: {error}")
+        await get_redis().zadd(DELAYED_KEY, {job.model_dump_json(): time.time() + delay})
+
+    async def _scheduler(self):
+        while True:
+            try:
+                for raw in await get_redis().zrangebyscore(DELAYED_KEY, 0, time.time()):
+                    # zrem вернёт 1 только одному процессу, поэтому задача не задвоится
+                    if await get_redis().zrem(DELAYED_KEY, raw):
+                        await get_redis().lpush(QUEUE_KEY, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Delivery scheduler failed")
+            await asyncio.sleep(1)
+
+    async def _recover(self):
+        for raw in await get_redis().lrange(PROCESSING_KEY, 0, -1):
+            job = DeliveryJob.model_validate_json(raw)
+            if await get_redis().exists(JOB_LOCK_KEY.format(job.transaction_id)):
+                continue
+            if await get_redis().lrem(PROCESSING_KEY, 1, raw):
+                await get_redis().rpush(QUEUE_KEY, raw)
+                logger.info(f"Delivery job {job.transaction_id} returned to queue")
+
+
+delivery_queue = DeliveryQueue(
+    concurrency=settings.delivery_concurrency,
+    max_attempts=settings.delivery_max_attempts,
+    retry_delay=settings.delivery_retry_delay,
+)
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import logging
+from collections.abc import Awaitable, Callable
+from urllib.parse import urljoin
+
+from aiogram import Bot
+from aiogram.types import FSInputFile, Message
+from redis.asyncio.lock import Lock
+from redis.exceptions import RedisError
+
+from src.bot.catalog import get_catalog
+from src.database import savepoint
+from src.models.music_pack import MusicPack
+from src.redis_client import get_redis
+from src.schemas.catalog import UpdateMusicPackSchema
+from src.services.catalog import CatalogService
+from src.services.exceptions import NotFoundError, SqlError
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+PREWARM_LOCK_KEY = "prewarm:lock"
+PREWARM_LOCK_TTL = 300  # продлевается после каждого пака, загрузка одного архива должна уложиться
+
+
+async def save_document_id(pack: MusicPack, document_id: str):
+    """Сохраняет file_id загруженного архива, чтобы следующие отправки не загружали файл заново."""
+    try:
+        # архив уже отправлен, ошибка записи не должна ломать остальную транзакцию апдейта
+        async with savepoint():
+            await CatalogService().update({"id": pack.id}, UpdateMusicPackSchema(document_id=document_id))
+    except (NotFoundError, SqlError) as e:
+        logger.error(f"Can not save document id for pack {pack.name}: {e}")
+        return
+    logger.info(f"Document id for pack {pack.name} saved: {document_id}")
+
+
+async def send_pack_document(bot: Bot, chat_id: int, pack: MusicPack, **kwargs) -> Message:
+    """Отправляет архив пака: по document_id, а если его ещё нет - загружает файл и запоминает его file_id."""
+    if pack.document_id is not None:
+        return await bot.send_document(chat_id, pack.document_id, **kwargs)
+
+    path_to_doc = urljoin(settings.files_path, pack.file_name)
+    message = await bot.send_document(chat_id, FSInputFile(path=path_to_doc), **kwargs)
+    if message.document:
+        await save_document_id(pack, message.document.file_id)
+    return message
+
+
+class DocumentsPrewarmer:
+    """
+    Загрузка архивов паков без document_id в служебный чат.
+
+    Идёт фоновой задачей вне апдейта и его транзакции, загрузкой занимается один процесс - тот, кто взял лок
+    в redis. file_id каждого пака сохраняется (и публикуется в каталог) сразу после его загрузки,
+    поэтому прерванная загрузка продолжается с оставшихся паков.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, bot: Bot, report_chat_id: int) -> bool:
+        """Запускает загрузку в фоне, по окончании пишет итог в report_chat_id. False - загрузка уже идёт."""
+        lock = get_redis().lock(PREWARM_LOCK_KEY, timeout=PREWARM_LOCK_TTL, blocking=False)
+        if not await lock.acquire():
+            return False
+        # пустой контекст: задача не должна унаследовать сессию БД апдейта, из которого запущена
+        self._task = asyncio.create_task(self._run(bot, lock, report_chat_id), name="prewarm",
+                                         context=contextvars.Context())
+        return True
+
+    async def run(self, bot: Bot, chat_id: int | None = None) -> list[str] | None:
+        """Загрузка в текущей задаче (CLI). None - загрузка уже идёт в другом процессе."""
+        lock = get_redis().lock(PREWARM_LOCK_KEY, timeout=PREWARM_LOCK_TTL, blocking=False)
+        if not await lock.acquire():
+            return None
+        try:
+            return await prewarm_documents(bot, chat_id, on_progress=lock.reacquire)
+        finally:
+            await self._release(lock)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, bot: Bot, lock: Lock, report_chat_id: int):
+        try:
+            uploaded = await prewarm_documents(bot, on_progress=lock.reacquire)
+            text = f"Загружены паки: {', '.join(uploaded)}" if uploaded else "Все паки уже загружены"
+            await bot.send_message(report_chat_id, text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Prewarm failed")
+        finally:
+            await self._release(lock)
+
+    @staticmethod
+    async def _release(lock: Lock):
+        try:
+            await lock.release()
+        except RedisError as e:
+            logger.warning(f"Can not release prewarm lock: {e}")
+
+
+async def prewarm_documents(bot: Bot, chat_id: int | None = None,
+                            on_progress: Callable[[], Awaitable] | None = None) -> list[str]:
+    """
+    Загружает в служебный чат все паки без document_id. Возвращает имена загруженных паков.
+    on_progress вызывается после каждого пака (продление лока).
+    """
+    if chat_id is None:
+        chat_id = settings.files_cache_chat_id or settings.error_chat_id
+    uploaded = []
+    for view in get_catalog().packs.values():
+        if view.pack.document_id is not None:
+            continue
+        try:
+            await send_pack_document(bot, chat_id, view.pack, disable_notification=True)
+            uploaded.append(view.pack.name)
+        except Exception:
+            logger.exception(f"Can not upload pack {view.pack.name}")
+        if on_progress is not None:
+            await on_progress()
+    return uploaded
+
+
+prewarmer = DocumentsPrewarmer()
@@ -1,6 +1,5 @@
 
 import logging
-from urllib.parse import urljoin
 from aiogram import F, Router, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram.types import (
@@ -8,70 +7,129 @@ from aiogram.types import (
     Message,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
-    FSInputFile
 )
 
-from src.schemas.payments import UpdatePaymentsSchema, PaymentStatus
+from redis.exceptions import RedisError
+
+from src.database import savepoint
+from src.schemas.payments import PAID_STATUSES, PAYABLE_STATUSES, CreatePaymentsSchema, PaymentEvent, PaymentStatus
+from src.services.exceptions import NotFoundError, SqlError, StatusConflictError
 from src.services.payments import PaymentService
-from src.models.music_pack import MusicPack, get_pack_by_name_or_category
+from src.bot.catalog import get_catalog
+from src.bot.delivery import DeliveryJob, delivery_queue
 from src.settings import settings
 from src.utils.tg_messages import send_tg_message
 
-logger = logging.Logger(__name__)
+logger = logging.getLogger(__name__)
 
 payment_result_router = Router(name="payment_result")
 
 
-async def change_status(from_status, to_status, user_id: int, transaction_id: str | None = None):
-
-    filter_ = {"user_id": user_id,
-               "status": from_status.value}
-    update_schema = UpdatePaymentsSchema(status=to_status.value)
-    if transaction_id:
-        update_schema.transaction_id = transaction_id
-    try:
-        await PaymentService().update(filter_, schema=update_schema)
-    except Exception as e:
-        await send_tg_message(f"Не получилось перевести статус платежа: {filter_}: {str(e.__traceback__)}")
-
-
 @payment_result_router.pre_checkout_query()
 async def pre_checkout_query(pre_checkout_query: PreCheckoutQuery, bot: Bot):
+    user_id = str(pre_checkout_query.from_user.id)
+    service = PaymentService()
+    try:
+        payment_id = await service.resolve_payment_id(user_id, pre_checkout_query.invoice_payload)
+        if payment_id is not None:
+            # счёт могли оплатить уже после того, как неоплаченный платёж перевели в expired
+            await service.transition(payment_id, [PaymentStatus.payment_started, PaymentStatus.expired],
+                                     PaymentStatus.transaction_created, PaymentEvent.pre_checkout,
+                                     transaction_id=pre_checkout_query.id)
+    except StatusConflictError as e:
+        if e.status in [status.value for status in PAID_STATUSES]:
+            await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False,
+                                                error_message="Этот счёт уже оплачен")
+            return
+        # tr_created из другого pre_checkout подтверждаем: повторную оплату отсечёт уникальный charge_id
+        # и переход статуса в successful_payment
+    except (NotFoundError, SqlError) as e:
+        # на pre_checkout есть 10 секунд, оплату не блокируем, статус поправит successful_payment
+        logger.error(f"Can not change payment status of user {user_id}: {e}")
+        await send_tg_message(f"Не получилось перевести статус платежа пользователя {user_id}: {e}")
     await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
-    await change_status(PaymentStatus.payment_started, PaymentStatus.transaction_created,
-                        user_id=pre_checkout_query.from_user.id,
-                        transaction_id=pre_checkout_query.id)
 
 
 async def incorrect_db_condition(message: Message):
     chat_id = settings.notification_admin_chat_id
     button_url = f'tg://openmessage?user_id={chat_id}'
-    markup = InlineKeyboardMarkup()
-    markup.add(InlineKeyboardButton(text="Написать админу", url=button_url))
+    markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Написать админу", url=button_url)]])
     await message.answer(text="Спасибо за оплату, напишите администратору \
                          и прикрепите сообщения с оплатой и выбранным паком, чтобы получить его", reply_markup=markup)
 
 
+async def is_known_charge(service: PaymentService, charge_id: str) -> bool:
+    try:
+        await service.get_by_charge_id(charge_id)
+    except NotFoundError:
+        return False
+    return True
+
+
+async def record_repeated_payment(service: PaymentService, user_id: str, pack_name: str, charge_id: str) -> int:
+    """Отдельный платёж для повторной оплаты счёта, чтобы её charge id тоже был в БД и доставка отметилась."""
+    payment = await service.create(CreatePaymentsSchema(user_id=user_id, status=PaymentStatus.payment_started.value,
+                                                        pack_name=pack_name))
+    return (await service.transition(payment.id, PaymentStatus.payment_started, PaymentStatus.paid,
+                                     PaymentEvent.paid, charge_id=charge_id)).id
+
+
 @payment_result_router.message(F.successful_payment)
 async def successful_payment(message: Message, state: FSMContext):
-
-    pack_name = (await state.get_data()).get("pack_name")
+    charge_id = message.successful_payment.telegram_payment_charge_id
+    service = PaymentService()
+    payment_id = await service.resolve_payment_id(str(message.from_user.id),
+                                                  message.successful_payment.invoice_payload)
+    pack_name = None
+    if payment_id is not None:
+        try:
+            # после ошибки оплата всё равно доставляется, поэтому переход в своём SAVEPOINT
+            async with savepoint():
+                pack_name = (await service.transition(payment_id, PAYABLE_STATUSES, PaymentStatus.paid,
+                                                      PaymentEvent.paid, charge_id=charge_id)).pack_name
+        except StatusConflictError as e:
+            if e.charge_id == charge_id or await is_known_charge(service, charge_id):
+                # Telegram доставил апдейт повторно: платёж уже оплачен, доставка уже поставлена
+                logger.info(f"Payment {payment_id} is already {e.status}, successful_payment {charge_id} skipped")
+                return
+            # тот же счёт оплачен ещё раз: деньги списаны, поэтому пак отправляем, о возврате решает админ
+            logger.error(f"Payment {payment_id} is already {e.status} with charge {e.charge_id}, "
+                         f"repeated payment {charge_id}")
+            await send_tg_message(f"Повторная оплата платежа {payment_id} пользователем {message.from_user.id}: "
+                                  f"charge {charge_id}, первая оплата {e.charge_id}. Пак будет отправлен ещё раз, "
+                                  f"проверьте, нужен ли возврат")
+            pack_name = e.pack_name
+            try:
+                async with savepoint():
+                    payment_id = await record_repeated_payment(service, str(message.from_user.id), pack_name,
+                                                               charge_id)
+            except StatusConflictError:
+                # этот charge id уже записал параллельный повтор апдейта
+                logger.info(f"Repeated payment {charge_id} is already recorded")
+                return
+            except (NotFoundError, SqlError) as e:
+                logger.error(f"Can not record repeated payment {charge_id}: {e}")
+                payment_id = None
+        except (NotFoundError, SqlError) as e:
+            logger.error(f"Can not mark payment {payment_id} as paid: {e}")
+            await send_tg_message(f"Не получилось отметить оплату платежа {payment_id} ({charge_id}): {e}")
     if not pack_name:
-        found_pack = (await PaymentService().get_list(filter_={"user_id": message.from_user.id}))
-        if found_pack:
-            pack_name = found_pack[-1].pack_name
-        else:
-            await incorrect_db_condition(message)
-            return
-    pack: MusicPack = get_pack_by_name_or_category(pack_name)
-    await message.answer(f"Спасибо за оплату пака {pack.human_name}, сейчас пришлю архив")
-
-    doc = pack.document_id
-    if doc is None:
-        path_to_doc = urljoin(settings.files_path, pack.file_name)
-        doc = FSInputFile(path=path_to_doc)
-
-    await message.answer_document(doc, protect_content=True)
-    await send_tg_message(f"Пользователь @{message.from_user.username} успешно купил пак {pack.human_name}")
-    await change_status(PaymentStatus.transaction_created, PaymentStatus.transaction_completed,
-                        user_id=message.from_user.id)
+        pack_name = (await state.get_data()).get("pack_name")
+    if not pack_name:
+        await incorrect_db_condition(message)
+        return
+    if get_catalog().pack(pack_name) is None:
+        await incorrect_db_condition(message)
+        return
+
+    job = DeliveryJob(transaction_id=charge_id,
+                      user_id=message.from_user.id,
+                      chat_id=message.chat.id,
+                      username=message.from_user.username,
+                      pack_name=pack_name,
+                      payment_id=payment_id)
+    try:
+        await delivery_queue.enqueue(job)
+    except RedisError as e:
+        logger.error(f"Can not enqueue delivery job, deliver inline: {e}")
+        await delivery_queue.deliver(job)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+from redis.exceptions import RedisError
+
+from src.redis_client import get_redis
+from src.services.exceptions import SqlError
+from src.services.payments import PaymentService
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_LOCK_KEY = "payments:cleanup"
+
+
+class PaymentsCleaner:
+    """
+    Периодически переводит неоплаченные платежи (started старше expire_after секунд) в expired.
+
+    При нескольких воркерах за интервал чистку выполняет только тот, кто первым поставил ключ в redis.
+    """
+
+    def __init__(self, interval: float, expire_after: int, batch_size: int):
+        self.interval = interval
+        self.expire_after = expire_after
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="payments-cleaner")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self) -> int:
+        expired = await PaymentService().expire_stale(self.expire_after, self.batch_size)
+        if expired:
+            logger.info(f"{expired} stale payments expired")
+        return expired
+
+    async def _run(self):
+        while True:
+            try:
+                if await get_redis().set(CLEANUP_LOCK_KEY, 1, nx=True, ex=max(1, int(self.interval))):
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, SqlError) as e:
+                logger.error(f"Can not expire stale payments: {e}")
+            except Exception:
+                logger.exception("Payments cleaner failed")
+            await asyncio.sleep(self.interval)
+
+
+payments_cleaner = PaymentsCleaner(
+    interval=settings.payments_cleanup_interval,
+    expire_after=settings.payments_expire_after,
+    batch_size=settings.payments_cleanup_batch,
+)
@@ -2,20 +2,17 @@
 from aiogram import F, types, Router
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command
-from aiogram.utils.keyboard import InlineKeyboardButton, InlineKeyboardMarkup
-from src.schemas.payments import CreatePaymentsSchema, PaymentStatus
-from src.services.payments import PaymentService
+from aiogram.filters import Command, ChatMemberUpdatedFilter, KICKED, MEMBER
+from src.services.payments import PaymentService, make_invoice_payload
 from src.settings import settings
-from src.models.music_pack import MusicPack, get_pack_price, Categories, get_pack_by_name_or_category
+from src.bot.catalog import get_catalog
 from src.services.users import UsersService
 from src.schemas.users import CreateUserSchema
-from logging import Logger
-from src.bot_main import redis
+import logging
 from src.utils.tg_messages import send_tg_message
 
 
-logger = Logger(__name__)
+logger = logging.getLogger(__name__)
 
 purchase_router = Router(name="purchase_pack")
 
@@ -29,41 +26,29 @@ class Form(StatesGroup):
 
 
 async def start(message: types.Message, state: FSMContext):
-    inline_kb_list = [
-        [InlineKeyboardButton(text=category.value, callback_data=f"pack_category_{category.value}")]
-        for category in Categories
-    ]
-    inline_kb_list.append([InlineKeyboardButton(text="Хочу заказать пак в другом жанре!",
-                                                callback_data="create_new_pack")])
-    inline_keyboard = InlineKeyboardMarkup(inline_keyboard=inline_kb_list)
-    create_user = CreateUserSchema(username=message.from_user.username,
+    # username в телеграме необязателен, а в users колонка NOT NULL
+    create_user = CreateUserSchema(username=message.from_user.username or "",
                                    name=message.from_user.first_name,
                                    surname=message.from_user.last_name,
                                    tg_id=message.from_user.id,
                                    chat_id=message.chat.id,
                                    )
-    await UsersService().check_and_create(create_user, redis)
+    await UsersService().check_and_create(create_user)
 
     await message.answer(text="Мы рады, что тебя заинтересовал наш TOPDJ MUSIC PACK!\n\nВыбери интересующий тебя жанр🤩",
-                         reply_markup=inline_keyboard)
+                         reply_markup=get_catalog().start_keyboard)
     await state.set_state(Form.pack_category)
 
 
 @purchase_router.callback_query(F.data.startswith("pack_category_"))
 async def pack_name(callback: types.CallbackQuery, state: FSMContext):
     category_name = callback.data.replace("pack_category_", "")
-    packs_dict = get_pack_by_name_or_category(category_name)
-    inline_kb_list = [
-        [InlineKeyboardButton(text=pack.human_name, callback_data=f"pack_name_{pack.name}")]
-        for _, pack in packs_dict.items()
-    ]
-    inline_kb_list.append([InlineKeyboardButton(text="Хочу заказать другой пак!",
-                                                callback_data="create_new_pack")])
-    inline_keyboard = InlineKeyboardMarkup(inline_keyboard=inline_kb_list)
-
-    desc = f"Вот доступные паки в категории {category_name}. Во всех наших паках уникальные наборы треков.\
-    \n\nА если тут нет нужного тебе пака, то ты всегда можешь заказать создание нового"
-    await callback.message.answer(text=desc, reply_markup=inline_keyboard)
+    category = get_catalog().category(category_name)
+    if category is None:
+        await callback.message.answer("Пожалуйста, выбери категорию из списка")
+        return
+
+    await callback.message.answer(text=category.text, reply_markup=category.keyboard)
     await state.set_state(Form.pack_name)
 
 
@@ -96,32 +81,27 @@ async def get_new_pack_info(message: types.Message, state: FSMContext):
 async def process_name(callback: types.CallbackQuery, state: FSMContext):
     pack_name = callback.data.replace("pack_name_", "")
     logger.error(f"Pack name: {pack_name}")
-    cur_pack = get_pack_by_name_or_category(pack_name)
-    if cur_pack is None:
+    pack_view = get_catalog().pack(pack_name)
+    if pack_view is None:
         await callback.message.answer("Пожалуйста, выбери пак из списка")
         return
 
-    description = f"{cur_pack.human_name} - отличный выбор!\
-        \nЗдесь собраны самые свежие треки в отличном качестве🎧\
-        \n\nКоличество треков в паке: {cur_pack.track_count}\
-        \nCтоимость: {cur_pack.cost/100} RUB"
-
-    inline_kb_list = [
-        [InlineKeyboardButton(text="Беру этот pack", callback_data=f"buy_pack_{pack_name}")]
-        ]
-    inline_keyboard = InlineKeyboardMarkup(inline_keyboard=inline_kb_list)
-    await callback.message.answer(text=description, reply_markup=inline_keyboard)
+    await callback.message.answer(text=pack_view.text, reply_markup=pack_view.keyboard)
     await state.set_state(Form.pack_info)
 
 
 @purchase_router.callback_query(F.data.startswith("buy_pack_"))
 async def start_buy(callback: types.CallbackQuery, state: FSMContext):
     pack_name = callback.data.replace("buy_pack_", "")
+    pack_view = get_catalog().pack(pack_name)
+    if pack_view is None:
+        await callback.message.answer("Пожалуйста, выбери пак из списка")
+        return
     await state.update_data(pack_name=pack_name)
-    cur_pack: MusicPack = get_pack_by_name_or_category(pack_name)
-    pack_price = get_pack_price(pack_name)
+    cur_pack = pack_view.pack
+    # повторные нажатия в пределах invoice_ttl получают тот же платёж, а не новую строку
+    payment = await PaymentService().get_or_create_started(str(callback.from_user.id), pack_name)
 
-    pack_price = types.LabeledPrice(label=f"Оплата за музыкальный пак {cur_pack.human_name}", amount=pack_price)
     invoice = await callback.message.answer_invoice(
         title="Оплата музыкального пака",
         description=f"Внеси оплату за пак {cur_pack.human_name} и я пришлю тебе его",
@@ -132,14 +112,18 @@ async def start_buy(callback: types.CallbackQuery, state: FSMContext):
         # photo_height=234,
         # photo_size=416,
         is_flexible=False,
-        prices=[pack_price],
+        prices=[pack_view.price],
         start_parameter="music_pack_payment",
-        payload="pack-invoice-payload")
+        payload=make_invoice_payload(payment.id))
     logger.debug(invoice.dict())
-    new_payment = CreatePaymentsSchema(user_id=str(callback.from_user.id),
-                                       status=PaymentStatus.payment_started,
-                                       transaction_id=None,
-                                       pack_name=pack_name
-                                       )
-    await PaymentService().create(new_payment)
     await state.set_state(Form.new_invoice)
+
+
+@purchase_router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: types.ChatMemberUpdated):
+    await UsersService().set_blocked([event.from_user.id], True)
+
+
+@purchase_router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked(event: types.ChatMemberUpdated):
+    await UsersService().set_blocked([event.from_user.id], False)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+from redis.exceptions import RedisError
+
+from src.redis_client import get_redis
+from src.schemas.sales_stats import SalesFunnelSchema, SalesReportSchema
+from src.services.exceptions import SqlError
+from src.services.sales_stats import SalesStatsService
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LOCK_KEY = "sales_stats:refresh"
+
+
+class SalesStatsRefresher:
+    """
+    Периодически обновляет материализованные представления отчётов по продажам.
+
+    При нескольких воркерах за интервал обновление выполняет только тот, кто первым поставил ключ в redis.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="sales-stats-refresher")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if await get_redis().set(REFRESH_LOCK_KEY, 1, nx=True, ex=max(1, int(self.interval))):
+                    await SalesStatsService().refresh()
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, SqlError) as e:
+                logger.error(f"Can not refresh sales stats: {e}")
+            except Exception:
+                logger.exception("Sales stats refresher failed")
+            await asyncio.sleep(self.interval)
+
+
+sales_stats_refresher = SalesStatsRefresher(interval=settings.sales_stats_refresh_interval)
+
+
+def _rub(kopecks: int) -> str:
+    return f"{kopecks / 100:.2f} RUB"
+
+
+def _funnel_line(stats: SalesFunnelSchema) -> str:
+    return (f"счета {stats.started} → pre_checkout {stats.checkout} ({stats.checkout_rate:.0%}) → "
+            f"оплаты {stats.paid} ({stats.payment_rate:.0%}), доставлено {stats.delivered}, "
+            f"не оплачено {stats.expired}; выручка {_rub(stats.revenue)}")
+
+
+def format_report(report: SalesReportSchema, days: int) -> str:
+    lines = [f"Продажи за {days} дн.: {_funnel_line(report.period)}", ""]
+    for day in report.days:
+        lines.append(f"{day.day:%d.%m}: {day.paid} оплат из {day.started}, {_rub(day.revenue)}")
+    lines += ["", "По пакам за всё время:"]
+    for pack in report.packs:
+        lines.append(f"{pack.pack_name}: {pack.paid} оплат из {pack.started} ({pack.conversion:.0%}), "
+                     f"{_rub(pack.revenue)}")
+    lines += ["", f"Всего: {_funnel_line(report.total)}"]
+    if report.refreshed_at:
+        lines.append(f"Данные на {report.refreshed_at:%d.%m %H:%M}")
+    return "\n".join(lines)
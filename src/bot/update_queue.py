@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from enum import Enum
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from src.bot.utils.storage import fsm_buffer
+from src.utils.metrics import UPDATE_QUEUE_EVENTS, WEBHOOK_QUEUE_TIME
+
+logger = logging.getLogger(__name__)
+
+
+class QueuePolicy(Enum):
+    reject = "reject"  # сразу отвечаем ошибкой, телеграм повторит апдейт позже
+    wait = "wait"  # ждём место в очереди не дольше put_timeout, потом отвечаем ошибкой
+
+
+class UpdateQueue:
+    """
+    Очередь апдейтов вебхука с пулом обработчиков.
+
+    Очередь разбита на шарды по пользователю (или чату): апдейты одного пользователя всегда попадают
+    в один шард и обрабатываются одним воркером по порядку, поэтому переходы FSM не перемешиваются.
+    """
+
+    def __init__(self, workers: int, size: int, policy: QueuePolicy, put_timeout: float):
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self._queues: list[asyncio.Queue[tuple[Update, float]]] = [
+            asyncio.Queue(maxsize=max(1, size // workers)) for _ in range(workers)
+        ]
+        self._tasks: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, bot: Bot, dp: Dispatcher):
+        self._tasks = [
+            asyncio.create_task(self._worker(queue, bot, dp), name=f"update-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+
+    async def stop(self, timeout: float = 30):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Update queue was not drained, {self.depth} updates lost")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> dict[str, int]:
+        """Текущее состояние для gauge'ей; счётчики апдейтов идут в UPDATE_QUEUE_EVENTS."""
+        return {
+            "depth": self.depth,
+            "capacity": sum(q.maxsize for q in self._queues),
+        }
+
+    async def put(self, update: Update) -> bool:
+        """Кладёт апдейт в очередь. Возвращает False, если очередь переполнена."""
+        queue = self._queues[self._routing_key(update) % len(self._queues)]
+        item = (update, time.monotonic())
+        try:
+            if self.policy == QueuePolicy.wait:
+                await asyncio.wait_for(queue.put(item), timeout=self.put_timeout)
+            else:
+                queue.put_nowait(item)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            UPDATE_QUEUE_EVENTS.labels("rejected").inc()
+            logger.warning(f"Update queue is full, update {update.update_id} rejected")
+            return False
+        self.accepted += 1
+        UPDATE_QUEUE_EVENTS.labels("accepted").inc()
+        return True
+
+    @staticmethod
+    def _routing_key(update: Update) -> int:
+        event = update.event
+        user = getattr(event, "from_user", None)
+        if user is not None:
+            return user.id
+        chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+        if chat is not None:
+            return chat.id
+        return update.update_id
+
+    async def _worker(self, queue: asyncio.Queue, bot: Bot, dp: Dispatcher):
+        while True:
+            update, enqueued_at = await queue.get()
+            try:
+                queue_time = time.monotonic() - enqueued_at
+                WEBHOOK_QUEUE_TIME.observe(queue_time)
+                logger.debug(f"Update {update.update_id} waited in queue {queue_time:.3f}s")
+                async with fsm_buffer(dp.storage):
+                    await dp.feed_update(bot, update)
+                self.processed += 1
+                UPDATE_QUEUE_EVENTS.labels("processed").inc()
+            except Exception:
+                self.failed += 1
+                UPDATE_QUEUE_EVENTS.labels("failed").inc()
+                logger.exception(f"Can not process update {update.update_id}")
+            finally:
+                queue.task_done()
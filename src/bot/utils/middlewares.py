@@ -0,0 +1,156 @@
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from redis.exceptions import RedisError
+
+from src.database import unit_of_work
+from src.redis_client import get_redis
+from src.utils.metrics import THROTTLED_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на апдейт.
+
+    Сессия кладётся в data["db_session"] и подхватывается сервисами через unit_of_work,
+    коммит делается один раз после хендлера, при исключении - rollback.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with unit_of_work() as session:
+            data["db_session"] = session
+            return await handler(event, data)
+
+
+# KEYS[1] - бакет пользователя для префикса, KEYS[2] (необязательный) - ключ дедупликации callback_data
+# ARGV: скорость пополнения (токенов в секунду), размер бакета, окно дедупликации в мс
+# возвращает 0 - пропустить, 1 - дубль, 2 - превышен лимит
+THROTTLE_SCRIPT = """
+if #KEYS > 1 and not redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[3]) then
+    return 1
+end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = tokens >= 1
+if allowed then
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+if allowed then
+    return 0
+end
+return 2
+"""
+THROTTLE_RESULTS = {0: "processed", 1: "duplicate", 2: "throttled"}
+# префиксы callback_data, у каждого свой бакет
+CALLBACK_PREFIXES = ("pack_category_", "pack_name_", "buy_pack_", "create_new_pack")
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничение частоты нажатий и команд пользователя.
+
+    Для каждого пользователя и префикса callback_data (или команды) в redis хранится token bucket.
+    Отдельный бакет есть только у зарегистрированных команд, все остальные делят бакет "command",
+    чтобы текст сообщения не превращался в произвольные ключи redis.
+    одинаковый callback_data в течение dedup_window отбрасывается. Отброшенный callback получает answer(),
+    чтобы у пользователя пропали часики на кнопке. Оплаты (successful_payment) не ограничиваются.
+    При недоступности redis события пропускаются.
+    """
+
+    def __init__(self, rate: float, burst: int, dedup_window: float,
+                 limits: dict[str, tuple[float, int]] | None = None, commands: set[str] | None = None):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window_ms = int(dedup_window * 1000)
+        self.limits = limits or {}
+        self.commands = commands or set()
+        self._script = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if isinstance(event, CallbackQuery):
+            kind = "callback"
+            prefix = self._callback_prefix(event.data or "")
+            dedup = event.data or ""
+        elif isinstance(event, Message) and not event.successful_payment:
+            kind = "message"
+            prefix = self._message_prefix(event.text or "")
+            dedup = None
+        else:
+            return await handler(event, data)
+        if event.from_user is None:
+            return await handler(event, data)
+
+        result = await self._check(event.from_user.id, prefix, dedup)
+        THROTTLED_EVENTS.labels(kind, THROTTLE_RESULTS[result]).inc()
+        if result == 0:
+            return await handler(event, data)
+        logger.info(f"{kind} {prefix} of user {event.from_user.id} dropped: {THROTTLE_RESULTS[result]}")
+        if isinstance(event, CallbackQuery):
+            try:
+                await event.answer()
+            except TelegramAPIError as e:
+                logger.warning(f"Can not answer dropped callback: {e}")
+        return None
+
+    @staticmethod
+    def _callback_prefix(callback_data: str) -> str:
+        for prefix in CALLBACK_PREFIXES:
+            if callback_data.startswith(prefix):
+                return prefix.rstrip("_")
+        return "callback"
+
+    def _message_prefix(self, text: str) -> str:
+        if not text.startswith("/"):
+            return "message"
+        command = text.split(maxsplit=1)[0][1:].split("@", 1)[0]
+        return f"/{command}" if command in self.commands else "command"
+
+    async def _check(self, user_id: int, prefix: str, dedup: str | None) -> int:
+        rate, burst = self.limits.get(prefix, (self.rate, self.burst))
+        keys = [f"throttle:{user_id}:{prefix}"]
+        if dedup is not None:
+            keys.append(f"dedup:{user_id}:{dedup}")
+        redis = get_redis()
+        if self._script is None or self._script.registered_client is not redis:
+            self._script = redis.register_script(THROTTLE_SCRIPT)
+        try:
+            return int(await self._script(keys=keys, args=[rate, burst, self.dedup_window_ms]))
+        except RedisError as e:
+            logger.warning(f"Can not check throttling, pass event: {e}")
+            return 0
+
+
+def registered_commands(dp: Dispatcher) -> set[str]:
+    """Команды из фильтров Command всех message-хендлеров диспетчера и его роутеров."""
+    commands = set()
+    for router in dp.chain_tail:
+        for handler in router.message.handlers:
+            for handler_filter in handler.filters or []:
+                if isinstance(handler_filter.callback, Command):
+                    commands.update(c for c in handler_filter.callback.commands if isinstance(c, str))
+    return commands
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from cachetools import TTLCache
+
+from src.utils.metrics import TELEGRAM_RETRIES, TELEGRAM_THROTTLED
+from src.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# методы, которые Bot API считает сообщениями в чат; остальные (answerCallbackQuery,
+# answerPreCheckoutQuery, getMe...) не ограничиваются, на pre_checkout есть всего 10 секунд
+LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+UNLIMITED_METHODS = frozenset({"sendChatAction"})
+# корзина чата живёт, пока в чат пишут; потом она всё равно была бы полной
+CHAT_BUCKETS_TTL = 60
+CHAT_BUCKETS_SIZE = 10_000
+
+
+class ThrottledSession(AiohttpSession):
+    """
+    Сессия Bot API с ограничением частоты и повтором после 429.
+
+    Сообщения проходят через общий token bucket (лимит бота около 30 в секунду) и bucket чата:
+    в личку около 1 сообщения в секунду с небольшим burst, в группы 20 в минуту.
+    На 429 оба bucket'а останавливаются на retry_after (Bot API не говорит, какой лимит сработал),
+    запрос повторяется до max_retries раз, если retry_after не больше max_retry_after.
+    rate или chat_rate 0 выключают соответствующее ограничение.
+    """
+
+    def __init__(self, rate: float, chat_rate: float, chat_burst: int, group_rate: float, max_retries: int,
+                 max_retry_after: float, limit: int = 100, keepalive_timeout: float | None = None, **kwargs):
+        super().__init__(limit=limit, **kwargs)
+        if keepalive_timeout is not None:
+            self._connector_init["keepalive_timeout"] = keepalive_timeout
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self._chat_buckets: TTLCache = TTLCache(maxsize=CHAT_BUCKETS_SIZE, ttl=CHAT_BUCKETS_TTL)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket | None:
+        if self.chat_rate <= 0:
+            return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # положительные id - личные чаты, остальные (группы, каналы, @username) - по лимиту групп
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate)
+        # чтение из TTLCache не продлевает жизнь записи, поэтому кладём заново
+        self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None
+    ) -> TelegramType:
+        method_name = method.__api_method__
+        chat_id = getattr(method, "chat_id", None)
+        limited = method_name.startswith(LIMITED_PREFIXES) and method_name not in UNLIMITED_METHODS
+        chat_bucket = self._chat_bucket(chat_id) if limited and chat_id is not None else None
+        for attempt in range(self.max_retries + 1):
+            if limited:
+                if chat_bucket is not None and await chat_bucket.acquire():
+                    TELEGRAM_THROTTLED.labels(method_name, "chat").inc()
+                if self.bucket is not None and await self.bucket.acquire():
+                    TELEGRAM_THROTTLED.labels(method_name, "global").inc()
+            try:
+                return await super().make_request(bot, method, timeout)
+            except TelegramRetryAfter as e:
+                if chat_bucket is not None:
+                    chat_bucket.pause(e.retry_after)
+                if self.bucket is not None:
+                    self.bucket.pause(e.retry_after)
+                if attempt == self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                logger.warning(f"Flood control on {method_name}, retry in {e.retry_after}s")
+                TELEGRAM_RETRIES.labels(method_name).inc()
+                if not limited or (chat_bucket is None and self.bucket is None):
+                    # нет bucket'а, который подождал бы за запрос
+                    await asyncio.sleep(e.retry_after)
@@ -38,6 +38,11 @@ class SelectableList(StatesGroup):
     limit : int
         Количество элементов на странице. По умолчанию 1.
 
+    cursor_pagination : bool
+        Листать страницы по курсору (id первого/последнего элемента страницы) вместо `page * limit`.
+        Тогда вместо `get_list` вызывается `get_list_by_cursor`, а ключи словаря должны быть id элементов.
+        По умолчанию False.
+
     first_message_route : Optional[Route]
         Роутер для первого сообщения. Если None — используется `route.message`.
 
@@ -63,6 +68,10 @@ class SelectableList(StatesGroup):
     - get_list(limit, offset) -> tuple[dict, int]
         Возвращает словарь элементов и общее число элементов.
 
+    - get_list_by_cursor(limit, after_id, before_id) -> tuple[dict, bool]
+        Только для `cursor_pagination = True`. Возвращает словарь элементов и признак,
+        что в направлении листания есть ещё элементы (например, `has_more` из `get_list(keyset=True)` сервиса).
+
     - get_one(pk)
         Получает элемент по ключу. Используется для валидации.
 
@@ -109,6 +118,7 @@ class SelectableList(StatesGroup):
     # params
     buttons: bool = True
     pagination: bool = True
+    cursor_pagination: bool = False
     limit: int = 10
     first_message_route: bool = False
     route: Router = None
@@ -135,6 +145,13 @@ class SelectableList(StatesGroup):
     def _parse_page(cls, data: str) -> int:
         return int(data[len(cls._page_prefix()) :])
 
+    @classmethod
+    def _parse_cursor(cls, data: str) -> tuple[int | None, int | None]:
+        cursor = data[len(cls._page_prefix()) :]
+        if cursor.startswith("b"):
+            return None, int(cursor[1:])
+        return int(cursor[1:]), None
+
     @classmethod
     def _is_page(cls, data: str) -> bool:
         return data.startswith(cls._page_prefix())
@@ -147,14 +164,21 @@ class SelectableList(StatesGroup):
 
         @first_route(*filters)
         async def start_selection(message: types.Message, state: FSMContext, bot: Bot):
-            await cls._send_page(message, state, bot, page=0)
+            if cls.cursor_pagination:
+                await cls._send_cursor_page(message, state, bot)
+            else:
+                await cls._send_page(message, state, bot, page=0)
 
         if cls.pagination:
 
             @route.callback_query(cls.select, F.data.startswith(cls._page_prefix()))
             async def paginate(callback: types.CallbackQuery, state: FSMContext, bot: Bot):
-                page = cls._parse_page(callback.data)
                 await callback.message.delete()
+                if cls.cursor_pagination:
+                    after_id, before_id = cls._parse_cursor(callback.data)
+                    await cls._send_cursor_page(callback.message, state, bot, after_id=after_id, before_id=before_id)
+                    return
+                page = cls._parse_page(callback.data)
                 await cls._send_page(callback.message, state, bot, page=page)
 
         @route.message(cls.select, ~F.data.startswith(cls._page_prefix()))
@@ -195,22 +219,45 @@ class SelectableList(StatesGroup):
 
         text = await cls.list_format_to_telegram(dict_)
 
-        keyboard = cls._build_keyboard(dict_.keys(), page, offset, total)
+        prev_data = f"{cls._page_prefix()}{page - 1}" if offset > 0 else None
+        next_data = f"{cls._page_prefix()}{page + 1}" if offset + cls.limit < total else None
+        keyboard = cls._build_keyboard(dict_.keys(), prev_data, next_data)
         await cls.respond(message, text=text, reply_markup=keyboard, parse_mode=cls.list_parse_mode)
 
         await state.set_state(cls.select)
         await state.update_data(page=page)
 
     @classmethod
-    def _build_keyboard(cls, keys, page: int, offset: int, total: int) -> InlineKeyboardMarkup | None:
+    async def _send_cursor_page(
+        cls, message: types.Message, state: FSMContext, bot: Bot, after_id: int | None = None,
+        before_id: int | None = None
+    ):
+        dict_, has_more = await cls.get_list_by_cursor(cls.limit, after_id, before_id)
+
+        text = await cls.list_format_to_telegram(dict_)
+
+        keys = list(dict_.keys())
+        prev_data = next_data = None
+        if keys:
+            has_prev = has_more if before_id is not None else after_id is not None
+            has_next = has_more if before_id is None else True
+            prev_data = f"{cls._page_prefix()}b{keys[0]}" if has_prev else None
+            next_data = f"{cls._page_prefix()}a{keys[-1]}" if has_next else None
+        keyboard = cls._build_keyboard(keys, prev_data, next_data)
+        await cls.respond(message, text=text, reply_markup=keyboard, parse_mode=cls.list_parse_mode)
+
+        await state.set_state(cls.select)
+
+    @classmethod
+    def _build_keyboard(cls, keys, prev_data: str | None, next_data: str | None) -> InlineKeyboardMarkup | None:
         keyboard = []
 
         nav_buttons = []
         if cls.pagination:
-            if offset > 0:
-                nav_buttons.append(InlineKeyboardButton(_("⬅️ Назад"), callback_data=f"{cls._page_prefix()}{page - 1}"))
-            if offset + cls.limit < total:
-                nav_buttons.append(InlineKeyboardButton(_("➡️ Далее"), callback_data=f"{cls._page_prefix()}{page + 1}"))
+            if prev_data:
+                nav_buttons.append(InlineKeyboardButton(_("⬅️ Назад"), callback_data=prev_data))
+            if next_data:
+                nav_buttons.append(InlineKeyboardButton(_("➡️ Далее"), callback_data=next_data))
 
         if cls.buttons and cls.limit <= MAX_BUTTONS_COUNT - len(nav_buttons):
             key_buttons = [InlineKeyboardButton(text=str(k), callback_data=str(k)) for k in keys]
@@ -241,6 +288,15 @@ class SelectableList(StatesGroup):
         """
         raise NotImplementedError
 
+    @staticmethod
+    async def get_list_by_cursor(limit: int, after_id: int | None, before_id: int | None) -> tuple[dict, bool]:
+        """
+        Возвращает:
+            dict: элементы {id: label} в порядке списка, label должен быть экранирован с помощью escape_markdown
+            bool: есть ли ещё элементы в направлении листания
+        """
+        raise NotImplementedError
+
     @staticmethod
     async def get_one(pk):
         raise NotImplementedError
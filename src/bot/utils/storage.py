@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+from collections.abc import AsyncIterator, Iterable, Mapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from redis.asyncio import Redis
+from redis.exceptions import NoScriptError, RedisError
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(data: Mapping[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELD = "s"
+DATA_FIELD = "d"
+VERSION_FIELD = "v"
+LEGACY_PREFIX = "fsm"
+LEGACY_PARTS = ("state", "data")
+
+# попытки записать update_data поверх данных, которые параллельно меняют другие апдейты
+FLUSH_RETRIES = 5
+
+# KEYS[1] - hash ключа FSM
+# ARGV: [1] версия данных, прочитанная в апдейте; [2] состояние: "" - не менять, "set", "del"; [3] состояние;
+# [4] данные: "" - не менять, "set" - заменить, "merge" - update_data поверх прочитанных; [5] все данные (JSON);
+# [6] ttl, 0 - без ttl
+# Возвращает 1 и ничего не пишет, если при "merge" данные после чтения изменил параллельный апдейт того же
+# пользователя (версия другая): тогда CompactRedisStorage перечитывает их, накладывает свои ключи и повторяет.
+FLUSH_SCRIPT = """
+local key = KEYS[1]
+local mode = ARGV[4]
+if mode == 'merge' and (redis.call('HGET', key, 'v') or '') ~= ARGV[1] then
+    return 1
+end
+if ARGV[2] == 'set' then
+    redis.call('HSET', key, 's', ARGV[3])
+elseif ARGV[2] == 'del' then
+    redis.call('HDEL', key, 's')
+end
+if mode ~= '' then
+    if ARGV[5] == '' then
+        redis.call('HDEL', key, 'd')
+    else
+        redis.call('HSET', key, 'd', ARGV[5])
+    end
+    redis.call('HINCRBY', key, 'v', 1)
+end
+if redis.call('HEXISTS', key, 's') == 0 and redis.call('HEXISTS', key, 'd') == 0 then
+    -- после clear() остаётся только версия, такой ключ не нужен
+    redis.call('DEL', key)
+    return 0
+end
+if tonumber(ARGV[6]) > 0 then
+    redis.call('EXPIRE', key, ARGV[6])
+end
+return 0
+"""
+FLUSH_SCRIPT_SHA = hashlib.sha1(FLUSH_SCRIPT.encode()).hexdigest()
+
+
+@dataclass
+class _Entry:
+    key: str
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    version: str = ""
+    loaded: bool = False
+    dirty_state: bool = False
+    dirty_data: bool = False
+    replaced: bool = False  # был set_data, данные пишутся целиком
+    changed: dict[str, Any] = field(default_factory=dict)  # ключи из update_data
+
+
+# буфер состояний текущего апдейта: ключ redis -> запись
+_buffer: ContextVar[dict[str, _Entry] | None] = ContextVar("fsm_buffer", default=None)
+
+
+class CompactRedisStorage(BaseStorage):
+    """
+    FSM storage: состояние и данные одного ключа лежат в одном hash (поля s и d), данные в JSON.
+
+    Ключ живёт ttl секунд с последней записи, брошенные воронки удаляются сами.
+    Внутри buffer() чтение делается один раз за апдейт (HMGET), а все изменения пишутся одним pipeline
+    при выходе (FLUSH_SCRIPT). Вне buffer() каждая запись сразу уходит в redis.
+    Апдейты одного пользователя могут обрабатываться параллельно: состояние пишет последний,
+    а изменения update_data сливаются по ключам: запись проверяет версию данных (поле v) и при
+    конфликте повторяется поверх перечитанных данных.
+    Ключи старого RedisStorage (fsm:...) переносит migrate_legacy() (python main.py fsm-migrate).
+    """
+
+    def __init__(self, redis: Redis, ttl: int | None = None, key_builder: KeyBuilder | None = None):
+        self.redis = redis
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(prefix="fsm2")
+
+    @asynccontextmanager
+    async def buffer(self) -> AsyncIterator[None]:
+        if _buffer.get() is not None:
+            yield
+            return
+        entries: dict[str, _Entry] = {}
+        token = _buffer.set(entries)
+        try:
+            yield
+        finally:
+            _buffer.reset(token)
+            try:
+                await self._flush(entries.values())
+            except RedisError as e:
+                logger.error(f"Can not save FSM state: {e}")
+
+    def _get_entry(self, key: StorageKey) -> tuple[_Entry, bool]:
+        redis_key = self.key_builder.build(key)
+        buffer = _buffer.get()
+        if buffer is None:
+            return _Entry(redis_key), False
+        entry = buffer.get(redis_key)
+        if entry is None:
+            entry = buffer[redis_key] = _Entry(redis_key)
+        return entry, True
+
+    async def _load(self, key: StorageKey) -> _Entry:
+        entry, _ = self._get_entry(key)
+        if not entry.loaded:
+            state, data, version = await self.redis.hmget(entry.key, STATE_FIELD, DATA_FIELD, VERSION_FIELD)
+            # то, что уже изменено в этом апдейте, не перетираем
+            if not entry.dirty_state:
+                entry.state = state.decode() if state else None
+            if not entry.replaced:
+                entry.data = (_loads(data) if data else {}) | entry.changed
+            entry.version = version.decode() if version else ""
+            entry.loaded = True
+        return entry
+
+    async def _flush(self, entries: Iterable[_Entry]):
+        calls: list[tuple[list, dict[str, Any]]] = []  # аргументы FLUSH_SCRIPT и ключи из update_data
+        for entry in entries:
+            if not (entry.dirty_state or entry.dirty_data):
+                continue
+            state_mode = ""
+            if entry.dirty_state:
+                state_mode = "del" if entry.state is None else "set"
+            data_mode = ""
+            if entry.dirty_data:
+                data_mode = "set" if entry.replaced or not entry.loaded else "merge"
+            args = [entry.key, entry.version, state_mode, entry.state or "", data_mode,
+                    _dumps(entry.data) if entry.data else "", self.ttl or 0]
+            calls.append((args, entry.changed))
+            entry.dirty_state = entry.dirty_data = entry.replaced = False
+            entry.changed = {}
+            entry.loaded = False  # версия после записи неизвестна, следующее чтение пойдёт в redis
+        for _ in range(FLUSH_RETRIES):
+            if not calls:
+                return
+            results = await self._run_flush([args for args, _ in calls])
+            calls = [call for call, conflict in zip(calls, results) if conflict]
+            if calls:
+                await self._rebase(calls)
+        if calls:
+            logger.error(f"Can not save FSM data of {', '.join(args[0] for args, _ in calls)}: "
+                         f"changed by concurrent updates {FLUSH_RETRIES} times")
+
+    async def _run_flush(self, calls: list[list]) -> list[int]:
+        try:
+            return await self._execute_flush(calls)
+        except NoScriptError:
+            # скрипт пропал из кеша redis (рестарт, SCRIPT FLUSH); Script из register_script в pipeline
+            # проверял бы его наличие лишним запросом при каждой записи
+            await self.redis.script_load(FLUSH_SCRIPT)
+            return await self._execute_flush(calls)
+
+    async def _execute_flush(self, calls: list[list]) -> list[int]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key, *args in calls:
+                pipe.evalsha(FLUSH_SCRIPT_SHA, 1, key, *args)
+            return await pipe.execute()
+
+    async def _rebase(self, calls: list[tuple[list, dict[str, Any]]]):
+        """Перечитывает данные, которые изменил параллельный апдейт, и накладывает на них ключи из update_data."""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for args, _ in calls:
+                pipe.hmget(args[0], DATA_FIELD, VERSION_FIELD)
+            rows = await pipe.execute()
+        for (args, changed), (data, version) in zip(calls, rows):
+            merged = (_loads(data) if data else {}) | changed
+            args[1] = version.decode() if version else ""
+            args[5] = _dumps(merged) if merged else ""
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry, buffered = self._get_entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.dirty_state = True
+        if not buffered:
+            await self._flush([entry])
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry, buffered = self._get_entry(key)
+        entry.data = dict(data)
+        entry.changed = {}
+        entry.dirty_data = entry.replaced = True
+        if not buffered:
+            await self._flush([entry])
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._load(key)).data)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        entry = await self._load(key)
+        entry.data.update(data)
+        if not entry.replaced:
+            entry.changed.update(data)
+        entry.dirty_data = True
+        if _buffer.get() is None:
+            await self._flush([entry])
+        return dict(entry.data)
+
+    async def migrate_legacy(self, batch: int = 500) -> int:
+        """
+        Переносит ключи старого RedisStorage (fsm:<chat>:<user>:state и :data, без TTL) в hash нового формата
+        и удаляет их. Hash, который уже записал новый код, не перезаписывается. Возвращает число перенесённых ключей.
+        """
+        if not isinstance(self.key_builder, DefaultKeyBuilder):
+            raise TypeError("Legacy FSM keys can be migrated only with DefaultKeyBuilder")
+        legacy: dict[str, str] = {}  # новый ключ -> ключ старого формата без :state/:data
+        migrated = 0
+        async for raw_key in self.redis.scan_iter(match=f"{LEGACY_PREFIX}:*", count=batch):
+            base, _, part = raw_key.decode().rpartition(":")
+            if part not in LEGACY_PARTS:
+                continue
+            legacy[f"{self.key_builder.prefix}{base[len(LEGACY_PREFIX):]}"] = base
+            if len(legacy) >= batch:
+                migrated += await self._migrate_batch(legacy)
+                legacy = {}
+        if legacy:
+            migrated += await self._migrate_batch(legacy)
+        return migrated
+
+    async def _migrate_batch(self, legacy: dict[str, str]) -> int:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for new_key, base in legacy.items():
+                pipe.exists(new_key).get(f"{base}:state").get(f"{base}:data")
+            results = await pipe.execute()
+        migrated = 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for i, (new_key, base) in enumerate(legacy.items()):
+                exists, state, data = results[3 * i:3 * i + 3]
+                pipe.unlink(f"{base}:state", f"{base}:data")
+                fields = {}
+                if state:
+                    fields[STATE_FIELD] = state
+                if data and _loads(data):
+                    fields[DATA_FIELD] = _dumps(_loads(data))
+                if exists or not fields:
+                    continue
+                pipe.hset(new_key, mapping=fields)
+                if self.ttl:
+                    pipe.expire(new_key, self.ttl)
+                migrated += 1
+            await pipe.execute()
+        return migrated
+
+    async def close(self) -> None:
+        # соединения принадлежат общему клиенту redis, его закрывает AppContext
+        pass
+
+
+def fsm_buffer(storage: BaseStorage):
+    """Буфер FSM на время обработки апдейта; для других storage ничего не делает."""
+    if isinstance(storage, CompactRedisStorage):
+        return storage.buffer()
+    return _noop_buffer()
+
+
+@asynccontextmanager
+async def _noop_buffer() -> AsyncIterator[None]:
+    yield
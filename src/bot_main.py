@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import traceback
 from typing import Annotated  # , Callable
@@ -6,30 +8,46 @@ import aiogram
 from aiogram import types
 from aiogram.types import BotCommand
 from fastapi import Request, APIRouter, Header
-from aiogram.fsm.storage.redis import RedisStorage
-from redis import StrictRedis
-
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+
+from src.bot.broadcast import broadcaster
+from src.bot.catalog import catalog_watcher
+from src.bot.delivery import delivery_queue
+from src.bot.documents import prewarmer
+from src.bot.payments_cleanup import payments_cleaner
+from src.bot.sales_stats import sales_stats_refresher
+from src.bot.update_queue import QueuePolicy, UpdateQueue
+from src.bot.utils.storage import fsm_buffer
 from src.config import LANGS, BOT_DESCRIPTION, COMMANDS
+from src.context import app_context
+from src.database import database
 from src.settings import settings
+from src.utils.metrics import DB_POOL, UPDATE_QUEUE, GaugesUpdater
+from src.utils.tg_messages import notifier
+from src.utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
-bot = aiogram.Bot(token=settings.bot_token)
-dp = aiogram.Dispatcher(
-    bot=bot,
-    storage=RedisStorage.from_url(settings.redis_url),
-)
-redis = None
+BOT_CONFIG_HASH_KEY = "bot_config_hash"
+BOT_CONFIG_LOCK_KEY = "bot_config_lock"
+BOT_CONFIG_HASH_TTL = 60 * 60 * 24  # раз в сутки настройки всё равно перепроверяются
+
 try:
-    redis = StrictRedis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db,
-                        password=settings.redis_password, socket_connect_timeout=600)
-    if redis.ping():
-        logger.info('Redis is accepted to connections')
-    else:
-        logger.error('Can not connect to redis')
-except Exception as e:
-    logger.error(f"Can not connect to redis: {e}")
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as WebhookResponse
+except ImportError:
+    WebhookResponse = JSONResponse
+
+update_queue = UpdateQueue(
+    workers=settings.webhook_workers,
+    size=settings.webhook_queue_size,
+    policy=QueuePolicy(settings.webhook_queue_policy),
+    put_timeout=settings.webhook_queue_put_timeout,
+)
 
+gauges_updater = GaugesUpdater(interval=settings.metrics_update_interval)
 
 webhook_router = APIRouter()
 
@@ -39,12 +57,92 @@ def get_menu(lang: str, debug: bool = False) -> list[BotCommand]:
     return commands
 
 
-async def bot_startup():
+async def bot_startup(configure: bool = True, workers: bool = True):
+    """
+    configure=False - не трогать вебхук, команды и хеш настроек в redis.
+    workers=False - не запускать фоновые задачи (доставка, очистка платежей, статистика продаж, рассылка,
+    слежение за каталогом), каталог только загружается. Оба выключаются в нагрузочном тесте.
+    """
+    bot = app_context.bot
+    await app_context.connect()
+    notifier.start(bot)
+    tracer.start()
+    if workers:
+        await catalog_watcher.start()
+        await delivery_queue.start(bot)
+        payments_cleaner.start()
+        sales_stats_refresher.start()
+        await broadcaster.resume(bot)
+    else:
+        await catalog_watcher.reload()
+    if settings.webhook_async_mode:
+        update_queue.start(bot, app_context.dp)
+    gauges = [(DB_POOL, database.pool_stats)]
+    if settings.webhook_async_mode:
+        gauges.append((UPDATE_QUEUE, update_queue.stats))
+    gauges_updater.start(gauges)
+
+    if not configure:
+        return
+    try:
+        await configure_bot()
+    except Exception:
+        logger.exception("Can't configure bot")
+
+
+def get_bot_config_hash(full_url: str) -> str:
+    config = {
+        "url": full_url,
+        "secret": settings.bot_webhook_secret,
+        "max_connections": 40 if settings.debug else 100,
+        "commands": {lang: [c.model_dump() for c in get_menu(lang)] for lang in LANGS.keys()},
+        "description": BOT_DESCRIPTION,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+async def configure_bot():
+    """
+    Регистрирует вебхук, команды и описание бота.
 
+    При нескольких воркерах настройку выполняет только тот, кто взял лок в redis, а если хеш
+    настроек не изменился с прошлого запуска, запросы к Bot API не делаются вовсе.
+    """
     full_url = urljoin(settings.bot_webhook_url, settings.bot_webhook_path)
+    config_hash = get_bot_config_hash(full_url)
+    lock = None
+    try:
+        redis = app_context.redis
+        if await redis.get(BOT_CONFIG_HASH_KEY) == config_hash.encode():
+            logger.info("Bot config is not changed, skip configuration")
+            return
+        lock = redis.lock(BOT_CONFIG_LOCK_KEY, timeout=60, blocking=False)
+        if not await lock.acquire():
+            logger.info("Bot is configured by another worker")
+            return
+    except RedisError as e:
+        logger.warning(f"Can not check bot config in redis, configure anyway: {e}")
+        lock = None
+
+    try:
+        if await set_webhook_and_commands(full_url) and lock is not None:
+            await redis.set(BOT_CONFIG_HASH_KEY, config_hash, ex=BOT_CONFIG_HASH_TTL)
+    except RedisError as e:
+        logger.warning(f"Can not save bot config hash: {e}")
+    finally:
+        if lock is not None:
+            try:
+                await lock.release()
+            except RedisError as e:
+                logger.warning(f"Can not release bot config lock: {e}")
+
+
+async def set_webhook_and_commands(full_url: str) -> bool:
+    bot = app_context.bot
+    success = True
     try:
         webhook_info = await bot.get_webhook_info()
-        logger.error(webhook_info)
+        logger.info(webhook_info)
         if webhook_info.url != full_url:
             logger.info(f"Change webhook URL to {full_url}")
             res = await bot.set_webhook(
@@ -53,7 +151,7 @@ async def bot_startup():
                 drop_pending_updates=webhook_info.pending_update_count > 0,
                 max_connections=40 if settings.debug else 100,
             )
-            logger.error(res)
+            logger.info(res)
         else:
             logger.info(f"Webhook URL already set to {full_url}")
 
@@ -65,36 +163,90 @@ async def bot_startup():
                     commands=commands, language_code=lang, scope=aiogram.types.BotCommandScopeAllPrivateChats()
                 )
             except Exception as e:
+                success = False
                 logger.error(f"Can't set commands {lang} - {e}")
 
             try:
                 logger.debug(f"Order desc = {BOT_DESCRIPTION}, lang={lang}")
                 await bot.set_my_description(description=BOT_DESCRIPTION, language_code=lang)
             except Exception as e:
+                success = False
                 logger.error(f"Can't set not description {lang} - {e}")
 
     except Exception:
         logger.exception("Can't register webhook")
+        return False
+    return success
 
 
 async def bot_shutdown():
     try:
-        if bot.session:
-            await bot.session.close()
+        await gauges_updater.stop()
     except Exception:
-        logger.exception("Error while close bot session")
+        logger.exception("Error while stop gauges updater")
+    if settings.webhook_async_mode:
+        try:
+            await update_queue.stop()
+        except Exception:
+            logger.exception("Error while stop update queue")
+    try:
+        await broadcaster.stop()
+    except Exception:
+        logger.exception("Error while stop broadcast")
+    try:
+        await prewarmer.stop()
+    except Exception:
+        logger.exception("Error while stop prewarm")
+    try:
+        await delivery_queue.stop()
+    except Exception:
+        logger.exception("Error while stop delivery queue")
+    try:
+        await payments_cleaner.stop()
+    except Exception:
+        logger.exception("Error while stop payments cleaner")
+    try:
+        await sales_stats_refresher.stop()
+    except Exception:
+        logger.exception("Error while stop sales stats refresher")
+    try:
+        await catalog_watcher.stop()
+    except Exception:
+        logger.exception("Error while stop catalog watcher")
+    try:
+        await notifier.stop()
+    except Exception:
+        logger.exception("Error while stop notifier")
+    try:
+        await tracer.stop()
+    except Exception:
+        logger.exception("Error while stop tracer")
+    await app_context.close()
 
 
-@webhook_router.post(settings.bot_webhook_path)
+@webhook_router.post(settings.bot_webhook_path, response_class=WebhookResponse)
 async def bot_webhook(
-    r: Request, update: dict, x_telegram_bot_api_secret_token: Annotated[str | None, Header()] = None
+    r: Request, x_telegram_bot_api_secret_token: Annotated[str | None, Header()] = None
 ) -> None:
     if x_telegram_bot_api_secret_token != settings.bot_webhook_secret:
         logger.error("Wrong secret token in webhook!")
         return {"status": "error", "message": "Wrong secret token!"}
-    telegram_update = types.Update(**update)
+    # апдейт валидируется один раз прямо из байтов запроса, без промежуточного dict
     try:
-        await dp.feed_webhook_update(bot=bot, update=telegram_update)
-    except Exception:
-        logger.error(traceback.format_exc())
-    return {"status": "done"}
+        telegram_update = types.Update.model_validate_json(await r.body(), context={"bot": app_context.bot})
+    except ValidationError as e:
+        logger.error(f"Can not parse update: {e}")
+        return {"status": "error", "message": "Invalid update"}
+    with tracer.start_trace("bot_webhook", telegram_update.update_id):
+        if settings.webhook_async_mode:
+            if not await update_queue.put(telegram_update):
+                # телеграм повторит доставку апдейта позже
+                return JSONResponse(status_code=503, content={"status": "error", "message": "Update queue is full"})
+            return {"status": "queued"}
+        try:
+            with tracer.span("dp.feed_webhook_update"):
+                async with fsm_buffer(app_context.dp.storage):
+                    await app_context.dp.feed_webhook_update(bot=app_context.bot, update=telegram_update)
+        except Exception:
+            logger.error(traceback.format_exc())
+        return {"status": "done"}
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+
+import aiogram
+from aiogram.client.telegram import TelegramAPIServer
+from redis.asyncio import Redis
+
+from src.bot.utils.session import ThrottledSession
+from src.database import Database, database
+from src.redis_client import close_redis, get_redis
+from src.settings import settings
+from src.utils.metrics import TelegramMetricsMiddleware, setup_dispatcher_metrics
+from src.utils.tracing import setup_bot_tracing, setup_dispatcher_tracing
+
+logger = logging.getLogger(__name__)
+
+
+class AppContext:
+    """
+    Ресурсы приложения: Bot, Dispatcher, redis и БД.
+
+    Ничего не создаётся при импорте: объекты строятся при первом обращении (в lifespan или в CLI команде)
+    и закрываются в close(), поэтому импорт модулей с хендлерами не открывает сетевых соединений.
+    """
+
+    def __init__(self):
+        self._bot: aiogram.Bot | None = None
+        self._dp: aiogram.Dispatcher | None = None
+
+    @property
+    def bot(self) -> aiogram.Bot:
+        if self._bot is None:
+            api = {"api": TelegramAPIServer.from_base(settings.bot_api_url)} if settings.bot_api_url else {}
+            session = ThrottledSession(
+                rate=settings.bot_api_rate,
+                chat_rate=settings.bot_api_chat_rate,
+                chat_burst=settings.bot_api_chat_burst,
+                group_rate=settings.bot_api_group_rate,
+                max_retries=settings.bot_api_max_retries,
+                max_retry_after=settings.bot_api_max_retry_after,
+                limit=settings.bot_api_connection_limit,
+                keepalive_timeout=settings.bot_api_keepalive_timeout,
+                **api,
+            )
+            self._bot = aiogram.Bot(token=settings.bot_token, session=session)
+            self._bot.session.middleware(TelegramMetricsMiddleware())
+            setup_bot_tracing(self._bot)
+        return self._bot
+
+    @property
+    def dp(self) -> aiogram.Dispatcher:
+        if self._dp is None:
+            self._dp = self._create_dispatcher()
+        return self._dp
+
+    @property
+    def redis(self) -> Redis:
+        return get_redis()
+
+    @property
+    def database(self) -> Database:
+        return database
+
+    def _create_dispatcher(self) -> aiogram.Dispatcher:
+        # хендлеры импортируются только при создании диспетчера
+        from src.bot.admin_states import admin_router
+        from src.bot.payment_result import payment_result_router
+        from src.bot.purchase_pack import purchase_router
+        from src.bot.utils.storage import CompactRedisStorage
+        from src.bot.utils.middlewares import DbSessionMiddleware, ThrottlingMiddleware, registered_commands
+
+        dp = aiogram.Dispatcher(bot=self.bot, storage=CompactRedisStorage(self.redis, ttl=settings.fsm_ttl))
+        setup_dispatcher_metrics(dp)
+        setup_dispatcher_tracing(dp)
+        dp.update.outer_middleware(DbSessionMiddleware())
+        dp.include_router(payment_result_router)
+        dp.include_router(purchase_router)
+        dp.include_router(admin_router)
+        throttling = ThrottlingMiddleware(
+            rate=settings.throttle_rate,
+            burst=settings.throttle_burst,
+            dedup_window=settings.callback_dedup_window,
+            limits={"buy_pack": (settings.throttle_buy_rate, settings.throttle_buy_burst)},
+            commands=registered_commands(dp),
+        )
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+        return dp
+
+    async def connect(self) -> bool:
+        """Проверяет соединения с redis и БД, не дольше redis_connect_timeout/db_connect_timeout секунд."""
+        ready = True
+        try:
+            await asyncio.wait_for(self.redis.ping(), timeout=settings.redis_connect_timeout)
+            logger.info('Redis is accepted to connections')
+        except Exception as e:
+            ready = False
+            logger.error(f"Can not connect to redis: {e!r}")
+        try:
+            async with asyncio.timeout(settings.db_connect_timeout):
+                async with self.database.engine.connect():
+                    pass
+            logger.info('Database is accepted to connections')
+        except Exception as e:
+            ready = False
+            logger.error(f"Can not connect to database: {e!r}")
+        return ready
+
+    async def close(self):
+        if self._bot is not None:
+            try:
+                await self._bot.session.close()
+            except Exception:
+                logger.exception("Error while close bot session")
+            self._bot = None
+        self._dp = None
+        try:
+            await close_redis()
+        except Exception:
+            logger.exception("Error while close redis")
+        try:
+            await self.database.dispose()
+        except Exception:
+            logger.exception("Error while close database")
+
+
+app_context = AppContext()
@@ -1,33 +1,129 @@
 import logging
+import os
+import sys
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from urllib.parse import urlparse, urlunparse
+
+import greenlet
 from sqlalchemy import NullPool, AsyncAdaptedQueuePool, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import DeclarativeBase
 
 from src.settings import settings
+from src.utils.metrics import DB_POOL_SLOW_CHECKOUTS, DB_POOL_TIMEOUTS, DB_POOL_WAIT
+from src.utils.tracing import setup_engine_tracing
 
 logger = logging.getLogger(__name__)
 
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES_DIR = os.path.join(SRC_DIR, "services")
+
+
+def _find_caller() -> str:
+    """
+    Ищет метод сервиса, который запросил соединение: самый внешний кадр из services, то есть метод,
+    вызванный хендлером, а не его внутренние помощники вроде _count.
+
+    Пул вызывается из greenlet'а sqlalchemy, а корутины сервиса лежат в стеке родительского greenlet'а,
+    поэтому стеки обходятся по цепочке parent.
+    """
+    caller = None
+    fallback = "unknown"
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(SERVICES_DIR):
+                caller = f"{os.path.basename(filename)}:{frame.f_code.co_qualname}"
+            elif caller is None and fallback == "unknown" and filename.startswith(SRC_DIR) and filename != __file__:
+                fallback = f"{os.path.relpath(filename, SRC_DIR)}:{frame.f_code.co_qualname}"
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return caller or fallback
+        frame = current.gr_frame
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который пишет время ожидания соединения в метрики и в лог медленные checkout."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            logger.error(f"DB pool checkout timeout, caller {_find_caller()}, {self.status()}")
+            raise
+        wait = time.perf_counter() - start
+        DB_POOL_WAIT.observe(wait)
+        if wait >= settings.db_pool_slow_checkout:
+            DB_POOL_SLOW_CHECKOUTS.inc()
+            logger.warning(f"Slow DB pool checkout {wait:.3f}s, caller {_find_caller()}, {self.status()}")
+        return connection
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "in_use": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+        }
+
 
 class Database:
-    engine: AsyncEngine
+    """Движок и пул соединений создаются при первом обращении, то есть уже в процессе воркера."""
 
     def __init__(self):
+        self._engine: AsyncEngine | None = None
+        self._session_maker: async_sessionmaker[AsyncSession] | None = None
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = self._create_engine()
+        return self._engine
+
+    @staticmethod
+    def _create_engine() -> AsyncEngine:
         db_connect_url: str = settings.db_url
         if settings.environment == "test":
-            self.engine = create_async_engine(db_connect_url, poolclass=NullPool, echo=False)
-        else:
-            self.engine = create_async_engine(
-                db_connect_url,
-                pool_size=5,
-                max_overflow=5,
-                poolclass=AsyncAdaptedQueuePool,
-                echo=settings.echo_sql,
-                echo_pool=False,
-            )
+            return create_async_engine(db_connect_url, poolclass=NullPool, echo=False)
+        engine = create_async_engine(
+            db_connect_url,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            poolclass=InstrumentedPool,
+            connect_args={"prepared_statement_cache_size": settings.db_statement_cache_size},
+            echo=settings.echo_sql,
+            echo_pool=False,
+        )
+        setup_engine_tracing(engine)
+        return engine
 
     def get_session_maker(self) -> async_sessionmaker[AsyncSession]:
-        return async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+        if self._session_maker is None:
+            self._session_maker = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+        return self._session_maker
+
+    def pool_stats(self) -> dict[str, int]:
+        if self._engine is None or not isinstance(self._engine.pool, InstrumentedPool):
+            return {}
+        return self._engine.pool.stats()
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+        self._engine = None
+        self._session_maker = None
 
 
 class Base(DeclarativeBase):
@@ -35,4 +131,69 @@ class Base(DeclarativeBase):
 
 
 database = Database()
-session_maker = database.get_session_maker()
+
+
+def session_maker() -> AsyncSession:
+    return database.get_session_maker()()
+
+
+# общая сессия текущего unit_of_work, её используют все сервисы внутри
+current_session: ContextVar[AsyncSession | None] = ContextVar("current_session", default=None)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    Одна сессия и одна транзакция на блок кода (например, на обработку апдейта).
+
+    Соединение берётся из пула при первом запросе, коммит делается один раз в конце, при ошибке - rollback.
+    Вложенный unit_of_work использует уже открытую сессию.
+    """
+    shared = current_session.get()
+    if shared is not None:
+        yield shared
+        return
+    session = session_maker()
+    token = current_session.set(session)
+    try:
+        yield session
+        await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        current_session.reset(token)
+        await session.close()
+    await _run_after_commit_callbacks(session)
+
+
+@asynccontextmanager
+async def savepoint() -> AsyncIterator[None]:
+    """
+    SAVEPOINT в текущем unit_of_work для вызовов, после ошибки которых (SqlError) работа продолжается.
+
+    Без него PostgreSQL считает транзакцию прерванной, и все следующие запросы апдейта падают.
+    Стоит двух лишних запросов (SAVEPOINT и RELEASE), поэтому только там, где ошибку обрабатывают. Вне unit_of_work
+    у каждого вызова сервиса своя транзакция и ничего не делается.
+    """
+    session = current_session.get()
+    if session is None:
+        yield
+        return
+    async with session.begin_nested():
+        yield
+
+
+async def _run_after_commit_callbacks(session: AsyncSession):
+    callbacks = session.info.pop("after_commit", [])
+    for callback in callbacks:
+        await callback()
+
+
+async def run_after_commit(callback: Callable[[], Awaitable]):
+    """Выполняет callback после коммита текущего unit_of_work, а вне его - сразу."""
+    session = current_session.get()
+    if session is None:
+        await callback()
+    else:
+        session.info.setdefault("after_commit", []).append(callback)
@@ -0,0 +1,43 @@
+from src.database import Base
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Boolean, ForeignKey, Integer, String, Text, inspect
+from datetime import datetime
+from sqlalchemy import TIMESTAMP, func
+
+
+class CategoryModel(Base):
+    __tablename__ = "categories"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(length=64), nullable=False, unique=True)
+    position: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), onupdate=func.now(), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
+
+    def to_dict(self) -> dict:
+        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
+
+
+class MusicPackModel(Base):
+    __tablename__ = "music_packs"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    category_id: Mapped[int] = mapped_column(ForeignKey("categories.id"), index=True, nullable=False)
+    human_name: Mapped[str] = mapped_column(String(length=100), nullable=False)
+    name: Mapped[str] = mapped_column(String(length=100), nullable=False, unique=True)
+    cost: Mapped[int] = mapped_column(Integer, nullable=False)  # в копейках
+    file_name: Mapped[str] = mapped_column(String(length=255), nullable=False)
+    description: Mapped[str] = mapped_column(Text, nullable=False, server_default="")
+    track_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    document_id: Mapped[str] = mapped_column(String(length=255), nullable=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="true")
+    position: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), onupdate=func.now(), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
+
+    def to_dict(self) -> dict:
+        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
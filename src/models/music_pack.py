@@ -15,6 +15,7 @@ class MusicPack:
     def __init__(self, id: int, human_name: str, cost: int, file_name: str, description: str, track_count: int,
                  document_id: str | None = None):
         '''cost указывается и сохраняется в копейках'''
+        self.id = id
         self.human_name = human_name
         self.cost = cost
         self.file_name = file_name
@@ -49,18 +50,3 @@ HOUSE_packs: list = [
 Categories_dict = {Categories.DnB.value: {p.name: p for p in DNB_packs},
                    Categories.House.value: {p.name: p for p in HOUSE_packs}}
 
-
-def get_pack_by_name_or_category(pack_or_category_name: str) -> MusicPack | dict[str, MusicPack] | None:
-    if pack_or_category_name in Categories_dict:
-        return Categories_dict.get(pack_or_category_name)
-    for cat_name, packs_dict in Categories_dict.items():
-        if pack_or_category_name in packs_dict:
-            return packs_dict.get(pack_or_category_name)
-
-
-def get_pack_price(pack_name: str | None):
-    if pack_name:
-        pack: MusicPack = get_pack_by_name_or_category(pack_name)
-        if pack and isinstance(pack, MusicPack):
-            return pack.cost
-    return 0
@@ -1,6 +1,6 @@
 from src.database import Base
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Integer, inspect
+from sqlalchemy import ForeignKey, String, Integer, Index, inspect
 from datetime import datetime
 from sqlalchemy import TIMESTAMP, func
 
@@ -10,13 +10,40 @@ class PaymentsModel(Base):
     __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[str] = mapped_column(String(length=32), index=True, nullable=False)
+    user_id: Mapped[str] = mapped_column(String(length=32), nullable=False)
     status: Mapped[str] = mapped_column(String(length=10), nullable=True)
     transaction_id: Mapped[str] = mapped_column(String(length=32), nullable=True)
     pack_name: Mapped[str] = mapped_column(String(length=100), nullable=False)
+    # из successful_payment, по нему отсекаются повторные доставки апдейта
+    telegram_payment_charge_id: Mapped[str] = mapped_column(String(length=128), nullable=True, index=True,
+                                                            unique=True)
 
     updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), onupdate=func.now(), nullable=True)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_payments_user_id_status_created_at", user_id, status, created_at.desc()),
+        Index("ix_payments_started_created_at", created_at, postgresql_where=status == "started"),
+    )
+
+    def to_dict(self) -> dict:
+        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
+
+
+class PaymentEventsModel(Base):
+    """Журнал переходов платежа: строки только добавляются, в той же транзакции, что и смена статуса."""
+
+    __tablename__ = "payment_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    payment_id: Mapped[int] = mapped_column(Integer, ForeignKey("payments.id", ondelete="CASCADE"), nullable=False,
+                                            index=True)
+    event: Mapped[str] = mapped_column(String(length=20), nullable=False)
+    from_status: Mapped[str] = mapped_column(String(length=10), nullable=True)
+    to_status: Mapped[str] = mapped_column(String(length=10), nullable=False)
+    external_id: Mapped[str] = mapped_column(String(length=128), nullable=True)  # id pre_checkout или charge id
+
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
+
     def to_dict(self) -> dict:
         return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
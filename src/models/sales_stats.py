@@ -0,0 +1,45 @@
+from datetime import date
+
+from sqlalchemy import Date, Integer, BigInteger, String, inspect
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.database import Base
+
+# материализованные представления создаются миграцией 0010, autogenerate их пропускает
+VIEW_INFO = {"is_view": True}
+
+
+class SalesDailyModel(Base):
+    """Воронка и выручка по дням создания платежа."""
+
+    __tablename__ = "sales_daily"
+    __table_args__ = {"info": VIEW_INFO}
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    started: Mapped[int] = mapped_column(Integer)
+    checkout: Mapped[int] = mapped_column(Integer)
+    paid: Mapped[int] = mapped_column(Integer)
+    delivered: Mapped[int] = mapped_column(Integer)
+    expired: Mapped[int] = mapped_column(Integer)
+    revenue: Mapped[int] = mapped_column(BigInteger)  # в копейках
+
+    def to_dict(self) -> dict:
+        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
+
+
+class SalesByPackModel(Base):
+    """Воронка и выручка по пакам за всё время."""
+
+    __tablename__ = "sales_by_pack"
+    __table_args__ = {"info": VIEW_INFO}
+
+    pack_name: Mapped[str] = mapped_column(String(length=100), primary_key=True)
+    started: Mapped[int] = mapped_column(Integer)
+    checkout: Mapped[int] = mapped_column(Integer)
+    paid: Mapped[int] = mapped_column(Integer)
+    delivered: Mapped[int] = mapped_column(Integer)
+    expired: Mapped[int] = mapped_column(Integer)
+    revenue: Mapped[int] = mapped_column(BigInteger)
+
+    def to_dict(self) -> dict:
+        return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
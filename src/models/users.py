@@ -1,5 +1,5 @@
 from src.database import Base
-from sqlalchemy import BigInteger, String, inspect
+from sqlalchemy import BigInteger, Boolean, String, false, inspect
 from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime
 from sqlalchemy import TIMESTAMP, func
@@ -13,8 +13,10 @@ class Users(Base):
     username: Mapped[str] = mapped_column(String(32), nullable=False)
     name: Mapped[str] = mapped_column(String(64), nullable=True)
     surname: Mapped[str] = mapped_column(String(64), nullable=True)
-    tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    tg_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True, unique=True)
     chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # пользователь заблокировал бота, рассылки ему не отправляются
+    is_blocked: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=false())
 
     updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), onupdate=func.now(), nullable=True)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=False), nullable=False, server_default=func.now())
@@ -0,0 +1,69 @@
+import logging
+import time
+
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from src.settings import settings
+from src.utils.metrics import REDIS_DURATION, REDIS_ERRORS
+
+logger = logging.getLogger(__name__)
+
+_redis: Redis | None = None
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception as e:
+            REDIS_ERRORS.labels("PIPELINE", type(e).__name__).inc()
+            raise
+        finally:
+            REDIS_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+class InstrumentedRedis(Redis):
+    """Клиент redis, который пишет время и ошибки команд в метрики."""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper() if args else "UNKNOWN"
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception as e:
+            REDIS_ERRORS.labels(command, type(e).__name__).inc()
+            raise
+        finally:
+            REDIS_DURATION.labels(command).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def get_redis_url() -> str:
+    if settings.redis_url:
+        return settings.redis_url
+    host = settings.redis_host or "localhost"
+    port = settings.redis_port or 6379
+    return f"redis://:{settings.redis_password}@{host}:{port}/{settings.redis_db}"
+
+
+def get_redis() -> Redis:
+    """
+    Клиент redis процесса. Один пул соединений используют и сервисы, и FSM storage диспетчера.
+    Пул создаётся при первом обращении, соединения открываются по мере надобности.
+    """
+    global _redis
+    if _redis is None:
+        pool = ConnectionPool.from_url(get_redis_url(), socket_connect_timeout=settings.redis_connect_timeout)
+        _redis = InstrumentedRedis(connection_pool=pool)
+    return _redis
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose(close_connection_pool=True)
+    _redis = None
@@ -0,0 +1,67 @@
+from functools import partial
+from typing import Annotated
+
+from pydantic import AfterValidator, BaseModel, Field
+
+# callback_data кнопок каталога (src/bot/catalog.py) - не больше 64 байт вместе с префиксом,
+# кириллица занимает 2 байта на символ
+CALLBACK_DATA_LIMIT = 64
+CATEGORY_CALLBACK_PREFIX = "pack_category_"
+PACK_CALLBACK_PREFIXES = ("pack_name_", "buy_pack_")
+
+
+def _fits_callback_data(prefixes: tuple[str, ...], value: str | None) -> str | None:
+    if value is None:
+        return value
+    for prefix in prefixes:
+        size = len(f"{prefix}{value}".encode())
+        if size > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data {prefix}<name> takes {size} bytes, Telegram allows {CALLBACK_DATA_LIMIT}")
+    return value
+
+
+CategoryName = Annotated[
+    str, Field(max_length=64), AfterValidator(partial(_fits_callback_data, (CATEGORY_CALLBACK_PREFIX,)))
+]
+PackName = Annotated[
+    str, Field(max_length=100), AfterValidator(partial(_fits_callback_data, PACK_CALLBACK_PREFIXES))
+]
+
+
+class CreateCategorySchema(BaseModel):
+    name: CategoryName
+    position: int = 0
+
+
+class CategorySchema(CreateCategorySchema):
+    id: int
+
+
+class CreateMusicPackSchema(BaseModel):
+    category_id: int
+    human_name: str = Field(max_length=100)
+    name: PackName
+    cost: int
+    file_name: str = Field(max_length=255)
+    description: str = ""
+    track_count: int
+    document_id: str | None = Field(max_length=255, default=None)
+    is_active: bool = True
+    position: int = 0
+
+
+class UpdateMusicPackSchema(BaseModel):
+    category_id: int | None = None
+    human_name: str | None = Field(max_length=100, default=None)
+    name: PackName | None = None
+    cost: int | None = None
+    file_name: str | None = Field(max_length=255, default=None)
+    description: str | None = None
+    track_count: int | None = None
+    document_id: str | None = Field(max_length=255, default=None)
+    is_active: bool | None = None
+    position: int | None = None
+
+
+class MusicPackSchema(CreateMusicPackSchema):
+    id: int
@@ -6,8 +6,9 @@ db_model_type = TypeVar('DBModelType')
 
 
 class PagesSchema(BaseModel):
-    total: int
+    total: int | None = None
     data: list[db_model_type]
+    has_more: bool | None = None
 
     def __init__(self, **kwargs):
         db_model_type = kwargs.get("type")
@@ -17,6 +18,6 @@ class PagesSchema(BaseModel):
         data = kwargs.get("data")
         data = [db_model_type(**d) for d in data]
 
-        super().__init__(total=total, data=data)
+        super().__init__(total=total, data=data, has_more=kwargs.get("has_more"))
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -5,7 +5,9 @@ from enum import Enum
 class PaymentStatus(Enum):
     payment_started = "started"
     transaction_created = "tr_created"
+    paid = "paid"  # пришёл successful_payment, пак ещё не доставлен
     transaction_completed = "tr_complet"
+    expired = "expired"  # счёт так и не оплатили
 
 
 class CreatePaymentsSchema(BaseModel):
@@ -15,6 +17,18 @@ class CreatePaymentsSchema(BaseModel):
     pack_name: str
 
 
+PAYABLE_STATUSES = [PaymentStatus.payment_started, PaymentStatus.transaction_created, PaymentStatus.expired]
+PAID_STATUSES = [PaymentStatus.paid, PaymentStatus.transaction_completed]
+
+
+class PaymentEvent(Enum):
+    created = "created"
+    pre_checkout = "pre_checkout"
+    paid = "paid"
+    delivered = "delivered"
+    expired = "expired"
+
+
 class UpdatePaymentsSchema(BaseModel):
     user_id: str | None = None
     status: str | None = None
@@ -24,3 +38,4 @@ class UpdatePaymentsSchema(BaseModel):
 
 class PaymentsSchema(CreatePaymentsSchema):
     id: int
+    telegram_payment_charge_id: str | None = None
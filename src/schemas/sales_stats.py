@@ -0,0 +1,43 @@
+from datetime import date, datetime
+
+from pydantic import BaseModel, computed_field
+
+
+class SalesFunnelSchema(BaseModel):
+    started: int = 0  # выставлено счетов
+    checkout: int = 0  # дошли до pre_checkout
+    paid: int = 0
+    delivered: int = 0
+    expired: int = 0
+    revenue: int = 0  # в копейках, по текущей цене пака
+
+    @computed_field
+    @property
+    def checkout_rate(self) -> float:
+        return round(self.checkout / self.started, 4) if self.started else 0.0
+
+    @computed_field
+    @property
+    def payment_rate(self) -> float:
+        return round(self.paid / self.checkout, 4) if self.checkout else 0.0
+
+    @computed_field
+    @property
+    def conversion(self) -> float:
+        return round(self.paid / self.started, 4) if self.started else 0.0
+
+
+class SalesDailySchema(SalesFunnelSchema):
+    day: date
+
+
+class SalesByPackSchema(SalesFunnelSchema):
+    pack_name: str
+
+
+class SalesReportSchema(BaseModel):
+    days: list[SalesDailySchema]
+    packs: list[SalesByPackSchema]
+    period: SalesFunnelSchema  # сумма по days
+    total: SalesFunnelSchema  # сумма по packs, за всё время
+    refreshed_at: datetime | None = None
@@ -22,6 +22,7 @@ class MassUpdateUserSchema(UpdateUserSchema):
 
 class UserSchema(CreateUserSchema):
     id: int
+    is_blocked: bool = False
     created_at: datetime
     updated_at: datetime | None = None
 
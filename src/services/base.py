@@ -1,4 +1,6 @@
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Callable, Sequence
+from contextlib import asynccontextmanager
+from enum import Enum
 from typing import Any
 
 import sqlalchemy
@@ -11,54 +13,100 @@ from sqlalchemy.exc import (
     NoResultFound,
     StatementError,
 )
-from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing_extensions import override
 
-from src.database import Base, session_maker
-from sqlalchemy import desc, asc, Select, insert, update, select, delete, func
+from src.database import Base, current_session, session_maker
+from sqlalchemy import desc, asc, Select, insert, update, select, delete, func, text, or_, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from src.services.exceptions import SqlError, NotFoundError, UniqueRecordError
+from src.utils.metrics import observe_db
+
+
+class CountMode(Enum):
+    exact = "exact"  # select count(*) по запросу с фильтрами
+    estimated = "estimated"  # оценка размера всей таблицы из pg_class.reltuples, фильтры не учитываются
+    none = "none"  # не считать total
 
 
 class BaseService:
     db_model: Base
-    db_session: async_sessionmaker[AsyncSession]
+    db_session: Callable[[], AsyncSession]
 
     def __init__(self):
         # свой session_maker для каждого сервиса
         self.db_session = session_maker
 
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Сессия для запроса сервиса.
+
+        Внутри unit_of_work (например, в хендлере апдейта) возвращается общая сессия, коммит делает unit_of_work;
+        если после SqlError хендлер продолжает работу, вызов нужно обернуть в database.savepoint().
+        Вне её открывается своя сессия с транзакцией, которая коммитится при выходе.
+        """
+        shared = current_session.get()
+        if shared is not None:
+            yield shared
+            return
+        async with self.db_session() as session:
+            async with session.begin():
+                yield session
+
     @override
+    @observe_db
     async def create(self, schema: dict) -> dict:
         stmt = insert(self.db_model).values(schema).returning(self.db_model)
-        async with self.db_session() as session:
-            async with session.begin():
-                try:
-                    result = (await session.execute(stmt)).scalar_one()
-                    await session.commit()
-                except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
-                    if isinstance(error.orig.__cause__, UniqueViolationError):
-                        raise UniqueRecordError(error)
-                    raise SqlError(error)
+        async with self.session() as session:
+            try:
+                result = (await session.execute(stmt)).scalar_one()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                if isinstance(error.orig.__cause__, UniqueViolationError):
+                    raise UniqueRecordError(error)
+                raise SqlError(error)
+
+            return result.to_dict()
+
+    @override
+    @observe_db
+    async def upsert(self, schema: dict, conflict_fields: list[str]) -> dict:
+        stmt = pg_insert(self.db_model).values(schema)
+        update_fields = {k: stmt.excluded[k] for k in schema if k not in conflict_fields}
+        if "updated_at" in self.db_model.__table__.columns:
+            update_fields["updated_at"] = func.now()
+        stmt = (
+            stmt.on_conflict_do_update(index_elements=conflict_fields, set_=update_fields)
+            .returning(self.db_model)
+            .execution_options(populate_existing=True)
+        )
+        async with self.session() as session:
+            try:
+                result = (await session.execute(stmt)).scalar_one()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                if isinstance(error.orig.__cause__, UniqueViolationError):
+                    raise UniqueRecordError(error)
+                raise SqlError(error)
 
             return result.to_dict()
 
     @override
+    @observe_db
     async def mass_create(self, schemas: list[dict]) -> list[dict]:
         stmt = insert(self.db_model).values(schemas).returning(self.db_model)
-        async with self.db_session() as session:
-            async with session.begin():
-                try:
-                    results = (await session.execute(stmt)).scalars().all()
-                    await session.commit()
-                except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
-                    if isinstance(error.orig.__cause__, UniqueViolationError):
-                        raise UniqueRecordError(error)
-                    raise SqlError(error)
+        async with self.session() as session:
+            try:
+                results = (await session.execute(stmt)).scalars().all()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                if isinstance(error.orig.__cause__, UniqueViolationError):
+                    raise UniqueRecordError(error)
+                raise SqlError(error)
 
             return [r.to_dict() for r in results]
 
     @override
+    @observe_db
     async def update(self, filter_: dict[str, Any], schema: dict) -> dict:
         stmt = (
             update(self.db_model)
@@ -66,39 +114,39 @@ class BaseService:
             .returning(self.db_model)
         )
         update_stmt = self._prepare_query_str(stmt, filter_=filter_)
-        async with self.db_session() as session:
-            async with session.begin():
-                try:
-                    result = (await session.execute(update_stmt)).scalars()
-                    await session.commit()
-                except NoResultFound as error:
-                    raise NotFoundError(error)
-                except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
-                    if isinstance(error.orig.__cause__, UniqueViolationError):
-                        raise UniqueRecordError(error)
-                    raise SqlError(error)
+        async with self.session() as session:
+            try:
+                results = (await session.execute(update_stmt)).scalars().all()
+                if not results:
+                    raise NoResultFound(f"No {self.db_model.__tablename__} rows for {filter_}")
+            except NoResultFound as error:
+                raise NotFoundError(error)
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                if isinstance(error.orig.__cause__, UniqueViolationError):
+                    raise UniqueRecordError(error)
+                raise SqlError(error)
 
-            return result.to_dict()
+            return results[0].to_dict()
 
     @override
+    @observe_db
     async def bulk_update(self, schemas: list[dict]) -> list[dict]:
         stmt = update(self.db_model)
-        async with self.db_session() as session:
-            async with session.begin():
-                try:
-                    await session.execute(stmt, schemas)
-                    await session.commit()
-                except NoResultFound as error:
-                    raise NotFoundError(error)
-                except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
-                    if isinstance(error.orig.__cause__, UniqueViolationError):
-                        raise UniqueRecordError(error)
-                    raise SqlError(error)
+        async with self.session() as session:
+            try:
+                await session.execute(stmt, schemas)
+            except NoResultFound as error:
+                raise NotFoundError(error)
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                if isinstance(error.orig.__cause__, UniqueViolationError):
+                    raise UniqueRecordError(error)
+                raise SqlError(error)
 
     @override
+    @observe_db
     async def get(self, id_: int) -> dict:
         query_str = select(self.db_model).where(self.db_model.id == id_)
-        async with self.db_session() as session:
+        async with self.session() as session:
             try:
                 result = (await session.execute(query_str)).scalar_one()
             except NoResultFound as error:
@@ -109,32 +157,73 @@ class BaseService:
             return result.to_dict()
 
     @override
+    @observe_db
     async def get_list(
         self,
         filter_: dict[str, Any] | None = None,
         range_: list[int] | None = None,
-        sort: list[str] | None = None
-    ) -> dict[str, int | list[dict]]:
-        query_str = self._prepare_query_str(select(self.db_model), filter_, range_, sort)
-        async with self.db_session() as session:
+        sort: list[str] | None = None,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        keyset: bool = False,
+        count_mode: CountMode = CountMode.exact,
+    ) -> dict[str, int | bool | list[dict] | None]:
+        """
+        Режим keyset включается флагом keyset или передачей after_id/before_id:
+        страница берётся после/перед записью с указанным id по ключу (sort[0], id),
+        range_[0] используется как limit, offset игнорируется.
+        Поле сортировки должно быть NOT NULL, иначе курсор может пропускать строки.
+        """
+        keyset = keyset or after_id is not None or before_id is not None
+        limit: int | None = None
+        if keyset:
+            limit = range_[0] if range_ else None
+            # total считается по фильтру, без условия курсора
+            count_query = self._prepare_query_str(select(self.db_model), filter_)
+            query_str = self._prepare_keyset_query(count_query, sort, limit, after_id, before_id)
+        else:
+            query_str = count_query = self._prepare_query_str(select(self.db_model), filter_, range_, sort)
+        async with self.session() as session:
             try:
-                count_query = select(func.count()).select_from(
-                    query_str.order_by(None).limit(None).offset(None).options(sqlalchemy.orm.noload("*")).subquery()
-                )
-                count: int = await session.scalar(count_query)
+                count: int | None = None
+                if count_mode == CountMode.exact:
+                    count = await self._count(session, count_query)
+                elif count_mode == CountMode.estimated:
+                    count = await self._estimated_count(session)
+                    if count < 0:
+                        # таблица ещё ни разу не анализировалась
+                        count = await self._count(session, count_query)
                 results: Sequence = (await session.execute(query_str)).scalars().all()
             except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
                 raise SqlError(error)
 
-            return {'total': count, 'data': [r.to_dict() for r in results]}
+            has_more: bool | None = None
+            if keyset:
+                has_more = limit is not None and len(results) > limit
+                results = results[:limit]
+                if before_id is not None:
+                    results = results[::-1]
+
+            return {'total': count, 'data': [r.to_dict() for r in results], 'has_more': has_more}
+
+    @staticmethod
+    async def _count(session: AsyncSession, query_str: Select) -> int:
+        count_query = select(func.count()).select_from(
+            query_str.order_by(None).limit(None).offset(None).options(sqlalchemy.orm.noload("*")).subquery()
+        )
+        return await session.scalar(count_query)
+
+    async def _estimated_count(self, session: AsyncSession) -> int:
+        query_str = text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table_name AS regclass)")
+        return await session.scalar(query_str, {"table_name": self.db_model.__tablename__})
 
     @override
+    @observe_db
     async def delete(self, id_: int) -> bool:
         stmt = delete(self.db_model).where(self.db_model.id == id_).returning(self.db_model)
-        async with self.db_session() as session:
+        async with self.session() as session:
             try:
                 result = (await session.execute(stmt)).scalars().all()
-                await session.commit()
                 if result:
                     return True
             except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
@@ -179,3 +268,38 @@ class BaseService:
                     query_str = query_str.order_by(asc(self.db_model.__getattribute__(self.db_model, sort[0])))
 
         return query_str
+
+    def _prepare_keyset_query(self, query_str: Select, sort: list[str] | None, limit: int | None,
+                              after_id: int | None = None, before_id: int | None = None) -> Select:
+        sort_field = sort[0] if sort else "id"
+        descending = bool(sort) and len(sort) == 2 and isinstance(sort[1], str) and sort[1].lower() == "desc"
+        id_field = self.db_model.__getattribute__(self.db_model, "id")
+        sort_col = self.db_model.__getattribute__(self.db_model, sort_field)
+
+        # при движении назад идём в обратном порядке, страница разворачивается после выборки
+        backward = before_id is not None
+        cursor_id = before_id if backward else after_id
+        reverse = descending != backward
+
+        if cursor_id is not None:
+            if sort_field == "id":
+                query_str = query_str.where(id_field < cursor_id if reverse else id_field > cursor_id)
+            else:
+                cursor_val = select(sort_col).where(id_field == cursor_id).correlate(None).scalar_subquery()
+                if reverse:
+                    query_str = query_str.where(
+                        or_(sort_col < cursor_val, and_(sort_col == cursor_val, id_field < cursor_id)))
+                else:
+                    query_str = query_str.where(
+                        or_(sort_col > cursor_val, and_(sort_col == cursor_val, id_field > cursor_id)))
+
+        order = desc if reverse else asc
+        if sort_field == "id":
+            query_str = query_str.order_by(order(id_field))
+        else:
+            query_str = query_str.order_by(order(sort_col), order(id_field))
+        if limit is not None:
+            # лишняя строка нужна только чтобы понять, есть ли следующая страница
+            query_str = query_str.limit(limit + 1)
+
+        return query_str
@@ -0,0 +1,87 @@
+import logging
+from typing import Any
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError
+
+from src.database import run_after_commit
+from src.models.catalog import CategoryModel, MusicPackModel
+from src.models.music_pack import MusicPack
+from src.redis_client import get_redis
+from src.schemas.catalog import CreateMusicPackSchema, MusicPackSchema, UpdateMusicPackSchema
+from src.services.base import BaseService
+from src.services.exceptions import SqlError
+from src.utils.metrics import observe_db
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = "catalog_version"
+CATALOG_CHANNEL = "catalog_updates"
+
+
+async def get_catalog_version() -> int:
+    version = await get_redis().get(CATALOG_VERSION_KEY)
+    return int(version) if version else 0
+
+
+async def publish_catalog_update() -> int | None:
+    """Увеличивает версию каталога и сообщает о ней всем воркерам."""
+    try:
+        version = await get_redis().incr(CATALOG_VERSION_KEY)
+        await get_redis().publish(CATALOG_CHANNEL, version)
+    except RedisError as e:
+        logger.error(f"Can not publish catalog update: {e}")
+        return None
+    logger.info(f"Catalog version changed to {version}")
+    return version
+
+
+class CatalogService(BaseService):
+    db_model = MusicPackModel
+
+    async def create(self, schema: CreateMusicPackSchema) -> MusicPackSchema:
+        result: dict[str, Any] = await super().create(schema.model_dump(exclude_none=True))
+        logger.info(f"Music pack was created with id: {result.get('id')}.")
+        await run_after_commit(publish_catalog_update)
+        return MusicPackSchema(**result)
+
+    async def update(self, filter_: dict[str, Any], schema: UpdateMusicPackSchema) -> MusicPackSchema:
+        logger.info(f"Update music pack: {filter_}.")
+        result: dict[str, Any] = await super().update(filter_, schema.model_dump(exclude_none=True, exclude_unset=True))
+        await run_after_commit(publish_catalog_update)
+        return MusicPackSchema(**result)
+
+    async def get(self, id_: int) -> MusicPackSchema:
+        logger.info(f"Get music pack {id_}.")
+        return MusicPackSchema(**await super().get(id_))
+
+    async def delete(self, id_: int) -> bool:
+        logger.info(f"Deleting music pack {id_}")
+        deleted = await super().delete(id_)
+        await run_after_commit(publish_catalog_update)
+        return deleted
+
+    @observe_db
+    async def load(self) -> dict[str, dict[str, MusicPack]]:
+        """Все активные паки одним запросом, сгруппированные по категориям в порядке показа."""
+        query_str = (
+            select(CategoryModel.name, MusicPackModel)
+            .join(CategoryModel, CategoryModel.id == MusicPackModel.category_id)
+            .where(MusicPackModel.is_active.is_(True))
+            .order_by(CategoryModel.position, CategoryModel.id, MusicPackModel.position, MusicPackModel.id)
+        )
+        async with self.session() as session:
+            try:
+                rows = (await session.execute(query_str)).all()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+
+        categories: dict[str, dict[str, MusicPack]] = {}
+        for category_name, pack in rows:
+            music_pack = MusicPack(pack.id, pack.human_name, pack.cost, pack.file_name, pack.description,
+                                   pack.track_count, pack.document_id)
+            # name хранится в БД, не пересчитываем его из human_name
+            music_pack.name = pack.name
+            categories.setdefault(category_name, {})[music_pack.name] = music_pack
+        return categories
@@ -12,3 +12,14 @@ class MLModelEnablesExistError(Exception):
 
 class UniqueRecordError(Exception):
     pass
+
+
+class StatusConflictError(Exception):
+    """Запись уже не в ожидаемом статусе: переход сделан раньше, например при повторной доставке апдейта."""
+
+    def __init__(self, status: str | None, charge_id: str | None = None, pack_name: str | None = None):
+        super().__init__(f"Unexpected status: {status}")
+        self.status = status
+        # значения записи на момент конфликта, по ним повтор апдейта отличают от повторной оплаты
+        self.charge_id = charge_id
+        self.pack_name = pack_name
@@ -1,42 +1,288 @@
+import functools
 import logging
+from datetime import timedelta
 from typing import Any
 
-from sqlalchemy import select
+from redis.exceptions import RedisError
+from sqlalchemy import String, func, insert, literal, select, update
 from sqlalchemy.exc import NoResultFound, IntegrityError, OperationalError, InternalError, ProgrammingError, \
     StatementError
 
-from src.schemas.payments import CreatePaymentsSchema, PaymentsSchema, UpdatePaymentsSchema
-from src.models.payments import PaymentsModel
+from src.database import run_after_commit
+from src.schemas.payments import CreatePaymentsSchema, PaymentsSchema, UpdatePaymentsSchema, PaymentStatus, \
+    PaymentEvent
+from src.models.payments import PaymentsModel, PaymentEventsModel
 
-from src.services.base import BaseService
-from src.services.exceptions import NotFoundError, SqlError
+from src.redis_client import get_redis
+from src.schemas.pages_schema import PagesSchema
+from src.services.base import BaseService, CountMode
+from src.services.exceptions import NotFoundError, SqlError, StatusConflictError
+from src.settings import settings
+from src.utils.metrics import observe_db
 
 logger = logging.getLogger("category-cat:service")
 
 
+class InFlightPaymentsCache:
+    """Последний незавершённый платёж пользователя в redis с коротким TTL."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return f"payment_{user_id}"
+
+    async def get(self, user_id: str) -> PaymentsSchema | None:
+        try:
+            value = await get_redis().get(self._key(user_id))
+        except RedisError as e:
+            logger.warning(f"Can not get payment from redis: {e}")
+            return None
+        return PaymentsSchema.model_validate_json(value) if value else None
+
+    async def set(self, payment: PaymentsSchema):
+        try:
+            await get_redis().set(self._key(payment.user_id), payment.model_dump_json(), ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Can not save payment to redis: {e}")
+
+    async def delete(self, user_id: str):
+        try:
+            await get_redis().delete(self._key(user_id))
+        except RedisError as e:
+            logger.warning(f"Can not delete payment from redis: {e}")
+
+
+in_flight_payments = InFlightPaymentsCache(ttl=settings.redis_payment_ttl)
+
+INVOICE_PAYLOAD_PREFIX = "payment:"
+
+
+def make_invoice_payload(payment_id: int) -> str:
+    return f"{INVOICE_PAYLOAD_PREFIX}{payment_id}"
+
+
+def parse_invoice_payload(payload: str | None) -> int | None:
+    """id платежа из payload счёта; для старых счетов без id возвращает None."""
+    if not payload or not payload.startswith(INVOICE_PAYLOAD_PREFIX):
+        return None
+    try:
+        return int(payload[len(INVOICE_PAYLOAD_PREFIX):])
+    except ValueError:
+        return None
+
+
+class OpenInvoicesCache:
+    """Открытый счёт пользователя на пак: id платежа в redis на время жизни счёта."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id: str, pack_name: str) -> str:
+        return f"invoice_{user_id}_{pack_name}"
+
+    async def get(self, user_id: str, pack_name: str) -> int | None:
+        try:
+            value = await get_redis().get(self._key(user_id, pack_name))
+        except RedisError as e:
+            logger.warning(f"Can not get open invoice from redis: {e}")
+            return None
+        return int(value) if value else None
+
+    async def set(self, user_id: str, pack_name: str, payment_id: int):
+        try:
+            await get_redis().set(self._key(user_id, pack_name), payment_id, ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Can not save open invoice to redis: {e}")
+
+    async def delete(self, user_id: str, pack_name: str):
+        try:
+            await get_redis().delete(self._key(user_id, pack_name))
+        except RedisError as e:
+            logger.warning(f"Can not delete open invoice from redis: {e}")
+
+
+open_invoices = OpenInvoicesCache(ttl=settings.invoice_ttl)
+
+
 class PaymentService(BaseService):
+    """
+    Платежи и их статусы.
+
+    Статус меняется только переходами transition() по id платежа: started -> tr_created (pre_checkout)
+    -> paid (successful_payment) -> tr_complet (пак доставлен), неоплаченные started уходят в expired,
+    оплатить можно и expired. Каждый переход пишется в payment_events тем же запросом.
+    """
+
     db_model = PaymentsModel
 
+    @observe_db
     async def create(self, schema: CreatePaymentsSchema) -> PaymentsSchema:
-        result: dict = await super().create(schema.model_dump(exclude_none=True))
-        logger.info(f"Payment was created with id: {result.get('id')}.")
-        return PaymentsSchema(**result)
+        payments = PaymentsModel.__table__
+        created = insert(payments).values(schema.model_dump(exclude_none=True)).returning(*payments.c).cte("created")
+        logged = insert(PaymentEventsModel.__table__).from_select(
+            ["payment_id", "event", "to_status"],
+            select(created.c.id, literal(PaymentEvent.created.value), created.c.status),
+        ).cte("logged")
+        async with self.session() as session:
+            try:
+                result = (await session.execute(select(created).add_cte(logged))).mappings().one()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+        logger.info(f"Payment was created with id: {result['id']}.")
+        payment = PaymentsSchema(**result)
+        # кэш пишется после коммита: при rollback в redis не должен остаться платёж, которого нет в БД
+        await run_after_commit(functools.partial(in_flight_payments.set, payment))
+        return payment
 
     async def update(self, filter_: dict[str, Any], schema: UpdatePaymentsSchema) -> PaymentsSchema:
         logger.info("Update payment.")
         result: dict[str, Any] = await super().update(filter_, schema.model_dump(exclude_none=True, exclude_unset=True))
 
-        return PaymentsSchema(**result)
+        payment = PaymentsSchema(**result)
+        await run_after_commit(functools.partial(self._update_caches, payment))
+        return payment
+
+    @staticmethod
+    async def _update_caches(payment: PaymentsSchema):
+        if payment.status == PaymentStatus.transaction_completed.value:
+            await in_flight_payments.delete(payment.user_id)
+        else:
+            await in_flight_payments.set(payment)
+        if payment.status != PaymentStatus.payment_started.value:
+            await open_invoices.delete(payment.user_id, payment.pack_name)
+
+    async def get_or_create_started(self, user_id: str, pack_name: str) -> PaymentsSchema:
+        """
+        Платёж для счёта на пак: пока счёт открыт (invoice_ttl), повторные нажатия получают тот же платёж,
+        новая строка создаётся только когда открытого счёта нет.
+        """
+        payment_id = await open_invoices.get(user_id, pack_name)
+        if payment_id is not None:
+            try:
+                payment = await self.get(payment_id)
+            except NotFoundError:
+                payment = None
+            if payment is not None and payment.status == PaymentStatus.payment_started.value:
+                logger.info(f"Reuse open invoice payment {payment_id} of user {user_id}.")
+                return payment
+
+        payment = await self.create(CreatePaymentsSchema(user_id=user_id,
+                                                         status=PaymentStatus.payment_started.value,
+                                                         transaction_id=None,
+                                                         pack_name=pack_name))
+        await run_after_commit(functools.partial(open_invoices.set, user_id, pack_name, payment.id))
+        return payment
+
+    async def resolve_payment_id(self, user_id: str, invoice_payload: str | None) -> int | None:
+        """id платежа из payload счёта; для старых счетов без id - последний незавершённый платёж пользователя."""
+        payment_id = parse_invoice_payload(invoice_payload)
+        if payment_id is not None:
+            return payment_id
+        try:
+            return (await self.get_in_flight(user_id)).id
+        except NotFoundError:
+            return None
+
+    @observe_db
+    async def transition(self, payment_id: int, expected: PaymentStatus | list[PaymentStatus],
+                         to_status: PaymentStatus, event: PaymentEvent, transaction_id: str | None = None,
+                         charge_id: str | None = None) -> PaymentsSchema:
+        """
+        Переход compare-and-set: UPDATE ... WHERE id = :id AND status IN (:expected).
+
+        Обновление, запись в payment_events и чтение статуса до перехода - один запрос (data-modifying CTE),
+        поэтому повторный апдейт стоит одного запроса по первичному ключу. Если платёж уже не в ожидаемом
+        статусе, ничего не меняется и поднимается StatusConflictError с текущим статусом, charge id и id pre_checkout.
+        charge_id сохраняется в платёж; если он уже есть у другого платежа, переход тоже не делается.
+        """
+        expected = expected if isinstance(expected, list) else [expected]
+        payments = PaymentsModel.__table__
+        values: dict[str, Any] = {"status": to_status.value, "updated_at": func.now()}
+        conditions = [payments.c.id == payment_id, payments.c.status.in_([status.value for status in expected])]
+        if transaction_id:
+            values["transaction_id"] = transaction_id
+        if charge_id:
+            values["telegram_payment_charge_id"] = charge_id
+            # проверка до UPDATE, чтобы повторная доставка не упиралась в уникальный индекс и не ломала транзакцию
+            other = payments.alias("other")
+            conditions.append(~select(other.c.id).where(other.c.telegram_payment_charge_id == charge_id).exists())
+
+        # все части запроса видят снимок до UPDATE, поэтому old - статус до перехода
+        old = (
+            select(payments.c.id, payments.c.status, payments.c.telegram_payment_charge_id,
+                   payments.c.pack_name)
+            .where(payments.c.id == payment_id)
+            .cte("old")
+        )
+        moved = update(payments).where(*conditions).values(**values).returning(*payments.c).cte("moved")
+        logged = insert(PaymentEventsModel.__table__).from_select(
+            ["payment_id", "event", "from_status", "to_status", "external_id"],
+            select(moved.c.id, literal(event.value), old.c.status, moved.c.status,
+                   literal(charge_id or transaction_id, String))
+            .join_from(moved, old, old.c.id == moved.c.id),
+        ).cte("logged")
+        stmt = (
+            select(old.c.status.label("previous_status"), old.c.telegram_payment_charge_id.label("previous_charge_id"),
+                   old.c.pack_name.label("previous_pack_name"), *moved.c)
+            .select_from(old.outerjoin(moved, moved.c.id == old.c.id))
+            .add_cte(logged)
+        )
+        async with self.session() as session:
+            try:
+                result = (await session.execute(stmt)).mappings().one_or_none()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+        if result is None:
+            raise NotFoundError(f"Payment {payment_id} not found")
+        if result["id"] is None:
+            raise StatusConflictError(result["previous_status"], charge_id=result["previous_charge_id"],
+                                      pack_name=result["previous_pack_name"])
+
+        logger.info(f"Payment {payment_id}: {result['previous_status']} -> {to_status.value} ({event.value}).")
+        payment = PaymentsSchema(**result)
+        await run_after_commit(functools.partial(self._update_caches, payment))
+        return payment
 
     async def get(self, payment_id: int) -> PaymentsSchema:
         logger.info(f"Get payment by payment id {payment_id}.")
         return PaymentsSchema(**await super().get(payment_id))
 
+    @observe_db
+    async def get_by_charge_id(self, charge_id: str) -> PaymentsSchema:
+        query_str = select(self.db_model).where(PaymentsModel.telegram_payment_charge_id == charge_id)
+        async with self.session() as session:
+            try:
+                result = (await session.execute(query_str)).scalar_one()
+            except NoResultFound as error:
+                raise NotFoundError(error)
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+
+            return PaymentsSchema(**result.to_dict())
+
     async def get_by_user_id(self, user_id: str) -> PaymentsSchema:
+        return await self.get_latest_for_user(user_id)
+
+    async def get_in_flight(self, user_id: str) -> PaymentsSchema:
+        """Незавершённый платёж пользователя: из redis, а если его там нет - последний платёж из БД."""
+        payment = await in_flight_payments.get(user_id)
+        if payment is not None:
+            return payment
+        logger.info(f"Payment of user {user_id} not found in cache.")
+        return await self.get_latest_for_user(user_id)
+
+    @observe_db
+    async def get_latest_for_user(self, user_id: str, status: PaymentStatus | None = None) -> PaymentsSchema:
         query_str = select(self.db_model).where(PaymentsModel.user_id == user_id)
-        async with self.db_session() as session:
+        if status is not None:
+            query_str = query_str.where(PaymentsModel.status == status.value)
+        query_str = query_str.order_by(PaymentsModel.created_at.desc(), PaymentsModel.id.desc()).limit(1)
+        async with self.session() as session:
             try:
-                result = (await session.execute(query_str)).scalars()[-1]
+                result = (await session.execute(query_str)).scalar_one()
             except NoResultFound as error:
                 raise NotFoundError(error)
             except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
@@ -44,14 +290,60 @@ class PaymentService(BaseService):
 
             return PaymentsSchema(**result.to_dict())
 
+    @observe_db
+    async def expire_stale(self, older_than: int, batch_size: int) -> int:
+        """
+        Переводит платежи, которые висят в статусе started дольше older_than секунд, в expired.
+        Обновляет пачками по batch_size, чтобы не держать долгие блокировки, переходы пишутся в payment_events
+        тем же запросом. Возвращает число строк.
+        """
+        stale = (
+            select(PaymentsModel.id)
+            .where(PaymentsModel.status == PaymentStatus.payment_started.value,
+                   PaymentsModel.created_at < func.now() - timedelta(seconds=older_than))
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        payments = PaymentsModel.__table__
+        expired = (
+            update(payments)
+            # статус проверяется и здесь: платёж мог перейти дальше, пока UPDATE ждал блокировку строки
+            .where(payments.c.id.in_(stale), payments.c.status == PaymentStatus.payment_started.value)
+            .values(status=PaymentStatus.expired.value, updated_at=func.now())
+            .returning(payments.c.id)
+            .cte("expired")
+        )
+        stmt = insert(PaymentEventsModel.__table__).from_select(
+            ["payment_id", "event", "from_status", "to_status"],
+            select(expired.c.id, literal(PaymentEvent.expired.value), literal(PaymentStatus.payment_started.value),
+                   literal(PaymentStatus.expired.value)),
+        )
+        total = 0
+        while True:
+            async with self.session() as session:
+                try:
+                    count = (await session.execute(stmt)).rowcount
+                except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                    raise SqlError(error)
+            total += count
+            if count < batch_size:
+                return total
+
     async def get_list(
         self,
         filter_: dict[str, Any] | None = None,
         range_: list[int] | None = None,
         sort: list[str] | None = None,
-    ) -> PaymentsSchema:
+        after_id: int | None = None,
+        before_id: int | None = None,
+        keyset: bool = False,
+        count_mode: CountMode = CountMode.exact,
+    ) -> PagesSchema:
         logger.info("Get payment list.")
-        return PaymentsSchema(**await super().get_list(filter_, range_, sort))
+        results: dict[str, Any] = await super().get_list(
+            filter_, range_, sort, after_id=after_id, before_id=before_id, keyset=keyset, count_mode=count_mode
+        )
+        return PagesSchema(**results, type=PaymentsSchema)
 
     async def delete(self, category_id: int) -> bool:
         logger.info(f"Deleting category with id: {category_id}")
@@ -0,0 +1,74 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError
+
+from src.models.sales_stats import SalesByPackModel, SalesDailyModel
+from src.redis_client import get_redis
+from src.schemas.sales_stats import SalesByPackSchema, SalesDailySchema, SalesFunnelSchema, SalesReportSchema
+from src.services.base import BaseService
+from src.services.exceptions import SqlError
+from src.utils.metrics import observe_db
+
+logger = logging.getLogger(__name__)
+
+REFRESHED_AT_KEY = "sales_stats:refreshed_at"
+VIEWS = (SalesDailyModel.__tablename__, SalesByPackModel.__tablename__)
+FUNNEL_FIELDS = tuple(SalesFunnelSchema.model_fields)
+
+
+def _sum(rows: list[SalesFunnelSchema]) -> SalesFunnelSchema:
+    return SalesFunnelSchema(**{f: sum(getattr(row, f) for row in rows) for f in FUNNEL_FIELDS})
+
+
+class SalesStatsService(BaseService):
+    """
+    Отчёты по продажам из материализованных представлений sales_daily и sales_by_pack.
+
+    Отчёт читает только агрегаты (строка на день и на пак), а не payments. Данные отстают от платежей
+    на интервал обновления, время последнего обновления лежит в redis.
+    """
+
+    db_model = SalesDailyModel
+
+    @observe_db
+    async def refresh(self):
+        # CONCURRENTLY не блокирует чтение отчётов, пока представление пересчитывается
+        async with self.session() as session:
+            try:
+                for view in VIEWS:
+                    await session.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+        try:
+            await get_redis().set(REFRESHED_AT_KEY, datetime.now().isoformat(timespec="seconds"))
+        except RedisError as e:
+            logger.warning(f"Can not save sales stats refresh time: {e}")
+
+    @observe_db
+    async def report(self, days: int) -> SalesReportSchema:
+        since = date.today() - timedelta(days=days - 1)
+        daily = select(SalesDailyModel).where(SalesDailyModel.day >= since).order_by(SalesDailyModel.day.desc())
+        by_pack = select(SalesByPackModel).order_by(SalesByPackModel.revenue.desc(), SalesByPackModel.paid.desc())
+        async with self.session() as session:
+            try:
+                day_rows = (await session.execute(daily)).scalars().all()
+                pack_rows = (await session.execute(by_pack)).scalars().all()
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+            days_stats = [SalesDailySchema(**row.to_dict()) for row in day_rows]
+            packs_stats = [SalesByPackSchema(**row.to_dict()) for row in pack_rows]
+        try:
+            refreshed_at = await get_redis().get(REFRESHED_AT_KEY)
+        except RedisError as e:
+            logger.warning(f"Can not get sales stats refresh time: {e}")
+            refreshed_at = None
+        return SalesReportSchema(
+            days=days_stats,
+            packs=packs_stats,
+            period=_sum(days_stats),
+            total=_sum(packs_stats),
+            refreshed_at=datetime.fromisoformat(refreshed_at.decode()) if refreshed_at else None,
+        )
@@ -2,15 +2,70 @@ import json
 import logging
 from typing import Any
 
-from redis import Redis
+from cachetools import TTLCache
+from redis.exceptions import RedisError
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError
+
 from src.models.users import Users
+from src.redis_client import get_redis
 from src.schemas.users import CreateUserSchema, UpdateUserSchema, MassUpdateUserSchema
-from src.services.base import BaseService
+from src.services.base import BaseService, CountMode
+from src.services.exceptions import SqlError
 from src.schemas.pages_schema import PagesSchema
+from src.settings import settings
+from src.utils.metrics import observe_db
 
 logger = logging.getLogger()
 
 
+class KnownUsersCache:
+    """
+    Двухуровневый кеш пользователей, которые уже есть в БД:
+    локальный TTLCache процесса, а за ним redis с TTL settings.redis_user_ttl.
+    Локально хранятся только username, имя и фамилия - по ним видно, что профиль в БД устарел.
+    """
+
+    profile_fields = ("username", "name", "surname")
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(tg_id: int) -> str:
+        return f"user_{tg_id}"
+
+    @classmethod
+    def profile(cls, user: dict[str, Any]) -> tuple:
+        return tuple(user.get(name) for name in cls.profile_fields)
+
+    async def get(self, tg_id: int) -> tuple | None:
+        """Профиль пользователя из кеша или None, если пользователя в кеше нет."""
+        profile = self._local.get(tg_id)
+        if profile is not None:
+            return profile
+        try:
+            user = await get_redis().get(self._key(tg_id))
+        except RedisError as e:
+            logger.warning(f"Can not get user from redis: {e}")
+            return None
+        if user is None:
+            return None
+        profile = self._local[tg_id] = self.profile(json.loads(user))
+        return profile
+
+    async def add(self, tg_id: int, user: dict[str, Any]):
+        self._local[tg_id] = self.profile(user)
+        try:
+            await get_redis().set(self._key(tg_id), json.dumps(user, default=str), ex=self.ttl)
+        except RedisError as e:
+            logger.warning(f"Can not save user to redis: {e}")
+
+
+known_users = KnownUsersCache(maxsize=settings.known_users_cache_size, ttl=settings.redis_user_ttl)
+
+
 class UsersService(BaseService):
     db_model = Users
 
@@ -22,22 +77,20 @@ class UsersService(BaseService):
 
         return Users(**result)
 
-    async def check_and_create(self, schema: CreateUserSchema, redis: Redis | None):
-        if redis:
-            user_key = f"user_{schema.tg_id}"
-            has_user = redis.get(user_key)
-        else:
-            has_user = False
-        if has_user:
-            logger.info("User already set to redis")
-            return
-        created_user = await self.get_list(filter_={"tg_id": schema.tg_id})
-        if created_user.data:
-            logger.info(f"User already created in DB: {created_user}")
+    async def upsert(self, schema: CreateUserSchema) -> Users:
+        """Создаёт пользователя или обновляет его данные по tg_id одним запросом."""
+        result: dict[str, Any] = await super().upsert(schema.model_dump(), conflict_fields=["tg_id"])
+        logger.info(f"User was saved with id: {result.get('id')}.")
+
+        return Users(**result)
+
+    async def check_and_create(self, schema: CreateUserSchema):
+        """Сохраняет пользователя, если его нет в кеше или в телеграме поменялись username, имя или фамилия."""
+        if await known_users.get(schema.tg_id) == known_users.profile(schema.model_dump()):
+            logger.info("User already set to cache")
             return
-        created = await self.create(schema)
-        dict_str = json.dumps(created.to_dict(), default=str)
-        redis.set(user_key, dict_str)
+        user = await self.upsert(schema)
+        await known_users.add(schema.tg_id, user.to_dict())
 
     async def mass_create(self, schemas: list[CreateUserSchema]) -> list[Users]:
         logger.info(f'Creating new {self.db_model.__tablename__}.')
@@ -65,12 +118,35 @@ class UsersService(BaseService):
         self,
         filter_: dict[str, Any] | None = None,
         range_: list[int] | None = None,
-        sort: list[str] | None = None
+        sort: list[str] | None = None,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        keyset: bool = False,
+        count_mode: CountMode = CountMode.exact,
     ) -> PagesSchema:
         logger.info(f'Get list {self.db_model.__tablename__}.')
-        results: dict[str, int | list[dict[str, Any]]] = await super().get_list(filter_, range_, sort)
+        results: dict[str, Any] = await super().get_list(
+            filter_, range_, sort, after_id=after_id, before_id=before_id, keyset=keyset, count_mode=count_mode
+        )
         return PagesSchema(**results, type=self.db_model)
 
+    @observe_db
+    async def set_blocked(self, tg_ids: list[int], blocked: bool = True) -> int:
+        """Отмечает пользователей, которые заблокировали (или разблокировали) бота. Возвращает число строк."""
+        if not tg_ids:
+            return 0
+        stmt = (
+            update(Users)
+            .where(Users.tg_id.in_(tg_ids), Users.is_blocked.is_not(blocked))
+            .values(is_blocked=blocked, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        async with self.session() as session:
+            try:
+                return (await session.execute(stmt)).rowcount
+            except (IntegrityError, OperationalError, InternalError, ProgrammingError, StatementError) as error:
+                raise SqlError(error)
+
     async def delete(self, id_: str | int) -> bool:
         logger.info(f'Deleting user {id_}')
         return await super().delete(id_)
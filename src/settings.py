@@ -9,23 +9,86 @@ class Settings(BaseSettings):
     is_autotest: bool = False
     redis_url: str = ""
     redis_user_ttl: int = 60 * 60 * 24 * 60  # 60 days
+    redis_payment_ttl: int = 60 * 60  # 1 hour
+    invoice_ttl: int = 60 * 15  # секунды, в течение которых повторная покупка пака использует тот же счёт
+    payments_expire_after: int = 60 * 60 * 24  # секунды, после которых неоплаченный счёт переводится в expired
+    payments_cleanup_interval: float = 60 * 60
+    payments_cleanup_batch: int = 1000
+    sales_stats_refresh_interval: float = 5 * 60  # секунды между обновлениями отчётов по продажам
+    sales_stats_token: str | None = None  # Bearer токен для /stats/sales, без него эндпоинт выключен
     redis_password: str = ""
     redis_host: str = ""
     redis_port: str = ""
     redis_db: int = 0
+    redis_connect_timeout: float = 5
+    known_users_cache_size: int = 100_000
+    fsm_ttl: int = 60 * 60 * 24 * 7  # секунды жизни состояния FSM с последнего изменения
 
     bot_token: str | None = None
     bot_payments_token: str | None = None
+    bot_api_url: str | None = None  # свой сервер Bot API (локальный telegram-bot-api или заглушка нагрузочного теста)
     bot_webhook_url: str | None = None
     bot_webhook_path: str = "/telegram/bot"
     bot_webhook_secret: str | None = None
+    # ответ вебхуку сразу после постановки апдейта в очередь, обработка в пуле воркеров
+    webhook_async_mode: bool = False
+    webhook_workers: int = 8
+    webhook_queue_size: int = 1000
+    webhook_queue_policy: str = "reject"  # reject | wait
+    webhook_queue_put_timeout: float = 5
+    # ограничение частоты событий пользователя: токенов в секунду и размер бакета
+    throttle_rate: float = 1
+    throttle_burst: int = 5
+    throttle_buy_rate: float = 0.2  # отдельный лимит на кнопки покупки, каждая отправляет счёт
+    throttle_buy_burst: int = 2
+    callback_dedup_window: float = 1  # секунды, в течение которых одинаковый callback_data отбрасывается
     notification_admin_chat_id: int = 1725617264
     admins_ids: list[int] = [1725617264]
     error_chat_id: int = 1725617264
 
+    notifier_queue_size: int = 1000
+    notifier_batch_delay: float = 0.5  # секунды, за которые копится пачка уведомлений
+    notifier_max_retries: int = 5
+
+    delivery_concurrency: int = 4
+    delivery_max_attempts: int = 5
+    delivery_retry_delay: float = 2  # секунды, удваивается с каждой попыткой
+
+    # исходящие запросы к Bot API: лимит бота, лимиты чатов и повторы после 429
+    bot_api_rate: float = 30  # сообщений в секунду на бота
+    bot_api_chat_rate: float = 1  # сообщений в секунду в личный чат
+    bot_api_chat_burst: int = 3
+    bot_api_group_rate: float = 20 / 60  # в группы не больше 20 сообщений в минуту
+    bot_api_max_retries: int = 3
+    bot_api_max_retry_after: float = 30  # секунды, при большем retry_after ошибка отдаётся хендлеру
+    bot_api_connection_limit: int = 100
+    bot_api_keepalive_timeout: float = 60  # секунды жизни простаивающего соединения
+
+    broadcast_rate: float = 25  # сообщений в секунду, лимит Bot API около 30
+    broadcast_batch_size: int = 100
+    broadcast_concurrency: int = 10
+    broadcast_progress_interval: float = 5  # секунды между обновлениями сообщения с прогрессом
+
+    tracing_exporter: str = "none"  # none | stdout | collector
+    tracing_sample_rate: float = 1.0  # доля апдейтов, для которых пишется трейс
+    tracing_collector_url: str = "http://localhost:4318/v1/traces"  # OTLP/HTTP JSON
+    tracing_export_interval: float = 5
+    tracing_buffer_size: int = 10_000
+
     files_path: str = ""
+    files_cache_chat_id: int | None = None  # чат для предзагрузки архивов, по умолчанию error_chat_id
+    catalog_poll_interval: float = 5  # секунды между проверками версии каталога в redis
+    metrics_update_interval: float = 15  # секунды между обновлениями gauge'ей пула БД и очереди апдейтов
 
     db_url: str
+    db_connect_timeout: float = 5
+    db_pool_size: int = 5
+    db_max_overflow: int = 5
+    db_pool_timeout: float = 30  # секунды ожидания свободного соединения
+    db_pool_recycle: int = 1800  # секунды жизни соединения, -1 - без ограничения
+    db_pool_pre_ping: bool = True
+    db_pool_slow_checkout: float = 0.1  # секунды, дольше которых ожидание соединения пишется в лог
+    db_statement_cache_size: int = 100  # prepared_statement_cache_size asyncpg, 0 - выключить (pgbouncer)
     echo_sql: bool = False
 
 
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+# тесты никогда не ходят в рабочие БД и redis: БД только из TEST_DB_URL, redis - fakeredis
+TEST_DB_URL = os.environ.get("TEST_DB_URL", "")
+os.environ["DB_URL"] = TEST_DB_URL or "postgresql+asyncpg://test@127.0.0.1:1/test"
+os.environ["ENVIRONMENT"] = "test"
+os.environ.setdefault("BOT_TOKEN", "123456:test-token")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TABLES = ("payment_events", "payments", "users", "music_packs", "categories")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis(monkeypatch):
+    import fakeredis
+
+    from src import redis_client
+
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(redis_client, "_redis", client)
+    yield client
+    await client.aclose()
+
+
+@pytest.fixture(scope="session")
+def migrated_db():
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL is not set")
+    from alembic import command
+    from alembic.config import Config
+
+    # без alembic.ini: его fileConfig в env.py отключил бы логгеры приложения, и caplog ничего бы не видел
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+
+
+@pytest.fixture
+async def db(migrated_db):
+    """Пустые таблицы перед каждым тестом; в окружении test движок без пула, соединения не переживают тест."""
+    from sqlalchemy import text
+
+    from src.database import database
+
+    async with database.engine.begin() as connection:
+        await connection.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+    yield database
+    await database.dispose()
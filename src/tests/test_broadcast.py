@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+from src.bot.broadcast import BROADCAST_ACTIVE_KEY, BROADCAST_LOCK_KEY, BroadcastError, Broadcaster
+from src.schemas.users import CreateUserSchema
+from src.services.users import UsersService
+from src.utils.loadtest import StubBotApi
+
+pytestmark = pytest.mark.anyio
+
+BLOCKED_CHAT_ID = 3
+
+
+class BlockingStubBotApi(StubBotApi):
+    """Заглушка, в которой один пользователь заблокировал бота."""
+
+    def __init__(self):
+        super().__init__()
+        self.recipients: list[int] = []
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info["method"].lower() == "sendmessage":
+            chat_id = int((await request.post())["chat_id"])
+            self.recipients.append(chat_id)
+            if chat_id == BLOCKED_CHAT_ID:
+                return web.json_response({"ok": False, "error_code": 403,
+                                          "description": "Forbidden: bot was blocked by the user"}, status=403)
+        return await super()._handle(request)
+
+
+@pytest.fixture
+async def bot():
+    stub = BlockingStubBotApi()
+    url = await stub.start()
+    bot = Bot("123456:test-token", session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    bot.stub = stub
+    yield bot
+    await bot.session.close()
+    await stub.stop()
+
+
+async def test_broadcast_pages_through_users(db, redis, bot):
+    for i in range(1, 6):
+        await UsersService().upsert(CreateUserSchema(username=f"user{i}", tg_id=i, chat_id=i))
+    await UsersService().set_blocked([5])
+    broadcaster = Broadcaster(rate=1000, batch_size=2, concurrency=2, progress_interval=0)
+
+    broadcast_id = await broadcaster.start(bot, "Новый пак!", admin_chat_id=100)
+    await broadcaster._task
+
+    state = await broadcaster.status()
+    assert state["id"] == str(broadcast_id)
+    assert (state["status"], state["total"], state["sent"], state["blocked"], state["failed"]) == \
+        ("done", "4", "3", "1", "0")
+    assert sorted(bot.stub.recipients) == [1, 2, 3, 4, 100]
+    assert not await redis.exists(BROADCAST_ACTIVE_KEY)
+    page = await UsersService().get_list(filter_={"is_blocked": True}, sort=["tg_id"])
+    assert [user.tg_id for user in page.data] == [3, 5]
+
+
+async def test_only_one_of_concurrent_starts_runs(db, redis, bot):
+    await UsersService().upsert(CreateUserSchema(username="user1", tg_id=1, chat_id=1))
+    broadcasters = [Broadcaster(rate=1000, batch_size=2, concurrency=2, progress_interval=0) for _ in range(2)]
+
+    results = await asyncio.gather(*(b.start(bot, "Новый пак!", admin_chat_id=100) for b in broadcasters),
+                                   return_exceptions=True)
+
+    assert sorted(type(result).__name__ for result in results) == ["BroadcastError", "int"]
+    started = next(b for b, result in zip(broadcasters, results) if not isinstance(result, BroadcastError))
+    await started._task
+    assert bot.stub.recipients == [100, 1]
+    assert not await redis.exists(BROADCAST_ACTIVE_KEY)
+
+
+async def test_lock_taken_over_by_another_worker_is_kept(db, redis, bot):
+    for i in range(1, 4):
+        await UsersService().upsert(CreateUserSchema(username=f"user{i}", tg_id=i, chat_id=i))
+    broadcaster = Broadcaster(rate=1000, batch_size=2, concurrency=2, progress_interval=0)
+    send_batch = broadcaster._send_batch
+
+    async def slow_send_batch(key, text, users):
+        await send_batch(key, text, users)
+        # лок истёк во время пачки, и рассылку подхватил другой воркер
+        await redis.set(BROADCAST_LOCK_KEY, "other-worker-token", ex=60)
+
+    broadcaster._send_batch = slow_send_batch
+    broadcast_id = await broadcaster.start(bot, "Новый пак!", admin_chat_id=100)
+    await broadcaster._task
+
+    # этот воркер остановился после первой пачки и не снял чужой лок, рассылку закончит владелец лока
+    assert sorted(bot.stub.recipients) == [1, 2, 100]
+    assert await redis.get(BROADCAST_LOCK_KEY) == b"other-worker-token"
+    assert await redis.get(BROADCAST_ACTIVE_KEY) == str(broadcast_id).encode()
@@ -0,0 +1,119 @@
+import itertools
+import time
+
+import pytest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from pydantic import ValidationError
+
+from src.bot.catalog import Catalog
+from src.models.music_pack import MusicPack
+from src.schemas.catalog import CALLBACK_DATA_LIMIT, CreateCategorySchema, CreateMusicPackSchema, UpdateMusicPackSchema
+
+CATEGORIES = 10
+PACKS_PER_CATEGORY = 20
+CALLBACKS = 5000
+
+
+def categories() -> dict[str, dict[str, MusicPack]]:
+    ids = itertools.count(1)
+    result = {}
+    for c in range(CATEGORIES):
+        packs = [MusicPack(next(ids), f"Genre{c} {p}", 1000 * 100, f"{c}-{p}.zip", "-", 30)
+                 for p in range(PACKS_PER_CATEGORY)]
+        result[f"Genre{c}"] = {pack.name: pack for pack in packs}
+    return result
+
+
+def callbacks(packs: dict[str, dict[str, MusicPack]]) -> list[str]:
+    """Нажатия кнопок категорий и паков, больше всего - паков из последних категорий."""
+    data = [f"pack_category_{name}" for name in packs]
+    data += [f"pack_name_{name}" for category in packs.values() for name in category]
+    return list(itertools.islice(itertools.cycle(reversed(data)), CALLBACKS))
+
+
+def scan_handler(packs: dict[str, dict[str, MusicPack]], data: str) -> tuple[str, InlineKeyboardMarkup]:
+    """Прежний путь хендлеров: перебор Categories_dict и сборка клавиатуры и текста на каждое нажатие."""
+    if data.startswith("pack_category_"):
+        category_name = data.replace("pack_category_", "")
+        inline_kb_list = [[InlineKeyboardButton(text=pack.human_name, callback_data=f"pack_name_{pack.name}")]
+                          for pack in packs[category_name].values()]
+        inline_kb_list.append([InlineKeyboardButton(text="Хочу заказать другой пак!", callback_data="create_new_pack")])
+        desc = f"Вот доступные паки в категории {category_name}. Во всех наших паках уникальные наборы треков.\
+    \n\nА если тут нет нужного тебе пака, то ты всегда можешь заказать создание нового"
+        return desc, InlineKeyboardMarkup(inline_keyboard=inline_kb_list)
+
+    pack_name = data.replace("pack_name_", "")
+    pack = next(category[pack_name] for category in packs.values() if pack_name in category)
+    description = f"{pack.human_name} - отличный выбор!\
+        \nЗдесь собраны самые свежие треки в отличном качестве🎧\
+        \n\nКоличество треков в паке: {pack.track_count}\
+        \nCтоимость: {pack.cost/100} RUB"
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Беру этот pack", callback_data=f"buy_pack_{pack_name}")]])
+    return description, keyboard
+
+
+def catalog_handler(catalog: Catalog, data: str) -> tuple[str, InlineKeyboardMarkup]:
+    if data.startswith("pack_category_"):
+        view = catalog.category(data.replace("pack_category_", ""))
+    else:
+        view = catalog.pack(data.replace("pack_name_", ""))
+    return view.text, view.keyboard
+
+
+def rate(handler, data: list[str]) -> float:
+    started = time.perf_counter()
+    for item in data:
+        handler(item)
+    return len(data) / (time.perf_counter() - started)
+
+
+def test_catalog_answers_like_the_scan():
+    packs = categories()
+    catalog = Catalog(packs)
+
+    for data in callbacks(packs)[:CATEGORIES * (PACKS_PER_CATEGORY + 1)]:
+        text, keyboard = scan_handler(packs, data)
+        assert catalog_handler(catalog, data) == (text, keyboard)
+    assert catalog.pack_by_id(PACKS_PER_CATEGORY + 1).category == "Genre1"
+
+
+def test_catalog_callback_throughput():
+    packs = categories()
+    catalog = Catalog(packs)
+    data = callbacks(packs)
+
+    scan_rate = rate(lambda item: scan_handler(packs, item), data)
+    catalog_rate = rate(lambda item: catalog_handler(catalog, item), data)
+
+    print(f"\n{CALLBACKS} callbacks over {CATEGORIES}x{PACKS_PER_CATEGORY} packs: scan {scan_rate:.0f}/s, "
+          f"catalog {catalog_rate:.0f}/s")
+    assert catalog_rate > scan_rate * 5
+
+
+def pack_schema(name: str) -> CreateMusicPackSchema:
+    return CreateMusicPackSchema(category_id=1, human_name=name, name=name, cost=100, file_name="pack.zip",
+                                 track_count=1)
+
+
+def test_names_fit_callback_data():
+    # pack_name_ - самый длинный префикс пака, 10 байт
+    longest = "a" * (CALLBACK_DATA_LIMIT - 10)
+    catalog = Catalog({"Жанр": {longest: MusicPack(1, longest, 100, "pack.zip", "-", 1)}})
+    buttons = [button for row in catalog.start_keyboard.inline_keyboard for button in row]
+    buttons += [button for row in catalog.category("Жанр").keyboard.inline_keyboard for button in row]
+    buttons += [button for row in catalog.pack(longest).keyboard.inline_keyboard for button in row]
+    assert all(len(button.callback_data.encode()) <= CALLBACK_DATA_LIMIT for button in buttons)
+
+    assert pack_schema(longest).name == longest
+    with pytest.raises(ValidationError, match="pack_name_"):
+        pack_schema(longest + "a")
+    # кириллица - 2 байта на символ: 28 символов уже не помещаются
+    with pytest.raises(ValidationError, match="66 bytes"):
+        pack_schema("б" * 28)
+    with pytest.raises(ValidationError):
+        UpdateMusicPackSchema(name="б" * 28)
+    assert UpdateMusicPackSchema(document_id="file").name is None
+    assert CreateCategorySchema(name="Жанр" * 6).name
+    with pytest.raises(ValidationError, match="pack_category_"):
+        CreateCategorySchema(name="Жанр" * 7)
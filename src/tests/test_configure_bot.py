@@ -0,0 +1,48 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from src import bot_main
+from src.bot_main import BOT_CONFIG_HASH_KEY, configure_bot
+from src.config import LANGS
+from src.utils.loadtest import StubBotApi
+
+pytestmark = pytest.mark.anyio
+
+# вебхук уже стоит на другом адресе, поэтому первый запуск делает все вызовы настройки
+CONFIGURE_CALLS = {"getwebhookinfo": 1, "setwebhook": 1, "setmycommands": len(LANGS), "setmydescription": len(LANGS)}
+
+
+@pytest.fixture
+async def stub(monkeypatch, redis):
+    stub = StubBotApi(latency=0.02)
+    await stub.start()
+    bot = Bot("123456:test-token", session=AiohttpSession(api=TelegramAPIServer.from_base(stub.url)))
+    monkeypatch.setattr(bot_main, "app_context", SimpleNamespace(bot=bot, redis=redis))
+    yield stub
+    await bot.session.close()
+    await stub.stop()
+
+
+async def start_workers(workers: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(configure_bot() for _ in range(workers)))
+    return time.perf_counter() - started
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+async def test_bot_is_configured_once_by_any_number_of_workers(redis, stub, workers):
+    first = await start_workers(workers)
+    assert dict(stub.calls) == CONFIGURE_CALLS
+    assert await redis.exists(BOT_CONFIG_HASH_KEY)
+
+    stub.calls.clear()
+    restart = await start_workers(workers)
+    assert dict(stub.calls) == {}
+
+    print(f"\n{workers} workers: first start {first * 1000:.1f} ms, restart with the same config {restart * 1000:.1f} ms")
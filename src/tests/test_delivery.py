@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from redis.exceptions import RedisError
+
+from src.bot import delivery
+from src.bot.delivery import (
+    DEAD_KEY, DELAYED_KEY, JOB_LOCK_KEY, JOB_STATUS_KEY, PROCESSING_KEY, DeliveryJob, DeliveryQueue,
+)
+from src.utils.loadtest import StubBotApi
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    pack = SimpleNamespace(name="pack", human_name="Pack", document_id="file-pack", file_name="pack.zip")
+    monkeypatch.setattr(delivery, "get_catalog", lambda: SimpleNamespace(
+        pack=lambda name: SimpleNamespace(pack=pack) if name == "pack" else None))
+
+
+@pytest.fixture(autouse=True)
+def blocking_blmove(monkeypatch, redis):
+    """fakeredis отвечает на blmove по пустому списку сразу, не уступая цикл, как сделал бы настоящий redis."""
+    blmove = redis.blmove
+
+    async def wait_blmove(*args, **kwargs):
+        raw = await blmove(*args, **kwargs)
+        if raw is None:
+            await asyncio.sleep(0.05)
+        return raw
+
+    monkeypatch.setattr(redis, "blmove", wait_blmove)
+
+
+@pytest.fixture
+async def stub():
+    stub = StubBotApi()
+    await stub.start()
+    yield stub
+    await stub.stop()
+
+
+@pytest.fixture
+async def bot(stub):
+    bot = Bot("123456:test-token", session=AiohttpSession(api=TelegramAPIServer.from_base(stub.url)))
+    yield bot
+    await bot.session.close()
+
+
+@pytest.fixture
+async def queue(bot):
+    queue = DeliveryQueue(concurrency=2, max_attempts=3, retry_delay=60)
+    yield queue
+    await queue.stop()
+
+
+def job(transaction_id: str = "charge-1") -> DeliveryJob:
+    return DeliveryJob(transaction_id=transaction_id, user_id=1, chat_id=1, username="user", pack_name="pack")
+
+
+async def wait_status(redis, transaction_id: str, status: bytes, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while await redis.get(JOB_STATUS_KEY.format(transaction_id)) != status:
+            await asyncio.sleep(0.05)
+
+
+async def test_job_is_delivered_once(redis, stub, bot, queue):
+    assert await queue.enqueue(job())
+    assert not await queue.enqueue(job())
+    await queue.start(bot)
+
+    await wait_status(redis, "charge-1", b"done")
+
+    assert (stub.calls["sendmessage"], stub.calls["senddocument"]) == (1, 1)
+    assert await redis.llen(PROCESSING_KEY) == 0
+    assert not await redis.exists(JOB_LOCK_KEY.format("charge-1"))
+
+
+async def test_lock_is_extended_while_sending(monkeypatch, redis, stub, bot, queue):
+    monkeypatch.setattr(delivery, "JOB_LOCK_TTL", 0.3)
+    stub.latency = 1
+    await queue.enqueue(job())
+    await queue.start(bot)
+
+    await asyncio.sleep(0.8)
+    assert await redis.exists(JOB_LOCK_KEY.format("charge-1"))
+    await wait_status(redis, "charge-1", b"done")
+    assert stub.calls["senddocument"] == 1
+
+
+async def test_failed_processing_releases_job(monkeypatch, redis, bot, queue):
+    async def broken_redis(raw):
+        raise RedisError("connection lost")
+
+    monkeypatch.setattr(queue, "_process", broken_redis)
+    await queue.enqueue(job())
+    await redis.lpush(delivery.QUEUE_KEY, b"not a job")
+    await queue.start(bot)
+
+    async with asyncio.timeout(5):
+        while await redis.llen(delivery.QUEUE_KEY) or await redis.llen(PROCESSING_KEY):
+            await asyncio.sleep(0.05)
+
+    assert await redis.zrange(DELAYED_KEY, 0, -1) == [job().model_dump_json().encode()]
+    assert await redis.lrange(DEAD_KEY, 0, -1) == [b"not a job"]
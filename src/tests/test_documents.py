@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.bot import documents
+from src.bot.documents import PREWARM_LOCK_KEY, DocumentsPrewarmer
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def send_document(self, chat_id, document, **kwargs):
+        await self.release.wait()
+        self.calls.append(("upload", document.path))
+        return SimpleNamespace(document=SimpleNamespace(file_id=f"file-{document.path}"))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("report", chat_id, text))
+
+
+def pack(name: str, document_id: str | None = None):
+    return SimpleNamespace(name=name, file_name=name, document_id=document_id)
+
+
+@pytest.fixture
+def catalog(monkeypatch, bot):
+    packs = [pack("a"), pack("b", document_id="cached"), pack("c")]
+    monkeypatch.setattr(documents, "get_catalog", lambda: SimpleNamespace(
+        packs={p.name: SimpleNamespace(pack=p) for p in packs}))
+    monkeypatch.setattr(documents.settings, "files_path", "")
+
+    async def save_document_id(pack, document_id):
+        bot.calls.append(("save", document_id))
+
+    monkeypatch.setattr(documents, "save_document_id", save_document_id)
+    return packs
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+
+async def test_prewarm_runs_in_background_once(redis, bot, catalog):
+    prewarmer, other = DocumentsPrewarmer(), DocumentsPrewarmer()
+
+    assert await prewarmer.start(bot, report_chat_id=42)
+    assert not await other.start(bot, report_chat_id=42)
+    assert await other.run(bot) is None
+    assert bot.calls == []
+
+    bot.release.set()
+    await prewarmer._task
+
+    assert bot.calls == [
+        ("upload", "a"), ("save", "file-a"),
+        ("upload", "c"), ("save", "file-c"),
+        ("report", 42, "Загружены паки: a, c"),
+    ]
+    assert not await redis.exists(PREWARM_LOCK_KEY)
+
+
+async def test_prewarm_stop_releases_lock(redis, bot, catalog):
+    prewarmer = DocumentsPrewarmer()
+    assert await prewarmer.start(bot, report_chat_id=42)
+    await asyncio.sleep(0)
+
+    await prewarmer.stop()
+
+    assert not await redis.exists(PREWARM_LOCK_KEY)
+    assert await prewarmer.start(bot, report_chat_id=42)
+    await prewarmer.stop()
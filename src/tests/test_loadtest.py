@@ -0,0 +1,24 @@
+import pytest
+
+from src.settings import settings
+from src.utils.loadtest import LOADTEST_REDIS_MARKER_KEY, LoadTest, LoadTestIsolationError, check_isolation
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_refuses_shared_database(redis, monkeypatch):
+    monkeypatch.setattr(settings, "db_url", "postgresql+asyncpg://bot@db/topdj")
+    await redis.set(LOADTEST_REDIS_MARKER_KEY, 1)
+
+    with pytest.raises(LoadTestIsolationError, match="Database name"):
+        await LoadTest(users=1, concurrency=1).run()
+
+
+async def test_refuses_unmarked_redis(redis, monkeypatch):
+    monkeypatch.setattr(settings, "db_url", "postgresql+asyncpg://bot@db/topdj_loadtest")
+
+    with pytest.raises(LoadTestIsolationError, match="Redis"):
+        await check_isolation()
+
+    await redis.set(LOADTEST_REDIS_MARKER_KEY, 1)
+    await check_isolation()
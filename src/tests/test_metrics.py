@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+import pytest
+from aiogram.types import Update
+from prometheus_client import REGISTRY
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.bot.update_queue import QueuePolicy, UpdateQueue
+from src.database import InstrumentedPool
+from src.services.payments import PaymentService
+from src.settings import settings
+from src.utils.metrics import GaugesUpdater, UPDATE_QUEUE
+
+pytestmark = pytest.mark.anyio
+
+
+def update(update_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+    })
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def test_gauges_are_updated_without_scrape():
+    state = {"depth": 1}
+    updater = GaugesUpdater(interval=0.01)
+
+    updater.start([(UPDATE_QUEUE, lambda: state)])
+    assert sample("webhook_update_queue", stat="depth") == 1
+    state["depth"] = 5
+    await asyncio.sleep(0.05)
+    await updater.stop()
+
+    assert sample("webhook_update_queue", stat="depth") == 5
+
+
+async def test_update_queue_counts_are_counters():
+    queue = UpdateQueue(workers=1, size=1, policy=QueuePolicy.reject, put_timeout=0)
+    accepted = sample("webhook_update_queue_events_total", result="accepted")
+    rejected = sample("webhook_update_queue_events_total", result="rejected")
+
+    assert await queue.put(update(1))
+    assert not await queue.put(update(2))
+
+    assert sample("webhook_update_queue_events_total", result="accepted") == accepted + 1
+    assert sample("webhook_update_queue_events_total", result="rejected") == rejected + 1
+    assert queue.stats() == {"depth": 1, "capacity": 1}
+
+
+@pytest.fixture
+async def small_pool(db, monkeypatch):
+    """Пул из одного соединения с коротким таймаутом вместо NullPool тестового окружения."""
+    engine = create_async_engine(db.engine.url, poolclass=InstrumentedPool, pool_size=1, max_overflow=0,
+                                 pool_timeout=0.3)
+    monkeypatch.setattr(db, "_engine", engine)
+    monkeypatch.setattr(db, "_session_maker", None)
+    monkeypatch.setattr(settings, "db_pool_slow_checkout", 0.05)
+    yield engine
+    await engine.dispose()
+
+
+async def hold_connection(engine, seconds: float, taken: asyncio.Event):
+    async with engine.connect():
+        taken.set()
+        await asyncio.sleep(seconds)
+
+
+async def test_exhausted_pool_reports_slow_checkout_and_timeout(small_pool, redis, caplog):
+    slow = sample("db_pool_slow_checkouts_total")
+    timeouts = sample("db_pool_timeouts_total")
+    waits = sample("db_pool_wait_seconds_count")
+    caplog.set_level(logging.WARNING, logger="src.database")
+
+    taken = asyncio.Event()
+    holder = asyncio.create_task(hold_connection(small_pool, 0.15, taken))
+    await taken.wait()
+    await PaymentService().get_list()
+    await holder
+
+    assert sample("db_pool_slow_checkouts_total") == slow + 1
+    assert sample("db_pool_wait_seconds_count") >= waits + 1
+    assert "Slow DB pool checkout" in caplog.records[-1].message
+    assert "caller payments.py:PaymentService.get_list" in caplog.records[-1].message
+    assert small_pool.pool.stats() == {"size": 1, "checked_in": 1, "in_use": 0, "overflow": 0}
+
+    taken = asyncio.Event()
+    holder = asyncio.create_task(hold_connection(small_pool, 1, taken))
+    await taken.wait()
+    with pytest.raises(PoolTimeoutError):
+        await PaymentService().get_by_charge_id("charge-1")
+    assert small_pool.pool.stats()["in_use"] == 1
+    await holder
+
+    assert sample("db_pool_timeouts_total") == timeouts + 1
+    assert "DB pool checkout timeout" in caplog.records[-1].message
+    assert "caller payments.py:PaymentService.get_by_charge_id" in caplog.records[-1].message
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from src.utils import tg_messages
+from src.utils.loadtest import StepStats
+from src.utils.tg_messages import Notifier, send_tg_message
+
+pytestmark = pytest.mark.anyio
+
+PURCHASES = 20
+TELEGRAM_LATENCY = 0.05
+
+
+class SlowTelegram(BaseHTTPRequestHandler):
+    """Заглушка api.telegram.org в отдельном потоке: синхронный запрос с event loop её не блокирует."""
+
+    requests = 0
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        type(self).requests += 1
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(TELEGRAM_LATENCY)
+        body = json.dumps({"ok": True, "result": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}}})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def telegram():
+    SlowTelegram.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowTelegram)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+async def purchases(notify) -> StepStats:
+    """Покупки, пришедшие одновременно; каждая отправляет уведомление админу. Задержка считается от прихода."""
+    stats = StepStats()
+    arrived = time.perf_counter()
+
+    async def purchase(i: int):
+        await notify(f"Пользователь user{i} успешно купил пак")
+        stats.latencies.append(time.perf_counter() - arrived)
+
+    await asyncio.gather(*(purchase(i) for i in range(PURCHASES)))
+    return stats
+
+
+async def test_notifier_does_not_block_purchases(monkeypatch, telegram):
+    async def blocking_send(message: str):
+        # прежний send_tg_message: синхронный HTTP запрос прямо на event loop
+        urllib.request.urlopen(f"{telegram}/bot123456:test-token/sendMessage?chat_id=1&text={len(message)}").read()
+
+    blocking = await purchases(blocking_send)
+    assert SlowTelegram.requests == PURCHASES
+
+    bot = Bot("123456:test-token", session=AiohttpSession(api=TelegramAPIServer.from_base(telegram)))
+    notifier = Notifier(queue_size=100, batch_delay=0.01, max_retries=0)
+    monkeypatch.setattr(tg_messages, "notifier", notifier)
+    notifier.start(bot)
+    try:
+        queued = await purchases(send_tg_message)
+        await notifier.stop()
+    finally:
+        await bot.session.close()
+
+    print(f"\npurchase p99: blocking {blocking.percentile(99) * 1000:.1f} ms, "
+          f"notifier {queued.percentile(99) * 1000:.1f} ms")
+    # покупки ждали друг друга за каждым запросом, а с очередью - только постановку сообщения
+    assert blocking.percentile(99) >= TELEGRAM_LATENCY * PURCHASES / 2
+    assert queued.percentile(99) < TELEGRAM_LATENCY
+    # все уведомления всплеска склеены в одно сообщение и отправлены до остановки
+    assert SlowTelegram.requests == PURCHASES + 1
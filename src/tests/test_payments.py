@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.types import Message, PreCheckoutQuery
+
+from src.bot import payment_result
+from src.database import unit_of_work
+from src.schemas.payments import CreatePaymentsSchema, PaymentStatus
+from src.services.payments import PaymentService, in_flight_payments, make_invoice_payload, open_invoices
+
+pytestmark = pytest.mark.anyio
+
+
+class Rollback(Exception):
+    pass
+
+
+async def test_caches_are_written_after_commit(db, redis):
+    async with unit_of_work():
+        payment = await PaymentService().get_or_create_started("1", "pack")
+        assert await in_flight_payments.get("1") is None
+        assert await open_invoices.get("1", "pack") is None
+
+    assert (await in_flight_payments.get("1")).id == payment.id
+    assert await open_invoices.get("1", "pack") == payment.id
+
+
+async def test_caches_are_not_written_on_rollback(db, redis):
+    with pytest.raises(Rollback):
+        async with unit_of_work():
+            await PaymentService().get_or_create_started("1", "pack")
+            raise Rollback
+
+    assert await in_flight_payments.get("1") is None
+    assert await open_invoices.get("1", "pack") is None
+    assert (await PaymentService().get_list()).total == 0
+
+
+class FakeBot:
+    def __init__(self):
+        self.answers = []
+
+    async def answer_pre_checkout_query(self, pre_checkout_query_id, ok, error_message=None):
+        self.answers.append((pre_checkout_query_id, ok, error_message))
+
+
+def pre_checkout(query_id: str, payment_id: int) -> PreCheckoutQuery:
+    return PreCheckoutQuery.model_validate({
+        "id": query_id,
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+        "currency": "RUB",
+        "total_amount": 10000,
+        "invoice_payload": make_invoice_payload(payment_id),
+    })
+
+
+def paid_message(charge_id: str, payment_id: int) -> Message:
+    return Message.model_validate({
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+        "successful_payment": {
+            "currency": "RUB",
+            "total_amount": 10000,
+            "invoice_payload": make_invoice_payload(payment_id),
+            "telegram_payment_charge_id": charge_id,
+            "provider_payment_charge_id": f"provider-{charge_id}",
+        },
+    })
+
+
+@pytest.fixture
+def deliveries(monkeypatch):
+    jobs = []
+
+    async def enqueue(job):
+        jobs.append(job)
+
+    monkeypatch.setattr(payment_result.delivery_queue, "enqueue", enqueue)
+    monkeypatch.setattr(payment_result, "get_catalog", lambda: SimpleNamespace(pack=lambda name: name))
+    return jobs
+
+
+async def test_pre_checkout_confirms_invoice_paying_from_other_query(db, redis, deliveries):
+    payment = await PaymentService().get_or_create_started("1", "pack")
+    bot = FakeBot()
+
+    await payment_result.pre_checkout_query(pre_checkout("first", payment.id), bot)
+    await payment_result.pre_checkout_query(pre_checkout("first", payment.id), bot)
+    await payment_result.pre_checkout_query(pre_checkout("second", payment.id), bot)
+
+    assert [answer[:2] for answer in bot.answers] == [("first", True), ("first", True), ("second", True)]
+
+    await payment_result.successful_payment(paid_message("charge-1", payment.id), None)
+    await payment_result.successful_payment(paid_message("charge-1", payment.id), None)
+    assert [job.transaction_id for job in deliveries] == ["charge-1"]
+
+
+async def test_repeated_successful_payment_is_skipped(db, redis, deliveries):
+    payment = await PaymentService().get_or_create_started("1", "pack")
+
+    await payment_result.successful_payment(paid_message("charge-1", payment.id), None)
+    await payment_result.successful_payment(paid_message("charge-1", payment.id), None)
+
+    assert [(job.transaction_id, job.payment_id) for job in deliveries] == [("charge-1", payment.id)]
+
+
+async def test_second_payment_of_invoice_is_delivered(db, redis, deliveries):
+    payment = await PaymentService().get_or_create_started("1", "pack")
+
+    await payment_result.successful_payment(paid_message("charge-1", payment.id), None)
+    await payment_result.successful_payment(paid_message("charge-2", payment.id), None)
+    await payment_result.successful_payment(paid_message("charge-2", payment.id), None)
+
+    assert [job.transaction_id for job in deliveries] == ["charge-1", "charge-2"]
+    repeated = await PaymentService().get_by_charge_id("charge-2")
+    assert repeated.id == deliveries[1].payment_id != payment.id
+    assert (repeated.status, repeated.pack_name) == (PaymentStatus.paid.value, "pack")
+
+
+async def test_keyset_total_counts_whole_filter(db, redis):
+    for name in ["a", "b", "c", "d", "e"]:
+        await PaymentService().create(CreatePaymentsSchema(user_id="1", status="started", pack_name=name))
+    await PaymentService().create(CreatePaymentsSchema(user_id="2", status="started", pack_name="other"))
+
+    first = await PaymentService().get_list(filter_={"user_id": "1"}, range_=[2], sort=["id"], keyset=True)
+    second = await PaymentService().get_list(filter_={"user_id": "1"}, range_=[2], sort=["id"],
+                                             after_id=first.data[-1].id)
+
+    assert [payment.pack_name for payment in first.data + second.data] == ["a", "b", "c", "d"]
+    assert first.total == second.total == 5
+    assert first.has_more and second.has_more
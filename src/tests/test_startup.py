@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from src import redis_client
+from src.context import app_context
+from src.settings import settings
+from src.tests.conftest import ROOT
+from src.utils.loadtest import StubBotApi
+
+pytestmark = pytest.mark.anyio
+
+# адрес, на который соединение не устанавливается: импорт, который полезет в сеть, повиснет на нём
+UNREACHABLE_HOST = "10.255.255.1"
+
+IMPORT_CHECK = """
+from src.app import app
+from src import redis_client
+from src.context import app_context
+from src.database import database
+assert app_context._bot is None and app_context._dp is None
+assert redis_client._redis is None and database._engine is None
+"""
+
+
+def test_import_opens_no_connections():
+    env = {
+        **os.environ,
+        "DB_URL": f"postgresql+asyncpg://bot@{UNREACHABLE_HOST}/topdj",
+        "REDIS_URL": f"redis://{UNREACHABLE_HOST}:6379/0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+    }
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_CHECK], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    # строки importtime: "import time: self [us] | cumulative | imported package"
+    cumulative = {line.rsplit("|", 1)[1].strip(): int(line.split("|")[1])
+                  for line in result.stderr.splitlines() if line.startswith("import time:") and "[us]" not in line}
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[1:4]
+    print(f"\nimport src.app: {cumulative['src.app'] / 1000:.0f} ms, process {elapsed * 1000:.0f} ms; slowest: "
+          + ", ".join(f"{name.strip()} {us / 1000:.0f} ms" for name, us in slowest))
+
+
+async def test_connect_fails_fast_when_redis_is_unreachable(monkeypatch):
+    monkeypatch.setattr(settings, "redis_url", f"redis://{UNREACHABLE_HOST}:6379/0")
+    monkeypatch.setattr(settings, "redis_connect_timeout", 0.5)
+    monkeypatch.setattr(settings, "db_connect_timeout", 0.5)
+    monkeypatch.setattr(redis_client, "_redis", None)
+    started = time.perf_counter()
+    try:
+        assert not await app_context.connect()
+    finally:
+        await redis_client.close_redis()
+        await app_context.database.dispose()
+
+    assert time.perf_counter() - started < 2
+
+
+async def test_time_to_first_ready_liveness(monkeypatch, db, redis):
+    from src.app import app
+    from src.bot_main import bot_shutdown, bot_startup
+
+    stub = StubBotApi()
+    monkeypatch.setattr(settings, "bot_api_url", await stub.start())
+    started = time.perf_counter()
+    try:
+        await bot_startup(configure=False, workers=False)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/liveness")
+        ready = time.perf_counter() - started
+    finally:
+        await bot_shutdown()
+        await stub.stop()
+
+    assert response.status_code == 200
+    print(f"\nstartup to first ready liveness: {ready * 1000:.0f} ms")
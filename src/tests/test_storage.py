@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from redis.asyncio.client import Pipeline
+
+from src.bot.utils.storage import CompactRedisStorage
+
+pytestmark = pytest.mark.anyio
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+TTL = 3600
+
+
+class Boom(Exception):
+    pass
+
+
+@pytest.fixture
+def storage(redis):
+    return CompactRedisStorage(redis, ttl=TTL)
+
+
+@pytest.fixture
+def round_trips(redis, monkeypatch):
+    """Число обращений к redis: отдельные команды и pipeline целиком."""
+    counter = {"round_trips": 0}
+    execute_command, execute = redis.execute_command, Pipeline.execute
+
+    async def count_command(*args, **kwargs):
+        counter["round_trips"] += 1
+        return await execute_command(*args, **kwargs)
+
+    async def count_pipeline(self, *args, **kwargs):
+        counter["round_trips"] += 1
+        return await execute(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis, "execute_command", count_command)
+    monkeypatch.setattr(Pipeline, "execute", count_pipeline)
+    return counter
+
+
+async def funnel_step(storage: CompactRedisStorage, step: int):
+    """Шаг воронки как в хендлере: FSM middleware читает состояние, хендлер пишет данные и состояние."""
+    async with storage.buffer():
+        await storage.get_state(KEY)
+        await storage.update_data(KEY, {f"step{step}": step})
+        await storage.set_state(KEY, f"Form:step{step}")
+
+
+async def test_two_round_trips_per_step(storage, round_trips):
+    await funnel_step(storage, 0)  # первая запись загружает скрипт
+    round_trips["round_trips"] = 0
+
+    for step in range(1, 4):
+        await funnel_step(storage, step)
+
+    assert round_trips["round_trips"] == 2 * 3
+    assert await storage.get_state(KEY) == "Form:step3"
+    assert await storage.get_data(KEY) == {"step0": 0, "step1": 1, "step2": 2, "step3": 3}
+
+
+async def test_writes_are_flushed_on_error(storage, redis):
+    with pytest.raises(Boom):
+        async with storage.buffer():
+            await storage.set_state(KEY, "Form:pay")
+            await storage.update_data(KEY, {"pack_name": "house"})
+            raise Boom
+
+    assert await storage.get_state(KEY) == "Form:pay"
+    assert await storage.get_data(KEY) == {"pack_name": "house"}
+    assert 0 < await redis.ttl("fsm2:10:10") <= TTL
+
+
+async def test_ttl_is_refreshed_by_writes(storage, redis):
+    await storage.set_state(KEY, "Form:pay")
+    await redis.expire("fsm2:10:10", 5)
+
+    await storage.update_data(KEY, {"pack_name": "house"})
+
+    assert await redis.ttl("fsm2:10:10") > 5
+
+
+async def test_clear_removes_key(storage, redis):
+    await storage.set_state(KEY, "Form:pay")
+    await storage.update_data(KEY, {"pack_name": "house"})
+
+    async with storage.buffer():
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+
+    assert await storage.get_state(KEY) is None
+    assert await storage.get_data(KEY) == {}
+    assert not await redis.exists("fsm2:10:10")
+
+
+async def test_concurrent_updates_keep_both_data_changes(storage):
+    await storage.update_data(KEY, {"page": 1})
+    loaded = asyncio.Event()
+
+    async def update(data: dict, wait: bool):
+        async with storage.buffer():
+            await storage.get_state(KEY)
+            await storage.update_data(KEY, data)
+            if wait:
+                await loaded.wait()
+            else:
+                loaded.set()
+
+    await asyncio.gather(update({"pack_name": "house"}, wait=True), update({"page": 2}, wait=False))
+
+    assert await storage.get_data(KEY) == {"page": 2, "pack_name": "house"}
+
+
+async def test_concurrent_merge_keeps_json_types(storage):
+    big = 2 ** 62 + 1
+    await storage.update_data(KEY, {"packs": [], "options": {"tags": []}, "charge": big})
+    loaded = asyncio.Event()
+
+    async def update(data: dict, wait: bool):
+        async with storage.buffer():
+            await storage.get_data(KEY)
+            await storage.update_data(KEY, data)
+            if wait:
+                await loaded.wait()
+            else:
+                loaded.set()
+
+    await asyncio.gather(update({"page": 2}, wait=True), update({"payment_id": big + 1}, wait=False))
+
+    assert await storage.get_data(KEY) == {"packs": [], "options": {"tags": []}, "charge": big,
+                                           "payment_id": big + 1, "page": 2}
+
+
+async def test_set_data_replaces_concurrent_changes(storage):
+    await storage.update_data(KEY, {"page": 1})
+
+    async with storage.buffer():
+        await storage.get_data(KEY)
+        await storage.update_data(KEY, {"page": 2})
+        await storage.set_data(KEY, {"pack_name": "house"})
+
+    assert await storage.get_data(KEY) == {"pack_name": "house"}
+
+
+async def test_flush_reloads_script_after_redis_restart(storage, redis):
+    await storage.set_state(KEY, "Form:one")
+    await redis.script_flush()
+
+    await storage.set_state(KEY, "Form:two")
+
+    assert await storage.get_state(KEY) == "Form:two"
+
+
+async def test_migrate_legacy_keys(storage, redis):
+    await redis.set("fsm:10:10:state", "Form:pay")
+    await redis.set("fsm:10:10:data", '{"pack_name": "house"}')
+    await redis.set("fsm:20:20:state", "Form:old")
+    await storage.set_state(StorageKey(bot_id=1, chat_id=20, user_id=20), "Form:new")
+    await redis.set("fsm:30:30:data", "{}")
+
+    assert await storage.migrate_legacy(batch=2) == 1
+
+    assert await storage.get_state(KEY) == "Form:pay"
+    assert await storage.get_data(KEY) == {"pack_name": "house"}
+    assert 0 < await redis.ttl("fsm2:10:10") <= TTL
+    assert await storage.get_state(StorageKey(bot_id=1, chat_id=20, user_id=20)) == "Form:new"
+    assert await redis.keys("fsm:*") == []
@@ -0,0 +1,44 @@
+import pytest
+from aiogram.types import Message
+
+from src.bot.utils.middlewares import ThrottlingMiddleware, registered_commands
+
+pytestmark = pytest.mark.anyio
+
+
+def make_message(text: str, user_id: int = 1) -> Message:
+    return Message.model_validate({
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+        "text": text,
+    })
+
+
+async def handler(event, data):
+    return "handled"
+
+
+async def test_unknown_commands_share_one_bucket(redis):
+    middleware = ThrottlingMiddleware(rate=1, burst=2, dedup_window=1, commands={"start"})
+    results = [await middleware(handler, make_message(f"/random_{i}"), {}) for i in range(4)]
+
+    assert results == ["handled", "handled", None, None]
+    assert sorted(await redis.keys("throttle:*")) == [b"throttle:1:command"]
+
+
+async def test_registered_command_has_own_bucket(redis):
+    middleware = ThrottlingMiddleware(rate=1, burst=1, dedup_window=1, commands={"start"})
+
+    assert await middleware(handler, make_message("/start@topdj_bot"), {}) == "handled"
+    assert await middleware(handler, make_message("/other"), {}) == "handled"
+    assert sorted(await redis.keys("throttle:*")) == [b"throttle:1:/start", b"throttle:1:command"]
+
+
+def test_registered_commands_come_from_routers():
+    from src.context import AppContext
+
+    commands = registered_commands(AppContext().dp)
+
+    assert {"start", "prewarm", "broadcast", "report"} <= commands
@@ -0,0 +1,100 @@
+import pytest
+from sqlalchemy import event
+
+from src.database import savepoint, unit_of_work
+from src.schemas.payments import CreatePaymentsSchema
+from src.schemas.users import CreateUserSchema
+from src.services.exceptions import SqlError
+from src.services.payments import PaymentService
+from src.services.base import CountMode
+from src.services.users import UsersService
+
+pytestmark = pytest.mark.anyio
+
+# запросов к БД в handle_update
+STATEMENTS = 4
+
+
+class Boom(Exception):
+    pass
+
+
+@pytest.fixture
+def db_calls(db):
+    """Выдачи соединений из пула, SQL запросы и BEGIN/COMMIT - всё, что уходит в PostgreSQL."""
+    calls = {"checkouts": 0, "begin": 0, "commit": 0, "statements": []}
+
+    def on_checkout(*args):
+        calls["checkouts"] += 1
+
+    def on_execute(conn, cursor, statement, *args):
+        calls["statements"].append(statement)
+
+    def on_begin(conn):
+        calls["begin"] += 1
+
+    def on_commit(conn):
+        calls["commit"] += 1
+
+    engine = db.engine.sync_engine
+    listeners = [(engine.pool, "checkout", on_checkout), (engine, "before_cursor_execute", on_execute),
+                 (engine, "begin", on_begin), (engine, "commit", on_commit)]
+    for target, name, listener in listeners:
+        event.listen(target, name, listener)
+    yield calls
+    for target, name, listener in listeners:
+        event.remove(target, name, listener)
+
+
+def round_trips(calls: dict) -> int:
+    return len(calls["statements"]) + calls["begin"] + calls["commit"]
+
+
+async def handle_update():
+    """Запросы типичного апдейта покупки: пользователь, счёт, платёж, список платежей."""
+    await UsersService().upsert(CreateUserSchema(username="user", tg_id=1, chat_id=1))
+    payment = await PaymentService().get_or_create_started("1", "pack")
+    await PaymentService().get(payment.id)
+    await PaymentService().get_list(filter_={"user_id": "1"}, count_mode=CountMode.none)
+
+
+async def test_one_transaction_per_update(db_calls, redis):
+    async with unit_of_work():
+        await handle_update()
+
+    assert db_calls["checkouts"] == 1
+    assert (db_calls["begin"], db_calls["commit"]) == (1, 1)
+    assert len(db_calls["statements"]) == STATEMENTS
+    assert not [s for s in db_calls["statements"] if "SAVEPOINT" in s]
+    assert round_trips(db_calls) == STATEMENTS + 2
+
+
+async def test_transaction_per_call_without_unit_of_work(db_calls, redis):
+    await handle_update()
+
+    assert db_calls["checkouts"] == STATEMENTS
+    assert (db_calls["begin"], db_calls["commit"]) == (STATEMENTS, STATEMENTS)
+    assert round_trips(db_calls) == STATEMENTS * 3
+
+
+async def test_error_rolls_back_whole_update(db, redis):
+    with pytest.raises(Boom):
+        async with unit_of_work():
+            await PaymentService().create(CreatePaymentsSchema(user_id="1", status="started", pack_name="first"))
+            raise Boom
+
+    assert (await PaymentService().get_list()).total == 0
+
+
+async def test_savepoint_recovers_from_sql_error(db_calls, redis):
+    async with unit_of_work():
+        await PaymentService().create(CreatePaymentsSchema(user_id="1", status="started", pack_name="first"))
+        with pytest.raises(SqlError):
+            async with savepoint():
+                await PaymentService().create(CreatePaymentsSchema(user_id="1", status="started",
+                                                                   pack_name="x" * 200))
+        await PaymentService().create(CreatePaymentsSchema(user_id="1", status="started", pack_name="second"))
+
+    assert (db_calls["begin"], db_calls["commit"]) == (1, 1)
+    names = [payment.pack_name for payment in (await PaymentService().get_list(sort=["id"])).data]
+    assert names == ["first", "second"]
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import random
+from collections import defaultdict
+
+import httpx
+import pytest
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+from src import bot_main
+from src.bot.update_queue import QueuePolicy, UpdateQueue
+from src.settings import settings
+from src.utils.loadtest import UpdateFactory
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeDispatcher:
+    """Обрабатывает апдейт со случайной задержкой и запоминает порядок обработки по пользователям."""
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.storage = MemoryStorage()
+        self.handled: dict[int, list[int]] = defaultdict(list)
+
+    async def feed_update(self, bot, update: Update):
+        await asyncio.sleep(random.uniform(0, self.delay))
+        self.handled[update.event.from_user.id].append(update.update_id)
+
+
+def updates(user_id: int) -> list[Update]:
+    return [Update.model_validate(update) for _, update in UpdateFactory(user_id).funnel("House", "house_1", 100)]
+
+
+async def test_updates_of_one_user_are_handled_in_order():
+    queue = UpdateQueue(workers=3, size=100, policy=QueuePolicy.reject, put_timeout=0)
+    dp = FakeDispatcher()
+    queue.start(None, dp)
+    sent = {user_id: updates(user_id) for user_id in range(1, 8)}
+
+    # апдейты пользователей перемешаны между собой, но у каждого идут по порядку
+    for step in range(len(sent[1])):
+        for user_updates in sent.values():
+            assert await queue.put(user_updates[step])
+    await queue.stop()
+
+    assert dp.handled == {user_id: [u.update_id for u in user_updates] for user_id, user_updates in sent.items()}
+    assert (queue.accepted, queue.processed, queue.failed) == (42, 42, 0)
+
+
+async def test_stop_drains_queue():
+    queue = UpdateQueue(workers=2, size=100, policy=QueuePolicy.reject, put_timeout=0)
+    dp = FakeDispatcher(delay=0.05)
+    queue.start(None, dp)
+    for user_id in (1, 2):
+        for update in updates(user_id):
+            await queue.put(update)
+
+    await queue.stop(timeout=5)
+
+    assert queue.depth == 0
+    assert sum(len(handled) for handled in dp.handled.values()) == queue.processed == 12
+
+
+async def test_stop_gives_up_after_timeout():
+    queue = UpdateQueue(workers=1, size=100, policy=QueuePolicy.reject, put_timeout=0)
+    dp = FakeDispatcher(delay=1)
+    queue.start(None, dp)
+    for update in updates(1):
+        await queue.put(update)
+
+    await queue.stop(timeout=0.1)
+
+    assert queue.processed < 6
+    assert queue._tasks == []
+
+
+@pytest.mark.parametrize("policy", [QueuePolicy.reject, QueuePolicy.wait])
+async def test_webhook_answers_503_when_shard_is_full(monkeypatch, policy):
+    # воркеры не запущены: в каждом из двух шардов помещается один апдейт
+    queue = UpdateQueue(workers=2, size=2, policy=policy, put_timeout=0.05)
+    monkeypatch.setattr(bot_main, "update_queue", queue)
+    monkeypatch.setattr(settings, "webhook_async_mode", True)
+    from src.app import app
+
+    headers = {"Content-Type": "application/json"}
+    if settings.bot_webhook_secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = settings.bot_webhook_secret
+    funnel = UpdateFactory(1).funnel("House", "house_1", 100)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        answers = [
+            (await client.post(settings.bot_webhook_path, content=json.dumps(update), headers=headers)).status_code
+            for _, update in funnel[:2]
+        ]
+
+    # второй апдейт того же пользователя не уходит в свободный шард, иначе нарушился бы порядок
+    assert answers == [200, 503]
+    assert (queue.accepted, queue.rejected, queue.depth) == (1, 1, 1)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+
+import pytest
+from sqlalchemy import event
+
+from src.schemas.users import CreateUserSchema
+from src.services.users import UsersService, known_users
+
+pytestmark = pytest.mark.anyio
+
+CALLS = 20
+LOAD_USERS = 10_000
+LOAD_CONCURRENCY = 50
+
+
+@pytest.fixture
+def statements(db):
+    executed = []
+
+    def on_execute(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(db.engine.sync_engine, "before_cursor_execute", on_execute)
+    yield executed
+    event.remove(db.engine.sync_engine, "before_cursor_execute", on_execute)
+
+
+@pytest.fixture(autouse=True)
+def clear_known_users():
+    known_users._local.clear()
+
+
+def schema(i: int = 0) -> CreateUserSchema:
+    return CreateUserSchema(username=f"user{i}", name=f"name{i}", tg_id=1, chat_id=1)
+
+
+async def test_concurrent_upserts_leave_one_row(statements, redis):
+    users = await asyncio.gather(*(UsersService().upsert(schema(i)) for i in range(CALLS)))
+
+    assert len({user.id for user in users}) == 1
+    assert len(statements) == CALLS
+    assert all(statement.startswith("INSERT INTO users") for statement in statements)
+    page = await UsersService().get_list()
+    assert page.total == 1
+    assert page.data[0].username in {f"user{i}" for i in range(CALLS)}
+
+
+async def test_concurrent_start_of_new_user(statements, redis):
+    await asyncio.gather(*(UsersService().check_and_create(schema()) for _ in range(CALLS)))
+
+    assert len(statements) == CALLS
+    assert (await UsersService().get_list()).total == 1
+
+    statements.clear()
+    await UsersService().check_and_create(schema())
+    assert statements == []
+
+
+async def test_changed_profile_is_saved_for_cached_user(statements, redis):
+    await UsersService().check_and_create(schema(1))
+    await UsersService().check_and_create(schema(1))
+    assert len(statements) == 1
+
+    # пользователь сменил username в телеграме, а потом убрал его совсем
+    await UsersService().check_and_create(schema(2))
+    await UsersService().check_and_create(CreateUserSchema(username="", name="name2", tg_id=1, chat_id=1))
+    assert len(statements) == 3
+
+    # другой процесс видит профиль в redis и тоже не пишет его повторно
+    known_users._local.clear()
+    await UsersService().check_and_create(CreateUserSchema(username="", name="name2", tg_id=1, chat_id=1))
+    assert len(statements) == 3
+    assert (await UsersService().get_list()).data[0].username == ""
+
+
+async def start_load(users: range) -> float:
+    """Параллельные /start разных пользователей, возвращает число /start в секунду."""
+    semaphore = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+    async def start(tg_id: int):
+        async with semaphore:
+            await UsersService().check_and_create(CreateUserSchema(username=f"user{tg_id}", tg_id=tg_id,
+                                                                   chat_id=tg_id))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(start(tg_id) for tg_id in users))
+    return len(users) / (time.perf_counter() - started)
+
+
+async def test_start_load_of_known_users(monkeypatch, redis):
+    """10k пользователей, которых уже сохранил другой процесс: /start не ходит в БД, повторный - и в redis."""
+    users = range(1, LOAD_USERS + 1)
+    async with redis.pipeline(transaction=False) as pipe:
+        for tg_id in users:
+            pipe.set(f"user_{tg_id}", json.dumps({"username": f"user{tg_id}", "name": None, "surname": None}))
+        await pipe.execute()
+
+    async def upsert(self, schema):
+        raise AssertionError(f"User {schema.tg_id} is known, /start must not query the database")
+
+    monkeypatch.setattr(UsersService, "upsert", upsert)
+    get = redis.get
+    redis_calls = 0
+
+    async def counted_get(key):
+        nonlocal redis_calls
+        redis_calls += 1
+        return await get(key)
+
+    monkeypatch.setattr(redis, "get", counted_get)
+
+    redis_rate = await start_load(users)
+    assert redis_calls == LOAD_USERS
+    local_rate = await start_load(users)
+    assert redis_calls == LOAD_USERS
+
+    print(f"\n/start of {LOAD_USERS} known users: {redis_rate:.0f}/s from redis, {local_rate:.0f}/s from local cache")
+    assert local_rate > redis_rate
@@ -0,0 +1,57 @@
+import json
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.types import Update
+
+from src.utils.loadtest import UpdateFactory
+
+ROUNDS = 500
+
+
+@pytest.fixture
+def bot():
+    return Bot("123456:test-token")
+
+
+def samples() -> list[bytes]:
+    """Апдейты воронки покупки: message, callback_query, pre_checkout_query, successful_payment."""
+    funnel = dict(UpdateFactory(1).funnel("House", "house_1", 100 * 100))
+    return [json.dumps(funnel[step]).encode() for step in ("start", "pack", "pre_checkout", "payment")]
+
+
+def dict_parse(body: bytes, bot: Bot) -> Update:
+    """Прежний путь: FastAPI разбирает тело в dict, из него Update без бота, feed_update пересобирает его с ботом."""
+    update = Update(**json.loads(body))
+    return Update.model_validate(update.model_dump(), context={"bot": bot})
+
+
+def bytes_parse(body: bytes, bot: Bot) -> Update:
+    return Update.model_validate_json(body, context={"bot": bot})
+
+
+def rate(parse, bodies: list[bytes], bot: Bot) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for body in bodies:
+            parse(body, bot)
+    return ROUNDS * len(bodies) / (time.perf_counter() - started)
+
+
+def test_bytes_parse_matches_dict_parse(bot):
+    for body in samples():
+        update = bytes_parse(body, bot)
+        assert update == dict_parse(body, bot)
+        assert update.bot is bot
+        assert update.event.bot is bot
+
+
+def test_webhook_parse_throughput(bot):
+    bodies = samples()
+
+    dict_rate = rate(dict_parse, bodies, bot)
+    bytes_rate = rate(bytes_parse, bodies, bot)
+
+    print(f"\nupdates/s on one core: dict {dict_rate:.0f}, bytes {bytes_rate:.0f}")
+    assert bytes_rate > dict_rate * 1.5
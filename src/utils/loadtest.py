@@ -0,0 +1,299 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import httpx
+from aiohttp import web
+from prometheus_client import REGISTRY
+from sqlalchemy.engine import make_url
+
+from src.redis_client import get_redis
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_STEPS = ("start", "category", "pack", "buy", "pre_checkout", "payment")
+# счётчики из /metrics, которые показываются в отчёте
+CALL_METRICS = {
+    "db": "db_method_duration_seconds_count",
+    "redis": "redis_command_duration_seconds_count",
+    "bot_api": "telegram_api_duration_seconds_count",
+}
+UPDATE_ERRORS_METRIC = "bot_update_errors_total"
+# прогон пишет пользователей, платежи и FSM, поэтому запускается только на явно отдельных БД и redis
+LOADTEST_DB_MARKER = "loadtest"
+LOADTEST_REDIS_MARKER_KEY = "loadtest:isolated"
+
+
+class LoadTestIsolationError(Exception):
+    pass
+
+
+async def check_isolation():
+    """Имя базы должно содержать "loadtest", а в redis должен быть ключ loadtest:isolated, который ставят руками."""
+    database = make_url(settings.db_url).database or ""
+    if LOADTEST_DB_MARKER not in database:
+        raise LoadTestIsolationError(f"Database name {database!r} does not contain {LOADTEST_DB_MARKER!r}, "
+                                     f"use a separate database for the load test")
+    if not await get_redis().exists(LOADTEST_REDIS_MARKER_KEY):
+        raise LoadTestIsolationError(f"Redis has no {LOADTEST_REDIS_MARKER_KEY!r} key, use a separate redis (or db "
+                                     f"index) and mark it with 'SET {LOADTEST_REDIS_MARKER_KEY} 1'")
+
+
+class StubBotApi:
+    """
+    Заглушка Bot API: принимает любые методы и отвечает правдоподобным результатом.
+
+    Сообщения возвращаются с растущим message_id, для sendDocument - с документом, остальные методы отвечают True.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: dict[str, int] = defaultdict(int)
+        self.invoice_payloads: dict[int, str] = {}  # последний payload счёта по chat_id
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = dict(await request.post()) if request.can_read_body else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, data)})
+
+    def _result(self, method: str, data: dict):
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot"}
+        if method == "getwebhookinfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method.startswith("send") or method.startswith("edit"):
+            chat_id = int(data.get("chat_id", 0) or 0)
+            message = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+            if method == "senddocument":
+                message["document"] = {"file_id": f"loadtest-{message['message_id']}", "file_unique_id": "loadtest"}
+            if method == "sendinvoice":
+                self.invoice_payloads[chat_id] = data.get("payload", "")
+                message["invoice"] = {"title": "", "description": "", "start_parameter": "", "currency": "RUB",
+                                      "total_amount": 0}
+            return message
+        return True
+
+
+@dataclass
+class StepStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class UpdateFactory:
+    """Синтетические апдейты воронки покупки для одного пользователя."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self._ids = itertools.count(user_id * 100)
+        self.user = {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"load_{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+
+    def _message(self, **fields) -> dict:
+        return {"message_id": next(self._ids), "date": int(time.time()), "chat": self.chat, "from": self.user,
+                **fields}
+
+    def _callback(self, data: str) -> dict:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self.user,
+                "chat_instance": str(self.user_id),
+                "data": data,
+                "message": {"message_id": update_id, "date": int(time.time()), "chat": self.chat,
+                            "from": {"id": 1, "is_bot": True, "first_name": "loadtest"}, "text": "-"},
+            },
+        }
+
+    def funnel(self, category: str, pack_name: str, amount: int) -> list[tuple[str, dict]]:
+        charge_id = f"loadtest-{self.user_id}-{time.time_ns()}"
+        return [
+            ("start", {"update_id": next(self._ids), "message": self._message(
+                text="/start", entities=[{"type": "bot_command", "offset": 0, "length": 6}])}),
+            ("category", self._callback(f"pack_category_{category}")),
+            ("pack", self._callback(f"pack_name_{pack_name}")),
+            ("buy", self._callback(f"buy_pack_{pack_name}")),
+            ("pre_checkout", {"update_id": next(self._ids), "pre_checkout_query": {
+                "id": charge_id, "from": self.user, "currency": "RUB", "total_amount": amount,
+                "invoice_payload": "pack-invoice-payload"}}),
+            ("payment", {"update_id": next(self._ids), "message": self._message(successful_payment={
+                "currency": "RUB", "total_amount": amount, "invoice_payload": "pack-invoice-payload",
+                "telegram_payment_charge_id": charge_id, "provider_payment_charge_id": charge_id})}),
+        ]
+
+
+def _metric_counts() -> dict[str, float]:
+    names = {metric: key for key, metric in CALL_METRICS.items()}
+    names[UPDATE_ERRORS_METRIC] = "update_errors"
+    counts = dict.fromkeys(names.values(), 0.0)
+    for family in REGISTRY.collect():
+        for sample in family.samples:
+            key = names.get(sample.name)
+            if key is not None:
+                counts[key] += sample.value
+    return counts
+
+
+class LoadTest:
+    """
+    Прогон апдейтов через FastAPI приложение в том же процессе (httpx ASGITransport) с заглушкой Bot API.
+
+    БД и redis берутся из настроек (DB_URL, REDIS_URL) и должны быть отдельными (check_isolation),
+    фоновые задачи бота (доставка, рассылка и т.д.) не запускаются.
+    В асинхронном режиме вебхука задержка шага - это только постановка в очередь, итоговое время включает
+    разбор очереди.
+    """
+
+    def __init__(self, users: int, concurrency: int, bot_api_latency: float = 0.0, user_id_offset: int = 10 ** 9):
+        self.users = users
+        self.concurrency = concurrency
+        self.user_id_offset = user_id_offset
+        self.stub = StubBotApi(latency=bot_api_latency)
+        self.steps: dict[str, StepStats] = defaultdict(StepStats)
+        self.updates = 0
+
+    async def run(self, recorded: list[dict] | None = None) -> dict:
+        await check_isolation()
+        # бот создаётся лениво, поэтому адрес заглушки достаточно подставить до старта
+        settings.bot_api_url = await self.stub.start()
+        # заглушка не отвечает 429, ограничители Bot API только исказили бы пропускную способность бота
+        settings.bot_api_rate = settings.bot_api_chat_rate = 0
+
+        from src.app import app
+        from src.bot_main import bot_shutdown, bot_startup, update_queue
+        from src.bot.catalog import get_catalog
+
+        await bot_startup(configure=False, workers=False)
+        before = _metric_counts()
+        transport = httpx.ASGITransport(app=app)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                if recorded is not None:
+                    await asyncio.gather(*(self._replay(client, semaphore, update) for update in recorded))
+                else:
+                    packs = list(get_catalog().packs.values())
+                    if not packs:
+                        raise RuntimeError("Catalog is empty")
+                    await asyncio.gather(*(
+                        self._funnel(client, semaphore, self.user_id_offset + i, random.choice(packs))
+                        for i in range(self.users)
+                    ))
+            if settings.webhook_async_mode:
+                while update_queue.depth or update_queue.processed + update_queue.failed < update_queue.accepted:
+                    await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            after = _metric_counts()
+        finally:
+            await bot_shutdown()
+            await self.stub.stop()
+        return self._report(elapsed, before, after)
+
+    async def _post(self, client: httpx.AsyncClient, step: str, update: dict):
+        headers = {"Content-Type": "application/json"}
+        if settings.bot_webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = settings.bot_webhook_secret
+        start = time.perf_counter()
+        response = await client.post(settings.bot_webhook_path, content=json.dumps(update), headers=headers)
+        stats = self.steps[step]
+        stats.latencies.append(time.perf_counter() - start)
+        self.updates += 1
+        body = response.json() if response.status_code == 200 else {}
+        if response.status_code != 200 or body.get("status") == "error":
+            stats.errors += 1
+
+    async def _funnel(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, user_id: int, view):
+        async with semaphore:
+            amount = view.price.amount
+            for step, update in UpdateFactory(user_id).funnel(view.category, view.pack.name, amount):
+                # payload берётся из счёта, который бот отправил в заглушку на шаге buy
+                payload = self.stub.invoice_payloads.get(user_id)
+                if step == "pre_checkout" and payload:
+                    update["pre_checkout_query"]["invoice_payload"] = payload
+                elif step == "payment" and payload:
+                    update["message"]["successful_payment"]["invoice_payload"] = payload
+                await self._post(client, step, update)
+
+    async def _replay(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, update: dict):
+        event_type = next((key for key in update if key != "update_id"), "unknown")
+        async with semaphore:
+            await self._post(client, event_type, update)
+
+    def _report(self, elapsed: float, before: dict[str, float], after: dict[str, float]) -> dict:
+        calls = {key: int(after[key] - before[key]) for key in CALL_METRICS}
+        steps = {}
+        order = [s for s in FUNNEL_STEPS if s in self.steps] + [s for s in self.steps if s not in FUNNEL_STEPS]
+        for step in order:
+            stats = self.steps[step]
+            steps[step] = {
+                "count": len(stats.latencies),
+                "errors": stats.errors,
+                "p50_ms": round(stats.percentile(50) * 1000, 2),
+                "p95_ms": round(stats.percentile(95) * 1000, 2),
+                "p99_ms": round(stats.percentile(99) * 1000, 2),
+            }
+        return {
+            "updates": self.updates,
+            "seconds": round(elapsed, 3),
+            "updates_per_second": round(self.updates / elapsed, 1) if elapsed else 0.0,
+            # исключения в хендлерах: вебхук на них всё равно отвечает 200
+            "update_errors": int(after["update_errors"] - before["update_errors"]),
+            "calls": calls,
+            "calls_per_update": {k: round(v / self.updates, 2) if self.updates else 0.0 for k, v in calls.items()},
+            "bot_api_methods": dict(self.stub.calls),
+            "steps": steps,
+        }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"updates: {report['updates']} in {report['seconds']}s, {report['updates_per_second']} updates/s, "
+        f"handler errors: {report['update_errors']}",
+        "calls: " + ", ".join(f"{k}={v} ({report['calls_per_update'][k]}/update)" for k, v in report["calls"].items()),
+        f"{'step':<14}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for step, stats in report["steps"].items():
+        lines.append(f"{step:<14}{stats['count']:>7}{stats['errors']:>8}"
+                     f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    return "\n".join(lines)
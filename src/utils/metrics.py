@@ -0,0 +1,229 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from src.utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# бакеты под быстрые операции: от 1 мс до 10 с
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+UPDATE_DURATION = Histogram(
+    "bot_update_duration_seconds", "Полное время обработки апдейта", ["event_type"], buckets=LATENCY_BUCKETS,
+)
+UPDATE_ERRORS = Counter("bot_update_errors_total", "Апдейты, завершившиеся исключением", ["event_type"])
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Время работы хендлера", ["router", "handler"], buckets=LATENCY_BUCKETS,
+)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ["router", "handler", "error"])
+DB_DURATION = Histogram(
+    "db_method_duration_seconds", "Время метода сервиса БД", ["service", "method"], buckets=LATENCY_BUCKETS,
+)
+DB_ERRORS = Counter("db_method_errors_total", "Исключения в методах сервисов БД", ["service", "method", "error"])
+REDIS_DURATION = Histogram(
+    "redis_command_duration_seconds", "Время команды redis", ["command"], buckets=LATENCY_BUCKETS,
+)
+REDIS_ERRORS = Counter("redis_command_errors_total", "Ошибки команд redis", ["command", "error"])
+TELEGRAM_DURATION = Histogram(
+    "telegram_api_duration_seconds", "Время запроса к Bot API", ["method"], buckets=LATENCY_BUCKETS,
+)
+TELEGRAM_ERRORS = Counter("telegram_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+TELEGRAM_THROTTLED = Counter(
+    "telegram_api_throttled_total", "Запросы к Bot API, ждавшие ограничителя частоты", ["method", "scope"],
+)
+TELEGRAM_RETRIES = Counter("telegram_api_retries_total", "Повторы запросов к Bot API после 429", ["method"])
+WEBHOOK_QUEUE_TIME = Histogram(
+    "webhook_queue_time_seconds", "Время ожидания апдейта в очереди вебхука", buckets=LATENCY_BUCKETS,
+)
+THROTTLED_EVENTS = Counter(
+    "bot_throttled_events_total", "Сообщения и нажатия после ограничения частоты", ["kind", "result"],
+)
+
+DB_POOL_WAIT = Histogram("db_pool_wait_seconds", "Ожидание соединения из пула БД", buckets=LATENCY_BUCKETS)
+DB_POOL_SLOW_CHECKOUTS = Counter("db_pool_slow_checkouts_total", "Выдачи соединения дольше DB_POOL_SLOW_CHECKOUT")
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Таймауты ожидания соединения из пула БД")
+UPDATE_QUEUE_EVENTS = Counter("webhook_update_queue_events_total", "Апдейты очереди вебхука по результату", ["result"])
+
+# состояние процесса, обновляется GaugesUpdater в каждом воркере
+DB_POOL = Gauge("db_pool", "Состояние пула соединений БД", ["stat"], multiprocess_mode="livesum")
+UPDATE_QUEUE = Gauge("webhook_update_queue", "Состояние очереди апдейтов", ["stat"], multiprocess_mode="livesum")
+
+
+def observe_db(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Декоратор методов сервиса: время и ошибки с метками service (класс экземпляра) и method, плюс спан."""
+
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        service = type(self).__name__
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"{service}.{func.__name__}"):
+                return await func(self, *args, **kwargs)
+        except Exception as e:
+            DB_ERRORS.labels(service, func.__name__, type(e).__name__).inc()
+            raise
+        finally:
+            DB_DURATION.labels(service, func.__name__).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer middleware диспетчера: полное время апдейта, включая FSM и сессию БД."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.labels(event_type).inc()
+            raise
+        finally:
+            UPDATE_DURATION.labels(event_type).observe(time.perf_counter() - start)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: вызывается только для найденного хендлера, метки - имя роутера и функции."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        router = data.get("event_router")
+        handler_object = data.get("handler")
+        router_name = router.name if router is not None else "unknown"
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.labels(router_name, handler_name, type(e).__name__).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(router_name, handler_name).observe(time.perf_counter() - start)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого запроса к Bot API по методу."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        method_name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(method_name, type(e).__name__).inc()
+            raise
+        finally:
+            TELEGRAM_DURATION.labels(method_name).observe(time.perf_counter() - start)
+
+
+def setup_dispatcher_metrics(dp) -> None:
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_middleware = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        # в update и error нет пользовательских хендлеров
+        if name not in ("update", "error"):
+            observer.middleware(handler_middleware)
+
+
+def set_gauges(gauge: Gauge, stats: dict[str, Any]) -> None:
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)):
+            gauge.labels(stat).set(value)
+
+
+class GaugesUpdater:
+    """
+    Периодически переписывает gauge'и состояния процесса (пул БД, очередь апдейтов).
+
+    Работает в каждом воркере: в multiprocess режиме scrape /metrics попадает в один процесс,
+    а livesum складывает значения всех живых процессов, поэтому обновлять их при scrape нельзя.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sources: list[tuple[Gauge, Callable[[], dict[str, Any]]]] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self, sources: list[tuple[Gauge, Callable[[], dict[str, Any]]]]):
+        self._sources = sources
+        self.update()
+        self._task = asyncio.create_task(self._run(), name="gauges-updater")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def update(self):
+        for gauge, stats in self._sources:
+            set_gauges(gauge, stats())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Can not update gauges")
+
+
+def mark_worker_dead() -> None:
+    """Убирает livesum gauge'и завершающегося воркера из multiprocess каталога."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        mark_process_dead(os.getpid())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Текст для /metrics.
+
+    При нескольких воркерах uvicorn нужно задать PROMETHEUS_MULTIPROC_DIR (общий каталог, который
+    очищается перед запуском воркеров), тогда метрики собираются из файлов всех процессов.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket внутри процесса: в среднем rate операций в секунду, не больше capacity подряд.
+
+    acquire() ждёт свободный токен, ожидающие обслуживаются по очереди. pause() останавливает выдачу
+    токенов на заданное время, например после 429 с retry_after.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> float:
+        """Берёт токен. Возвращает, сколько секунд пришлось ждать, 0 - если токен был свободен."""
+        start = time.monotonic()
+        waited = self._lock.locked()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    waited = True
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic() - start if waited else 0.0
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                waited = True
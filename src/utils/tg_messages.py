@@ -1,27 +1,136 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
 
-import requests
 from src.settings import settings
-import logging
 
-logger = logging.Logger(__name__)
+logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_LENGTH = 4096
+MESSAGES_SEPARATOR = "\n\n"
 
-async def send_tg_message(message: str, chat_id: int | None = None):
 
-    bot_token = settings.bot_token
+class Notifier:
+    """
+    Фоновая отправка уведомлений в телеграм через сессию уже запущенного бота.
+
+    Сообщения складываются в ограниченную очередь, фоновая задача забирает их пачкой,
+    склеивает сообщения для одного чата в одно и отправляет с повторами при 429/5xx.
+    При остановке очередь дочитывается до конца (с таймаутом).
+    """
+
+    def __init__(self, queue_size: int, batch_delay: float, max_retries: int):
+        self.batch_delay = batch_delay
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(maxsize=queue_size)
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot):
+        if self.is_running:
+            return
+        self._bot = bot
+        self._task = asyncio.create_task(self._run(), name="tg-notifier")
+
+    async def stop(self, timeout: float = 10):
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Notifier queue was not drained, {self._queue.qsize()} messages lost")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def put(self, message: str, chat_id: int) -> bool:
+        try:
+            self._queue.put_nowait((chat_id, message))
+        except asyncio.QueueFull:
+            logger.error(f"Notifier queue is full, message to {chat_id} dropped: {message}")
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.sleep(self.batch_delay)
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                grouped: dict[int, list[str]] = defaultdict(list)
+                for chat_id, message in batch:
+                    grouped[chat_id].append(message)
+                for chat_id, messages in grouped.items():
+                    for text in self._join(messages):
+                        await self._send(chat_id, text)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Can not send notification batch")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _join(messages: list[str]) -> list[str]:
+        texts = []
+        current = ""
+        for message in messages:
+            for start in range(0, len(message), MAX_MESSAGE_LENGTH):
+                part = message[start: start + MAX_MESSAGE_LENGTH]
+                if current and len(current) + len(MESSAGES_SEPARATOR) + len(part) > MAX_MESSAGE_LENGTH:
+                    texts.append(current)
+                    current = ""
+                current = f"{current}{MESSAGES_SEPARATOR}{part}" if current else part
+        if current:
+            texts.append(current)
+        return texts
+
+    async def _send(self, chat_id: int, text: str):
+        parse_mode = "Markdown"
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return
+            except TelegramRetryAfter as e:
+                delay = e.retry_after
+            except (TelegramServerError, TelegramNetworkError):
+                delay = 2 ** attempt
+            except TelegramBadRequest as e:
+                if parse_mode is None:
+                    raise
+                # в тексте могут быть символы, которые ломают Markdown (например "_" в username)
+                logger.warning(f"Can not send notification with markdown, send as plain text: {e}")
+                parse_mode = None
+                continue
+            logger.warning(f"Notification to {chat_id} failed, retry in {delay}s ({attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+        logger.error(f"Can not send notification message to {chat_id}: {text}")
+
+
+notifier = Notifier(
+    queue_size=settings.notifier_queue_size,
+    batch_delay=settings.notifier_batch_delay,
+    max_retries=settings.notifier_max_retries,
+)
+
+
+async def send_tg_message(message: str, chat_id: int | None = None):
     if chat_id is None:
         chat_id = settings.notification_admin_chat_id
-    error = False
-
-    try:
-        url = f"https://api.telegram.org/bot{str(bot_token)}/sendMessage"
-        params = {
-            "chat_id": str(chat_id),
-            "parse_mode": "Markdown",
-            "text": message
-            }
-        requests.get(url, params=params)
-    except Exception as e:
-        error = True
-        logger.error(f"Can not send notification message: {e}")
-    return "ERROR" if error else "OK"
+    if not notifier.is_running:
+        logger.error(f"Notifier is not running, can not send notification message: {message}")
+        return "ERROR"
+    return "OK" if notifier.put(message, chat_id) else "ERROR"
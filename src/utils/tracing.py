@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from typing import Any
+
+import aiohttp
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "topdj_bot"
+# коды статуса спана как в OpenTelemetry
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """Спан в терминах OpenTelemetry: trace_id 16 байт, span_id 8 байт, время в наносекундах."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "status",
+                 "status_message", "_token")
+
+    def __init__(self, trace_id: str, name: str, parent_id: str | None = None, attributes: dict | None = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            self.record_exception(exc)
+        _current_span.reset(self._token)
+        tracer.end(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class NoopSpan:
+    """Пустой спан: тратит только проверку флага, ничего не пишет."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_payload(spans: list[Span]) -> dict:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.to_otlp() for s in spans]}],
+        }]
+    }
+
+
+class Tracer:
+    """
+    Трейсинг горячего пути: вебхук -> диспетчер -> хендлер -> SQL и запросы к Bot API.
+
+    Трейс апдейта строится от update_id, поэтому спаны вебхука и воркера очереди попадают в один трейс.
+    Решение о сэмплировании детерминировано по trace_id. В режиме "none" все вызовы возвращают NOOP_SPAN.
+    Готовые спаны копятся в буфере и выгружаются фоновой задачей в stdout или коллектор в формате OTLP/JSON.
+    """
+
+    def __init__(self, exporter: str, sample_rate: float, collector_url: str, export_interval: float,
+                 buffer_size: int):
+        self.exporter = exporter
+        self.enabled = exporter != "none" and sample_rate > 0
+        self.collector_url = collector_url
+        self.export_interval = export_interval
+        self.buffer_size = buffer_size
+        self._threshold = int(min(sample_rate, 1.0) * (1 << 64))
+        self._buffer: list[Span] = []
+        self._task: asyncio.Task | None = None
+        self._session: aiohttp.ClientSession | None = None
+        self.dropped = 0
+
+    def start_trace(self, name: str, update_id: int | None = None, **attributes) -> Span | NoopSpan:
+        """Корневой спан апдейта. Если трейс уже идёт (вебхук в синхронном режиме), создаётся дочерний."""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(parent.trace_id, name, parent.span_id, attributes)
+        if update_id is not None:
+            trace_id = hashlib.sha256(f"update:{update_id}".encode()).hexdigest()[:32]
+            attributes["telegram.update_id"] = update_id
+        else:
+            trace_id = os.urandom(16).hex()
+        if int(trace_id[16:], 16) >= self._threshold:
+            return NOOP_SPAN
+        return Span(trace_id, name, None, attributes)
+
+    def span(self, name: str, **attributes) -> Span | NoopSpan:
+        """Дочерний спан текущего трейса, вне трейса - NOOP_SPAN."""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(parent.trace_id, name, parent.span_id, attributes)
+
+    def end(self, span: Span):
+        span.end_ns = time.time_ns()
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="tracing-exporter")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.export_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Can not export spans")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        spans, self._buffer = self._buffer, []
+        payload = otlp_payload(spans)
+        if self.exporter == "stdout":
+            sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        elif self.exporter == "collector":
+            if self._session is None:
+                self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+            async with self._session.post(self.collector_url, json=payload) as response:
+                if response.status >= 300:
+                    logger.warning(f"Collector answered {response.status}, {len(spans)} spans lost")
+        if self.dropped:
+            logger.warning(f"Span buffer was full, {self.dropped} spans dropped")
+            self.dropped = 0
+
+
+tracer = Tracer(
+    exporter=settings.tracing_exporter,
+    sample_rate=settings.tracing_sample_rate,
+    collector_url=settings.tracing_collector_url,
+    export_interval=settings.tracing_export_interval,
+    buffer_size=settings.tracing_buffer_size,
+)
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """Outer middleware диспетчера: спан на весь апдейт (корень трейса, если апдейт пришёл из очереди)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        update_id = event.update_id if isinstance(event, Update) else None
+        with tracer.start_trace("dispatcher.update", update_id) as span:
+            if isinstance(event, Update):
+                span.set_attribute("telegram.event_type", event.event_type)
+            return await handler(event, data)
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Inner middleware: спан хендлера с именем роутера и функции."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        router = data.get("event_router")
+        callback = getattr(data.get("handler"), "callback", None)
+        name = f"{router.name if router else 'unknown'}.{getattr(callback, '__name__', 'unknown')}"
+        with tracer.span(f"handler {name}"):
+            return await handler(event, data)
+
+
+class TelegramTracingMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан на каждый запрос к Bot API."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ):
+        with tracer.span(f"telegram {method.__api_method__}", **{"rpc.method": method.__api_method__}):
+            return await make_request(bot, method)
+
+
+def setup_dispatcher_tracing(dp) -> None:
+    if not tracer.enabled:
+        return
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    handler_middleware = HandlerTracingMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(handler_middleware)
+
+
+def setup_bot_tracing(bot: Bot) -> None:
+    if tracer.enabled:
+        bot.session.middleware(TelegramTracingMiddleware())
+
+
+def setup_engine_tracing(engine: AsyncEngine) -> None:
+    """Спан на каждый SQL запрос, дочерний к спану метода сервиса."""
+    if not tracer.enabled:
+        return
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.span("db.query", **{"db.system": "postgresql", "db.statement": statement[:1000]})
+        if isinstance(span, Span):
+            context._trace_span = span
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            tracer.end(span)
+            context._trace_span = None
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.record_exception(exception_context.original_exception)
+            tracer.end(span)
+            context._trace_span = None